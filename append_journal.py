@@ -0,0 +1,264 @@
+# append_journal.py
+import os
+import json
+import logging
+import random
+import socket
+import sqlite3
+import threading
+import time
+
+import httplib2
+import pandas as pd
+import streamlit as st
+from googleapiclient.errors import HttpError
+
+from config import LOCAL_STATE_DIR, APPEND_JOURNAL_BATCH_ROWS, APPEND_JOURNAL_MAX_BACKOFF_SECONDS
+from google_utils import get_google_services, append_rows_to_first_sheet, find_record_rows, record_id_of_row
+
+ENTRY_PENDING = "pending"
+ENTRY_DONE = "done"
+ENTRY_FAILED = "failed"
+
+RETRYABLE_HTTP_STATUSES = (408, 429, 500, 502, 503, 504)
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded")
+TRANSIENT_NETWORK_ERRORS = (socket.timeout, TimeoutError, ConnectionError, httplib2.ServerNotFoundError)
+
+logger = logging.getLogger(__name__)
+
+
+def _cell_for_journal(cell):
+    # Editor values may be numpy scalars or NaN; store plain JSON values (missing -> blank cell)
+    if cell is None or (not isinstance(cell, (list, tuple, dict)) and pd.isna(cell)):
+        return None
+    return cell.item() if hasattr(cell, "item") else cell
+
+
+def is_retryable_error(error):
+    """
+    Throttling, server-side and network errors are retried. Anything else (bad request, no access, or a
+    bug in the flush itself) is not, so it fails the entry instead of blocking its spreadsheet's queue.
+    """
+    if not isinstance(error, HttpError):
+        return isinstance(error, TRANSIENT_NETWORK_ERRORS)
+    if error.resp.status in RETRYABLE_HTTP_STATUSES:
+        return True
+    return error.resp.status == 403 and any(reason in str(error) for reason in RATE_LIMIT_REASONS)
+
+
+class AppendJournal:
+    """
+    Durable write-behind queue for rows appended to period spreadsheets.
+
+    `enqueue` commits the rows to a local SQLite journal and returns at once; a background worker
+    flushes them to Sheets. Entries for the same spreadsheet are written in submission order (later
+    entries wait behind a retrying one) and consecutive entries are batched into one values.append.
+    Throttling and outages are retried with capped exponential backoff. Every entry has an
+    idempotency key, so submitting the same thing twice queues it once, and a retry first drops
+    rows whose Record ID is already in the sheet, so an attempt whose outcome was lost is not
+    written twice. Entries survive restarts; the worker picks them up again on start.
+    """
+
+    def __init__(self, db_path, sheets_service=None, batch_rows=APPEND_JOURNAL_BATCH_ROWS, max_backoff_seconds=APPEND_JOURNAL_MAX_BACKOFF_SECONDS):
+        self.db_path = db_path
+        self.sheets_service = sheets_service  # Used only by the worker thread
+        self.batch_rows = max(1, int(batch_rows))
+        self.max_backoff_seconds = max_backoff_seconds
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS appends (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    idempotency_key TEXT NOT NULL UNIQUE,
+                    spreadsheet_id TEXT NOT NULL,
+                    rows_json TEXT NOT NULL,
+                    row_count INTEGER NOT NULL,
+                    owner TEXT,
+                    label TEXT,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    flushed_at REAL
+                )""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS appends_by_status ON appends (status, spreadsheet_id, seq)")
+        self._thread = None
+
+    # --- Public API ---
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._loop, name="emcm-append-journal", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake.set()
+
+    def attach_service(self, sheets_service):
+        """Gives a journal created without credentials the service its worker writes with."""
+        self.sheets_service = sheets_service
+        self._wake.set()
+
+    def enqueue(self, spreadsheet_id, rows, idempotency_key, owner=None, label=None):
+        """
+        Durably queues `rows` for appending to `spreadsheet_id`. Returns True once the rows are in the
+        journal (also when `idempotency_key` was queued before), False if the journal could not be written
+        or has no Sheets service to flush it with.
+        """
+        if self.sheets_service is None:
+            logger.warning("Append journal has no Sheets service; not queuing %s", idempotency_key)
+            return False
+        rows_json = json.dumps([[_cell_for_journal(cell) for cell in row] for row in rows], default=str)
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO appends (idempotency_key, spreadsheet_id, rows_json, row_count, owner, label, status, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (idempotency_key, spreadsheet_id, rows_json, len(rows), owner, label, ENTRY_PENDING, time.time()))
+        except sqlite3.Error as e:
+            logger.error("Could not journal append %s: %s", idempotency_key, e)
+            return False
+        self._wake.set()
+        return True
+
+    def retry_failed(self, spreadsheet_id=None):
+        """Puts failed entries (optionally of one spreadsheet) back in the queue. Returns how many."""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE appends SET status = ?, next_attempt_at = 0 WHERE status = ?" + (" AND spreadsheet_id = ?" if spreadsheet_id else ""),
+                (ENTRY_PENDING, ENTRY_FAILED) + ((spreadsheet_id,) if spreadsheet_id else ()))
+        self._wake.set()
+        return cursor.rowcount
+
+    def pending_for_owner(self, owner):
+        """(entries, rows) of `owner` still waiting to be written."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(row_count), 0) FROM appends WHERE status = ? AND owner = ?", (ENTRY_PENDING, owner)).fetchone()
+        return row[0], row[1]
+
+    def metrics(self):
+        with self._lock:
+            by_spreadsheet = [dict(row) for row in self._conn.execute(
+                "SELECT spreadsheet_id, status, COUNT(*) AS entries, SUM(row_count) AS rows, MIN(created_at) AS oldest, "
+                "MAX(attempts) AS max_attempts FROM appends WHERE status != ? GROUP BY spreadsheet_id, status", (ENTRY_DONE,))]
+            last_error = self._conn.execute(
+                "SELECT last_error FROM appends WHERE last_error IS NOT NULL AND status != ? ORDER BY seq DESC LIMIT 1", (ENTRY_DONE,)).fetchone()
+            flushed = self._conn.execute("SELECT COUNT(*) FROM appends WHERE status = ?", (ENTRY_DONE,)).fetchone()[0]
+        pending = [entry for entry in by_spreadsheet if entry["status"] == ENTRY_PENDING]
+        return {
+            "pending_entries": sum(entry["entries"] for entry in pending),
+            "pending_rows": sum(entry["rows"] for entry in pending),
+            "failed_entries": sum(entry["entries"] for entry in by_spreadsheet if entry["status"] == ENTRY_FAILED),
+            "oldest_pending_s": max((time.time() - entry["oldest"] for entry in pending), default=0.0),
+            "flushed_entries": flushed,
+            "by_spreadsheet": by_spreadsheet,
+            "last_error": last_error[0] if last_error else None,
+            "worker_alive": self._thread is not None and self._thread.is_alive(),
+        }
+
+    def prune(self, max_age_seconds=7 * 86400):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM appends WHERE status = ? AND flushed_at < ?", (ENTRY_DONE, time.time() - max_age_seconds))
+
+    # --- Worker ---
+    def _due_batches(self, now):
+        # Head of each spreadsheet's queue, plus the entries right behind it that fit in one batch
+        with self._lock:
+            pending = self._conn.execute(
+                "SELECT seq, spreadsheet_id, rows_json, row_count, attempts, next_attempt_at FROM appends "
+                "WHERE status = ? ORDER BY seq", (ENTRY_PENDING,)).fetchall()
+        batches, blocked = {}, set()
+        for entry in pending:
+            spreadsheet_id = entry["spreadsheet_id"]
+            if spreadsheet_id in blocked:
+                continue
+            batch = batches.get(spreadsheet_id)
+            if batch is None:
+                if entry["next_attempt_at"] > now:
+                    blocked.add(spreadsheet_id)  # Ordering: nothing overtakes a waiting head entry
+                    continue
+                batches[spreadsheet_id] = [entry]
+            elif sum(e["row_count"] for e in batch) + entry["row_count"] <= self.batch_rows:
+                batch.append(entry)
+            else:
+                blocked.add(spreadsheet_id)
+        next_due = min((entry["next_attempt_at"] for entry in pending if entry["spreadsheet_id"] in blocked
+                        and entry["spreadsheet_id"] not in batches), default=None)
+        return batches, next_due
+
+    def _mark(self, entries, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn:
+            self._conn.executemany(f"UPDATE appends SET {assignments} WHERE seq = ?",
+                                   [tuple(fields.values()) + (entry["seq"],) for entry in entries])
+
+    def _flush(self, spreadsheet_id, entries):
+        rows = [row for entry in entries for row in json.loads(entry["rows_json"])]
+        try:
+            if any(entry["attempts"] for entry in entries):
+                # An earlier attempt may have reached the sheet before failing; skip rows already there
+                record_ids = [record_id_of_row(row) for row in rows if record_id_of_row(row)]
+                present = find_record_rows(self.sheets_service, spreadsheet_id, record_ids) if record_ids else {}
+                rows = [row for row in rows if record_id_of_row(row) not in present]
+            if rows:
+                append_rows_to_first_sheet(self.sheets_service, spreadsheet_id, rows)
+            self._mark(entries, status=ENTRY_DONE, flushed_at=time.time(), last_error=None)
+        except Exception as e:
+            error_text = f"{type(e).__name__}: {e}"[:500]
+            if is_retryable_error(e):
+                attempts = max(entry["attempts"] for entry in entries) + 1
+                delay = min(self.max_backoff_seconds, 2 ** attempts) * random.uniform(0.8, 1.2)
+                self._mark(entries, attempts=attempts, next_attempt_at=time.time() + delay, last_error=error_text)
+            elif len(entries) > 1:
+                # Find the entry the sheet rejects, so the others still go through
+                for entry in entries:
+                    self._flush(spreadsheet_id, [entry])
+            else:
+                self._mark(entries, status=ENTRY_FAILED, attempts=entries[0]["attempts"] + 1, last_error=error_text)
+
+    def _loop(self):
+        while not self._stop_event.is_set():
+            self._wake.clear()  # Cleared before looking, so an enqueue from here on wakes the wait below
+            if self.sheets_service is None:
+                self._wake.wait(60)  # Nothing can be flushed without credentials; entries stay queued
+                continue
+            try:
+                batches, next_due = self._due_batches(time.time())
+            except sqlite3.Error as e:
+                logger.error("Append journal read failed: %s", e)
+                batches, next_due = {}, time.time() + 5
+            for spreadsheet_id, entries in batches.items():
+                self._flush(spreadsheet_id, entries)
+            if not batches:
+                self._wake.wait(60 if next_due is None else min(60, max(0.1, next_due - time.time())))
+
+
+@st.cache_resource
+def _get_append_journal():
+    journal = AppendJournal(os.path.join(LOCAL_STATE_DIR, "append_journal.sqlite3"))
+    journal.prune()
+    journal.start()
+    return journal
+
+
+def get_append_journal():
+    """
+    Process-wide journal and its worker, shared by every session. The worker's requests use its own
+    thread's connection. If the Google services were unavailable so far, each call tries again to give
+    the journal its Sheets service; until then `enqueue` refuses rows rather than holding them unflushed.
+    """
+    journal = _get_append_journal()
+    if journal.sheets_service is None:
+        _, sheets_service = get_google_services()
+        if sheets_service is not None:
+            journal.attach_service(sheets_service)
+    return journal
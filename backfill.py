@@ -0,0 +1,304 @@
+# backfill.py
+import os
+import json
+import math
+import threading
+import time
+import datetime
+
+import pandas as pd
+import streamlit as st
+
+from config import LOCAL_STATE_DIR, BACKFILL_MAX_CONCURRENT_DARS
+from google_utils import get_file_id_from_drive_url, download_drive_file
+from extraction_pipeline import run_dar_extraction
+from job_scheduler import get_extraction_scheduler
+
+BACKFILL_JOB_PRIORITY = -10  # Below any interactive upload, whatever its deadline boost
+
+DAR_PENDING = "pending"
+DAR_DONE = "done"
+DAR_FAILED = "failed"
+
+RUN_RUNNING = "running"
+RUN_PAUSED = "paused"
+RUN_DONE = "done"
+
+# Extracted row keys -> sheet column titles (see expected_cols_header in google_utils.read_from_spreadsheet)
+HEADER_FIELD_COLUMNS = {
+    "gstin": "GSTIN", "trade_name": "Trade Name", "category": "Category",
+    "total_amount_detected_overall_rs": "Total Amount Detected (Overall Rs)",
+    "total_amount_recovered_overall_rs": "Total Amount Recovered (Overall Rs)",
+}
+PARA_FIELD_COLUMNS = {
+    "audit_para_heading": "Audit Para Heading",
+    "revenue_involved_lakhs_rs": "Revenue Involved (Lakhs Rs)",
+    "revenue_recovered_lakhs_rs": "Revenue Recovered (Lakhs Rs)",
+    "status_of_para": "Status of para",
+}
+DIFF_REPORT_COLUMNS = ["DAR PDF URL", "Audit Group Number", "Trade Name", "Audit Para Number", "Change", "Field", "Current Value", "Re-extracted Value"]
+DIFF_REPORT_TAB_TITLE = "Re-extraction Diff"
+
+
+# --- Checkpoint (one JSON file per period) ---
+def _checkpoint_path(mcm_key):
+    return os.path.join(LOCAL_STATE_DIR, "backfill", f"{mcm_key}.json")
+
+
+def load_checkpoint(mcm_key):
+    try:
+        with open(_checkpoint_path(mcm_key), "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def save_checkpoint(checkpoint):
+    path = _checkpoint_path(checkpoint["mcm_key"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    checkpoint["updated_at"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(checkpoint, fh, default=str)
+    os.replace(tmp_path, path)
+
+
+def delete_checkpoint(mcm_key):
+    try:
+        os.remove(_checkpoint_path(mcm_key))
+    except OSError:
+        pass
+
+
+def new_checkpoint(mcm_key, dar_urls):
+    return {
+        "mcm_key": mcm_key, "status": RUN_PAUSED,
+        "started_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "dars": {url: {"status": DAR_PENDING, "error": None, "diffs": []} for url in dar_urls},
+    }
+
+
+# --- Diffing ---
+def _blank(value):
+    return value is None or (isinstance(value, float) and math.isnan(value)) or (isinstance(value, str) and not value.strip())
+
+
+def _same_value(current, extracted):
+    if _blank(current) and _blank(extracted):
+        return True
+    if _blank(current) or _blank(extracted):
+        return False
+    try:
+        return math.isclose(float(current), float(extracted), rel_tol=1e-9, abs_tol=0.005)
+    except (TypeError, ValueError):
+        return str(current).strip() == str(extracted).strip()
+
+
+def _para_key(value, position):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return f"#{position + 1}"  # Unnumbered paras are matched by position
+
+
+def _para_sort_key(para):
+    # Numbered paras in numeric order (2 before 10), then the unnumbered ones by position
+    if isinstance(para, int):
+        return (0, para)
+    return (1, int(para[1:]))
+
+
+def diff_dar_rows(dar_url, sheet_records, extracted_rows):
+    """
+    Compares the sheet rows of one DAR with a fresh extraction of the same PDF.
+
+    Header fields are compared once per DAR, para fields per para (matched on Audit Para Number).
+    Returns a list of dicts with DIFF_REPORT_COLUMNS keys.
+    """
+    first_sheet = sheet_records[0] if sheet_records else {}
+    first_extracted = extracted_rows[0] if extracted_rows else {}
+    base = {"DAR PDF URL": dar_url, "Audit Group Number": first_sheet.get("Audit Group Number"),
+            "Trade Name": first_sheet.get("Trade Name") or first_extracted.get("trade_name")}
+    diffs = []
+    for key, column in HEADER_FIELD_COLUMNS.items():
+        if not _same_value(first_sheet.get(column), first_extracted.get(key)):
+            diffs.append({**base, "Audit Para Number": None, "Change": "Changed", "Field": column,
+                          "Current Value": first_sheet.get(column), "Re-extracted Value": first_extracted.get(key)})
+
+    sheet_by_para = {_para_key(r.get("Audit Para Number"), i): r for i, r in enumerate(sheet_records)}
+    extracted_by_para = {_para_key(r.get("audit_para_number"), i): r for i, r in enumerate(extracted_rows)}
+    for para in sorted(set(sheet_by_para) | set(extracted_by_para), key=_para_sort_key):
+        sheet_row, extracted_row = sheet_by_para.get(para), extracted_by_para.get(para)
+        para_base = {**base, "Audit Para Number": para}
+        if sheet_row is None:
+            diffs.append({**para_base, "Change": "Para only in re-extraction", "Field": "Audit Para Heading",
+                          "Current Value": None, "Re-extracted Value": extracted_row.get("audit_para_heading")})
+        elif extracted_row is None:
+            diffs.append({**para_base, "Change": "Para only in sheet", "Field": "Audit Para Heading",
+                          "Current Value": sheet_row.get("Audit Para Heading"), "Re-extracted Value": None})
+        else:
+            for key, column in PARA_FIELD_COLUMNS.items():
+                if not _same_value(sheet_row.get(column), extracted_row.get(key)):
+                    diffs.append({**para_base, "Change": "Changed", "Field": column,
+                                  "Current Value": sheet_row.get(column), "Re-extracted Value": extracted_row.get(key)})
+    return diffs
+
+
+def backfill_dar(drive_service, dar_url, sheet_records, api_key, cancel_event=None):
+    """Scheduler job: download one DAR, re-extract it and diff against its current sheet rows."""
+    file_id = get_file_id_from_drive_url(dar_url)
+    if not file_id:
+        raise ValueError("DAR PDF URL is not a Google Drive file link")
+    try: # Runs on a scheduler worker thread: no Streamlit calls, the failure is recorded in the checkpoint
+        pdf_bytes = download_drive_file(drive_service, file_id, raise_errors=True)
+    except Exception as e:
+        raise RuntimeError(f"Could not download the DAR PDF from Drive: {e}") from e
+    first = sheet_records[0] if sheet_records else {}
+    outcome = run_dar_extraction(pdf_bytes, first.get("Audit Group Number"), first.get("Audit Circle Number"), api_key, cancel_event=cancel_event)
+    if outcome["cancelled"]:
+        return None
+    errors = [text for level, text in outcome["messages"] if level == "error"]
+    if errors:
+        raise RuntimeError("; ".join(errors))
+    return diff_dar_rows(dar_url, sheet_records, outcome["rows"])
+
+
+def sheet_records_by_dar(df_sheet):
+    """Groups the period's sheet rows by DAR PDF URL as plain dicts (NaN -> None) for the worker threads."""
+    df_valid = df_sheet[df_sheet["DAR PDF URL"].notna() & (df_sheet["DAR PDF URL"].astype(str).str.strip() != "")]
+    records = df_valid.astype(object).where(df_valid.notna(), None).to_dict("records")
+    by_dar = {}
+    for record in records:
+        by_dar.setdefault(str(record["DAR PDF URL"]).strip(), []).append(record)
+    return by_dar
+
+
+# --- Runner ---
+class BackfillRunner:
+    """
+    Drives one period's backfill from a background thread. At most `max_concurrent` DARs are in the
+    shared extraction queue at a time, at a priority below interactive uploads, and the checkpoint is
+    rewritten after every DAR so a stopped or crashed run resumes where it left off.
+    """
+
+    def __init__(self, scheduler, drive_service, checkpoint, records_by_dar, api_key, max_concurrent=BACKFILL_MAX_CONCURRENT_DARS):
+        self.scheduler = scheduler
+        self.drive_service = drive_service
+        self.checkpoint = checkpoint
+        self.records_by_dar = records_by_dar
+        self.api_key = api_key
+        self.max_concurrent = max_concurrent
+        self._stop_event = threading.Event()
+        self._in_flight = {}  # job_id -> DAR url
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def mcm_key(self):
+        return self.checkpoint["mcm_key"]
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self.checkpoint["status"] = RUN_RUNNING
+        save_checkpoint(self.checkpoint)
+        self._thread = threading.Thread(target=self._loop, name=f"emcm-backfill-{self.mcm_key}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Pauses the run; in-flight DARs are cancelled and stay pending in the checkpoint."""
+        self._stop_event.set()
+        with self._lock:
+            for job_id in list(self._in_flight):
+                self.scheduler.cancel(job_id)
+
+    def progress(self):
+        with self._lock:
+            counts = {DAR_PENDING: 0, DAR_DONE: 0, DAR_FAILED: 0}
+            for dar in self.checkpoint["dars"].values():
+                counts[dar["status"]] += 1
+            return {"total": len(self.checkpoint["dars"]), "in_flight": len(self._in_flight), **counts}
+
+    def _loop(self):
+        pending = [url for url, dar in self.checkpoint["dars"].items() if dar["status"] == DAR_PENDING]
+        while (pending or self._in_flight) and not self._stop_event.is_set():
+            with self._lock:
+                while pending and len(self._in_flight) < self.max_concurrent:
+                    url = pending.pop(0)
+                    cancel_event = threading.Event()
+                    job_id = self.scheduler.submit(
+                        f"BACKFILL-{self.mcm_key}", backfill_dar,
+                        args=(self.drive_service, url, self.records_by_dar.get(url, []), self.api_key),
+                        kwargs={"cancel_event": cancel_event}, cancel_event=cancel_event,
+                        priority=BACKFILL_JOB_PRIORITY, label=f"Backfill {self.mcm_key}")
+                    self._in_flight[job_id] = url
+            time.sleep(0.5)
+            for job_id in list(self._in_flight):
+                job = self.scheduler.get(job_id)
+                if job is not None and not job.finished:
+                    continue
+                with self._lock:
+                    url = self._in_flight.pop(job_id)
+                    dar = self.checkpoint["dars"][url]
+                    if job is None or job.error:
+                        dar.update(status=DAR_FAILED, error=(job.error if job else "Job lost"), diffs=[])
+                    elif job.result is not None:
+                        dar.update(status=DAR_DONE, error=None, diffs=job.result)
+                    save_checkpoint(self.checkpoint)
+        with self._lock:
+            done = all(dar["status"] != DAR_PENDING for dar in self.checkpoint["dars"].values())
+            self.checkpoint["status"] = RUN_DONE if done and not self._stop_event.is_set() else RUN_PAUSED
+            save_checkpoint(self.checkpoint)
+
+
+class BackfillRegistry:
+    """Process-wide map of period -> live BackfillRunner, so any PCO session sees the same run."""
+
+    def __init__(self):
+        self._runners = {}
+        self._lock = threading.Lock()
+
+    def get(self, mcm_key):
+        with self._lock:
+            return self._runners.get(mcm_key)
+
+    def start(self, drive_service, mcm_key, df_sheet, api_key, retry_failed=False):
+        with self._lock:
+            runner = self._runners.get(mcm_key)
+            if runner is not None and runner.running:
+                return runner
+            records_by_dar = sheet_records_by_dar(df_sheet)
+            checkpoint = load_checkpoint(mcm_key) or new_checkpoint(mcm_key, list(records_by_dar))
+            for url in records_by_dar:  # DARs uploaded since the run began
+                checkpoint["dars"].setdefault(url, {"status": DAR_PENDING, "error": None, "diffs": []})
+            if retry_failed:
+                for dar in checkpoint["dars"].values():
+                    if dar["status"] == DAR_FAILED: dar["status"] = DAR_PENDING
+            runner = BackfillRunner(get_extraction_scheduler(), drive_service, checkpoint, records_by_dar, api_key)
+            self._runners[mcm_key] = runner
+        runner.start()
+        return runner
+
+    def discard(self, mcm_key):
+        with self._lock:
+            runner = self._runners.pop(mcm_key, None)
+        if runner is not None:
+            runner.stop()
+        delete_checkpoint(mcm_key)
+
+
+@st.cache_resource
+def get_backfill_registry():
+    return BackfillRegistry()
+
+
+def diff_report_dataframe(checkpoint):
+    rows = [diff for dar in checkpoint["dars"].values() for diff in dar.get("diffs", [])]
+    return pd.DataFrame(rows, columns=DIFF_REPORT_COLUMNS)
+
+
+def failed_dars_dataframe(checkpoint):
+    rows = [{"DAR PDF URL": url, "Error": dar.get("error")} for url, dar in checkpoint["dars"].items() if dar["status"] == DAR_FAILED]
+    return pd.DataFrame(rows, columns=["DAR PDF URL", "Error"])
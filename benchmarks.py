@@ -0,0 +1,284 @@
+# benchmarks.py
+"""
+Offline micro-benchmarks for the data-handling hot paths. No Google services are needed.
+
+    python benchmarks.py                # run everything
+    python benchmarks.py validation     # run one benchmark
+"""
+import re
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from validation_utils import validate_data_for_sheet, IncrementalValidator, VALID_CATEGORIES, VALID_PARA_STATUSES
+from google_utils import (
+    sheet_values_to_dataframe, fixed_width_rows, fixed_width_frame, read_from_spreadsheet,
+    read_from_spreadsheet_chunked, concat_sheet_chunks, read_group_rows, get_api_traffic_stats, get_group_row_index,
+    get_sheet_metadata_cache, SHEET_COLUMNS
+)
+
+
+def _timed(fn, *args, repeat=3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def synthetic_editor_frame(n_rows, seed=0, error_rate=0.05):
+    """Rows shaped like the AG editor output, with a small share of missing/invalid cells."""
+    rng = np.random.default_rng(seed)
+    trade_names = np.array([f"Trader {i}" for i in range(max(1, n_rows // 4))], dtype=object)
+    df = pd.DataFrame({
+        "audit_group_number": rng.integers(1, 31, n_rows),
+        "audit_circle_number": rng.integers(1, 11, n_rows),
+        "gstin": np.array([f"29ABCDE{i:04d}F1Z5" for i in range(n_rows)], dtype=object),
+        "trade_name": trade_names[rng.integers(0, len(trade_names), n_rows)],
+        "category": np.array(VALID_CATEGORIES, dtype=object)[rng.integers(0, len(VALID_CATEGORIES), n_rows)],
+        "total_amount_detected_overall_rs": rng.uniform(0, 1e7, n_rows).round(2),
+        "total_amount_recovered_overall_rs": rng.uniform(0, 1e6, n_rows).round(2),
+        "audit_para_number": rng.integers(1, 30, n_rows).astype(float),
+        "audit_para_heading": np.array([f"Short payment of tax on item {i}" for i in range(n_rows)], dtype=object),
+        "revenue_involved_lakhs_rs": rng.uniform(0, 100, n_rows).round(2),
+        "revenue_recovered_lakhs_rs": rng.uniform(0, 10, n_rows).round(2),
+        "status_of_para": np.array(VALID_PARA_STATUSES, dtype=object)[rng.integers(0, len(VALID_PARA_STATUSES), n_rows)],
+    })
+    n_bad = int(n_rows * error_rate)
+    for col, bad_value in [("gstin", ""), ("category", "Tiny"), ("status_of_para", None), ("revenue_involved_lakhs_rs", np.nan)]:
+        df.loc[rng.choice(n_rows, n_bad, replace=False), col] = bad_value
+    return df
+
+
+def bench_validation(sizes=(1_000, 10_000, 100_000)):
+    print("validate_data_for_sheet (vectorised)")
+    print(f"{'rows':>10} {'seconds':>10} {'rows/s':>12} {'errors':>8}")
+    for n_rows in sizes:
+        df = synthetic_editor_frame(n_rows)
+        seconds, errors = _timed(validate_data_for_sheet, df)
+        print(f"{n_rows:>10,} {seconds:>10.3f} {n_rows / seconds:>12,.0f} {len(errors):>8,}")
+
+
+def bench_incremental_validation(sizes=(1_000, 10_000, 100_000)):
+    print("IncrementalValidator: one cell edit vs full revalidation")
+    print(f"{'rows':>10} {'build s':>10} {'edit s':>10} {'full s':>10}")
+    for n_rows in sizes:
+        df = synthetic_editor_frame(n_rows)
+        build_seconds, validator = _timed(IncrementalValidator, df, repeat=1)
+        edits = iter(range(10_000))
+
+        def one_edit():
+            pos = next(edits) % n_rows
+            validator.apply_editor_state({"edited_rows": {pos: {"category": "Medium"}}})
+            return validator.errors()
+
+        edit_seconds, _ = _timed(one_edit)
+        full_seconds, _ = _timed(validate_data_for_sheet, df, repeat=1)
+        print(f"{n_rows:>10,} {build_seconds:>10.3f} {edit_seconds:>10.4f} {full_seconds:>10.3f}")
+
+
+def synthetic_sheet_values(n_rows, seed=0, formatted=False):
+    """A period sheet as the values API returns it: header + rows, trailing blanks omitted.
+    formatted=True mimics the default FORMATTED_VALUE read (every cell a display string)."""
+    rng = np.random.default_rng(seed)
+    values = [list(SHEET_COLUMNS)]
+    for i in range(n_rows):
+        group = int(rng.integers(1, 31))
+        row = [group, (group - 1) // 3 + 1, f"29ABCDE{i // 5:04d}F1Z5", f"Trader {i // 5}",
+               VALID_CATEGORIES[i % len(VALID_CATEGORIES)],
+               round(float(rng.uniform(0, 1e7)), 2), round(float(rng.uniform(0, 1e6)), 2),
+               i % 5 + 1, f"Short payment of tax on item {i}",
+               round(float(rng.uniform(0, 100)), 2), round(float(rng.uniform(0, 10)), 2),
+               VALID_PARA_STATUSES[i % len(VALID_PARA_STATUSES)],
+               f"https://drive.google.com/file/d/{i // 5:08d}/view", 45900 + i / 10_000]
+        if formatted:
+            row = [str(cell) for cell in row[:13]] + [f"2025-09-01 {i % 24:02d}:00:00"]
+        if i % 50 == 0:
+            row = row[:11] # Header-only rows end early
+        values.append(row)
+    return values
+
+
+def _string_read_with_agenda_conversion(values):
+    # The pre-typed path: formatted strings, then ui_mcm_agenda's per-column regex strip + to_numeric
+    df = sheet_values_to_dataframe(values)
+    for col_name in ['Audit Group Number', 'Audit Circle Number', 'Total Amount Detected (Overall Rs)',
+                     'Total Amount Recovered (Overall Rs)', 'Audit Para Number',
+                     'Revenue Involved (Lakhs Rs)', 'Revenue Recovered (Lakhs Rs)']:
+        df[col_name] = df[col_name].astype(str).str.replace(r'[^\d.]', '', regex=True)
+        df[col_name] = pd.to_numeric(df[col_name], errors='coerce')
+    return df
+
+
+def bench_typed_read(sizes=(10_000, 50_000)):
+    print("Sheet read -> DataFrame: formatted strings + agenda conversion vs typed read (per 10k rows)")
+    print(f"{'rows':>10} {'string s':>10} {'string MB':>10} {'typed s':>10} {'typed MB':>10}")
+    for n_rows in sizes:
+        per_10k = 10_000 / n_rows
+        string_seconds, df_string = _timed(_string_read_with_agenda_conversion, synthetic_sheet_values(n_rows, formatted=True))
+        typed_seconds, df_typed = _timed(lambda v: sheet_values_to_dataframe(v, typed=True), synthetic_sheet_values(n_rows))
+        string_mb = df_string.memory_usage(deep=True).sum() / 1e6
+        typed_mb = df_typed.memory_usage(deep=True).sum() / 1e6
+        print(f"{n_rows:>10,} {string_seconds * per_10k:>10.3f} {string_mb * per_10k:>10.2f} "
+              f"{typed_seconds * per_10k:>10.3f} {typed_mb * per_10k:>10.2f}")
+
+
+def _per_row_padding(rows, columns):
+    # The previous read_from_spreadsheet normalisation: pad/truncate each row in a Python loop
+    width = len(columns)
+    padded_rows = []
+    for row in rows:
+        if len(row) < width:
+            padded_rows.append(row + [None] * (width - len(row)))
+        elif len(row) > width:
+            padded_rows.append(row[:width])
+        else:
+            padded_rows.append(row)
+    return pd.DataFrame(padded_rows, columns=columns)
+
+
+def bench_row_normalisation(sizes=(50_000,)):
+    print(f"Ragged sheet rows -> fixed-width {len(SHEET_COLUMNS)}-column frame")
+    print(f"{'rows':>10} {'loop s':>10} {'single s':>10} {'of which pad s':>15}")
+    for n_rows in sizes:
+        rows = synthetic_sheet_values(n_rows, formatted=True)[1:]
+        loop_seconds, _ = _timed(_per_row_padding, rows, SHEET_COLUMNS)
+        single_seconds, _ = _timed(fixed_width_frame, rows, SHEET_COLUMNS)
+        pad_seconds, _ = _timed(fixed_width_rows, rows, len(SHEET_COLUMNS))
+        print(f"{n_rows:>10,} {loop_seconds:>10.3f} {single_seconds:>10.3f} {pad_seconds:>15.4f}")
+
+
+class _InMemorySheetsService:
+    """Answers the spreadsheets().get / values().get / values().batchGet calls of the read paths from a values list (offline)."""
+
+    def __init__(self, values):
+        self._values = values
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def _range_values(self, a1_range):
+        window = re.match(r".*!(\d+):(\d+)$", a1_range)
+        if window:
+            return self._values[int(window[1]) - 1:int(window[2])]
+        cells = re.match(r".*!([A-Z]+)(\d+):([A-Z]+)(\d*)$", a1_range)
+        if not cells:
+            return self._values
+        first_col, last_col = ord(cells[1]) - ord("A"), ord(cells[3]) - ord("A") # Single-letter columns only
+        rows = [[str(cell) for cell in row[first_col:last_col + 1]]
+                for row in self._values[int(cells[2]) - 1:int(cells[4]) if cells[4] else None]]
+        while rows and not rows[-1]:
+            rows.pop()
+        return rows
+
+    def get(self, spreadsheetId, range=None, fields=None, ranges=None, includeGridData=False, **render_options):
+        if range is None:
+            sheet = {"properties": {"title": "Sheet1", "sheetId": 0, "gridProperties": {"rowCount": len(self._values) + 1000}}}
+            if includeGridData: # First-tab metadata lookup: header cells
+                sheet["data"] = [{"rowData": [{"values": [{"formattedValue": str(cell)} for cell in self._values[0]]}]}]
+            response = {"sheets": [sheet]}
+        else:
+            response = {"values": self._range_values(range)}
+        return _InMemoryRequest(json.dumps(response).encode("utf-8"))
+
+    def batchGet(self, spreadsheetId, ranges, fields=None, **render_options):
+        response = {"valueRanges": [{"values": self._range_values(a1_range)} for a1_range in ranges]}
+        return _InMemoryRequest(json.dumps(response).encode("utf-8"))
+
+
+class _InMemoryRequest:
+    # Mirrors googleapiclient's HttpRequest: execute() hands the raw body to postproc, which decodes it
+    def __init__(self, content):
+        self.content = content
+        self.postproc = lambda resp, content: json.loads(content)
+
+    def execute(self):
+        return self.postproc(None, self.content)
+
+
+def _peak_mb(fn, *args):
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+
+def bench_chunked_read(sizes=(50_000,)):
+    print("Peak memory: one values().get + full DataFrame vs chunked read keeping one group's rows")
+    print(f"{'rows':>10} {'full MB':>10} {'chunked MB':>11} {'full s':>8} {'chunked s':>10}")
+    for n_rows in sizes:
+        service = _InMemorySheetsService(synthetic_sheet_values(n_rows, formatted=True))
+
+        def full_then_filter():
+            df = read_from_spreadsheet(service, "bench")
+            return df[df["Audit Group Number"] == "7"]
+
+        def chunked_filter():
+            kept = []
+            read_from_spreadsheet_chunked(service, "bench", lambda chunk: kept.append(chunk[chunk["Audit Group Number"] == "7"]))
+            return concat_sheet_chunks(kept)
+
+        full_seconds, _ = _timed(full_then_filter, repeat=1)
+        chunked_seconds, _ = _timed(chunked_filter, repeat=1)
+        print(f"{n_rows:>10,} {_peak_mb(full_then_filter):>10.1f} {_peak_mb(chunked_filter):>11.1f} "
+              f"{full_seconds:>8.3f} {chunked_seconds:>10.3f}")
+
+
+def _response_bytes_of(fn):
+    before = get_api_traffic_stats().snapshot()
+    fn()
+    after = get_api_traffic_stats().snapshot()
+    return {label: after[label]["bytes"] - before.get(label, {}).get("bytes", 0) for label in after
+            if after[label]["calls"] != before.get(label, {}).get("calls", 0)}
+
+
+def bench_group_read(sizes=(10_000, 50_000), group=7):
+    print("Response bytes for one audit group's view: whole sheet vs group index + the group's own ranges")
+    print(f"{'rows':>10} {'full KB':>10} {'index KB':>9} {'rows KB':>9} {'group s':>8}")
+    for n_rows in sizes:
+        service = _InMemorySheetsService(synthetic_sheet_values(n_rows, formatted=True))
+        full = _response_bytes_of(lambda: read_from_spreadsheet(service, "bench"))
+        get_group_row_index().invalidate("bench")
+        get_sheet_metadata_cache().invalidate("bench")
+        grouped = _response_bytes_of(lambda: read_group_rows(service, "bench", group))
+        group_seconds, _ = _timed(read_group_rows, service, "bench", group)
+        print(f"{n_rows:>10,} {sum(full.values()) / 1e3:>10.0f} {grouped.get('sheets.values.get (group index)', 0) / 1e3:>9.0f} "
+              f"{grouped.get('sheets.values.batchGet (group rows)', 0) / 1e3:>9.0f} {group_seconds:>8.3f}")
+
+
+BENCHMARKS = {
+    "validation": bench_validation,
+    "incremental": bench_incremental_validation,
+    "typed_read": bench_typed_read,
+    "normalise": bench_row_normalisation,
+    "chunked_read": bench_chunked_read,
+    "group_read": bench_group_read,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="e-MCM data-path benchmarks")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+    for name in args.names or BENCHMARKS:
+        BENCHMARKS[name]()
+        print()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,43 @@
 # config.py
+import os
 import streamlit as st
 
 # --- Google API Configuration ---
 SCOPES = ['https://www.googleapis.com/auth/drive', 'https://www.googleapis.com/auth/spreadsheets']
+GOOGLE_API_TIMEOUT_SECONDS = 60  # Socket timeout of each thread's HTTP client, so a stalled call cannot hang a worker
+DRIVE_RESUMABLE_UPLOAD_MIN_BYTES = 5 * 1024 * 1024  # Smaller DAR PDFs are uploaded in a single multipart request
 # CREDENTIALS_FILE = 'credentials.json' # Kept for reference, but get_google_services uses st.secrets
 
 # --- Google Drive Master Configuration ---
 MASTER_DRIVE_FOLDER_NAME = "e-MCM_Root_DAR_App"  # Master folder on Google Drive
 MCM_PERIODS_FILENAME_ON_DRIVE = "mcm_periods_config.json"  # Config file on Google Drive
 
+# --- Extraction Job Scheduling ---
+EXTRACTION_MAX_CONCURRENT_JOBS = 4  # Global cap on simultaneous preprocess -> Gemini -> validate pipelines
+EXTRACTION_DEADLINE_BOOST_DAYS = 7  # Jobs for a period get boosted priority within this many days of its deadline
+EXTRACTION_JOB_POLL_SECONDS = 2  # How often the AG dashboard polls a running background extraction job
+BACKFILL_MAX_CONCURRENT_DARS = 2  # Re-extraction backfill keeps at most this many DARs in the extraction queue at once
+
+# --- Spreadsheet Reads ---
+SHEET_READ_CHUNK_ROWS = 2000  # Rows per values().get window when a period sheet is read in chunks
+GROUP_ROW_INDEX_MAX_AGE_SECONDS = 300  # The per-group row index is rebuilt after this, to pick up rows written outside the app
+
+# --- Submission Write-Behind ---
+APPEND_JOURNAL_BATCH_ROWS = 500  # Max rows sent to one period spreadsheet in a single values.append
+APPEND_JOURNAL_MAX_BACKOFF_SECONDS = 300  # Retry delay cap when Sheets is throttling (429) or unavailable
+
+# --- Period Mirror ---
+MIRROR_TAIL_SYNC_SECONDS = 30  # A mirrored period older than this fetches rows added below its last mirrored row
+MIRROR_FULL_RESYNC_SECONDS = 900  # ... and one older than this is re-read in full (picks up edits made directly in Sheets)
+PERIOD_FRAME_CACHE_ENTRIES = 8  # Whole-period DataFrames (typed and untyped count separately) shared by all sessions
+
+# --- Period Provisioning ---
+PREPROVISION_MONTHS_AHEAD = 2  # Folders and spreadsheets for the current month and this many after it are made in advance; 0 turns it off
+PREPROVISION_RETRY_SECONDS = 600  # A period whose pre-provisioning failed is not retried before this
+
+# --- Local State (survives reruns, reconnects and app restarts) ---
+LOCAL_STATE_DIR = os.environ.get("EMCM_STATE_DIR", ".emcm_state")
+
 # --- User Credentials ---
 USER_CREDENTIALS = {
     "planning_officer": "pco_password",
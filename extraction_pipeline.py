@@ -0,0 +1,145 @@
+# extraction_pipeline.py
+import logging
+from io import BytesIO
+
+import pandas as pd
+
+from google_utils import upload_to_drive, delete_drive_file, set_public_read_permissions
+from dar_processor import preprocess_pdf_text
+from gemini_utils import get_structured_data_with_gemini
+from validation_utils import validate_data_for_sheet
+from models import ParsedDARReport
+
+# Same keys as INTERNAL_DF_COLUMNS_FOR_EDIT in ui_audit_group.py (lowercase_with_underscore)
+EXTRACTED_ROW_COLUMNS = [
+    "audit_group_number", "audit_circle_number", "gstin", "trade_name", "category",
+    "total_amount_detected_overall_rs", "total_amount_recovered_overall_rs",
+    "audit_para_number", "audit_para_heading",
+    "revenue_involved_lakhs_rs", "revenue_recovered_lakhs_rs", "status_of_para",
+]
+logger = logging.getLogger(__name__)
+
+PARA_FIELDS = ["audit_para_number", "audit_para_heading", "revenue_involved_lakhs_rs", "revenue_recovered_lakhs_rs", "status_of_para"]
+
+
+def manual_entry_row(audit_group_no, audit_circle_no, heading):
+    row = {col: None for col in EXTRACTED_ROW_COLUMNS}
+    row.update({"audit_group_number": audit_group_no, "audit_circle_number": audit_circle_no, "audit_para_heading": heading})
+    return row
+
+
+def run_dar_extraction(pdf_bytes, audit_group_no, audit_circle_no, api_key, cancel_event=None):
+    """
+    The preprocess -> Gemini -> validate pipeline for one DAR PDF.
+
+    Runs on a scheduler worker thread, so it must not call Streamlit. UI messages are returned as
+    (level, text) tuples where level is an `st` function name ('error', 'warning', 'info', 'success').
+
+    Returns:
+        dict: {"rows": [...], "messages": [...], "validation_errors": [...], "cancelled": bool}
+    """
+    outcome = {"rows": [], "messages": [], "validation_errors": [], "cancelled": False}
+
+    preprocessed_text = preprocess_pdf_text(BytesIO(pdf_bytes))
+    if cancel_event is not None and cancel_event.is_set():
+        outcome["cancelled"] = True
+        return outcome
+
+    if preprocessed_text.startswith("Error"):
+        outcome["messages"].append(("error", f"PDF Preprocessing Error: {preprocessed_text}"))
+        outcome["rows"].append(manual_entry_row(audit_group_no, audit_circle_no, "Manual Entry - PDF Error"))
+        return outcome
+
+    parsed_data: ParsedDARReport = get_structured_data_with_gemini(api_key, preprocessed_text)
+    if cancel_event is not None and cancel_event.is_set():
+        outcome["cancelled"] = True
+        return outcome
+    if parsed_data.parsing_errors:
+        outcome["messages"].append(("warning", f"AI Parsing Issues: {parsed_data.parsing_errors}"))
+
+    header_dict = parsed_data.header.model_dump() if parsed_data.header else {}
+    base_info = {
+        "audit_group_number": audit_group_no,
+        "audit_circle_number": audit_circle_no,
+        "gstin": header_dict.get("gstin"), "trade_name": header_dict.get("trade_name"), "category": header_dict.get("category"),
+        "total_amount_detected_overall_rs": header_dict.get("total_amount_detected_overall_rs"),
+        "total_amount_recovered_overall_rs": header_dict.get("total_amount_recovered_overall_rs"),
+    }
+    if parsed_data.audit_paras:
+        for para_obj in parsed_data.audit_paras:
+            para_dict = para_obj.model_dump()
+            row = base_info.copy()
+            row.update({k: para_dict.get(k) for k in PARA_FIELDS})
+            outcome["rows"].append(row)
+    elif base_info.get("trade_name"):
+        row = base_info.copy()
+        row.update({"audit_para_number": None, "audit_para_heading": "N/A - Header Info Only (Add Paras Manually)", "status_of_para": None})
+        outcome["rows"].append(row)
+    else:
+        outcome["messages"].append(("error", "AI failed key header info."))
+        row = base_info.copy()
+        row.update({"audit_para_heading": "Manual Entry Required", "status_of_para": None})
+        outcome["rows"].append(row)
+
+    # Validate stage: a pre-check so the reviewer sees what still needs fixing before submission.
+    try:
+        outcome["validation_errors"] = validate_data_for_sheet(pd.DataFrame(outcome["rows"]))
+    except Exception as e:
+        outcome["messages"].append(("warning", f"Pre-validation of extracted data skipped: {e}"))
+    return outcome
+
+
+def _delete_upload(drive_service, pdf_drive_id):
+    try:
+        delete_drive_file(drive_service, pdf_drive_id, raise_errors=True)
+    except Exception as e:
+        logger.warning("Could not delete discarded DAR upload %s: %s", pdf_drive_id, e)
+
+
+def upload_dar_unless_cancelled(drive_service, pdf_bytes, drive_folder_id, filename_on_drive, cancel_event=None):
+    """
+    Uploads the DAR; if the work was cancelled meanwhile (user picked another file) the upload is deleted again.
+    Runs on the I/O pool, so like the extraction it must not call Streamlit: problems are returned as messages.
+
+    Returns:
+        tuple: (pdf_drive_id, pdf_drive_url, messages), the ID and URL None if the upload failed or was cancelled
+    """
+    try:
+        pdf_drive_id, pdf_drive_url = upload_to_drive(drive_service, BytesIO(pdf_bytes), drive_folder_id, filename_on_drive,
+                                                      share=False, raise_errors=True)
+    except Exception as e:
+        return None, None, [("error", f"An error occurred uploading the DAR PDF to Drive: {e}")]
+    if pdf_drive_id and cancel_event is not None and cancel_event.is_set():
+        _delete_upload(drive_service, pdf_drive_id)
+        return None, None, []
+    permission_failures = set_public_read_permissions(drive_service, [pdf_drive_id], report=False) if pdf_drive_id else {}
+    return pdf_drive_id, pdf_drive_url, [("warning", f"Could not set public read permission for the DAR PDF: {error}")
+                                         for error in permission_failures.values()]
+
+
+def run_dar_upload_and_extraction(upload_future, drive_service, pdf_bytes, audit_group_no, audit_circle_no, api_key, cancel_event=None):
+    """
+    Background job for a selected DAR. The Drive upload (`upload_future`, started on the I/O pool when
+    the job was submitted) and the extraction pipeline run concurrently, so the wait is the longer of
+    the two rather than their sum. The upload is always waited for, and deleted again if the job ends
+    cancelled or the extraction raises. The result is plain JSON-serialisable data so it can be
+    persisted and picked up again after a rerun or reconnect.
+    """
+    outcome = None
+    try:
+        outcome = run_dar_extraction(pdf_bytes, audit_group_no, audit_circle_no, api_key, cancel_event=cancel_event)
+    finally:
+        pdf_drive_id, pdf_drive_url, upload_messages = upload_future.result()
+        discarded = outcome is None or outcome["cancelled"] or (cancel_event is not None and cancel_event.is_set())
+        if discarded and pdf_drive_id:
+            _delete_upload(drive_service, pdf_drive_id)
+    if discarded:
+        return {"rows": [], "messages": [], "validation_errors": [], "cancelled": True, "drive_url": None}
+    if not pdf_drive_id:
+        return {"rows": [manual_entry_row(audit_group_no, audit_circle_no, "Manual Entry - PDF Upload Failed")],
+                "messages": upload_messages + [("error", "Failed to upload PDF to Drive. Cannot proceed with extraction.")],
+                "validation_errors": [], "cancelled": False, "drive_url": None}
+
+    outcome["drive_url"] = pdf_drive_url
+    outcome["messages"][:0] = [("success", f"DAR PDF uploaded to Drive: [Link]({pdf_drive_url})")] + upload_messages
+    return outcome
@@ -2,42 +2,343 @@
 import streamlit as st
 import os
 import json
+import logging
 from io import BytesIO
+import numpy as np
 import pandas as pd
+from urllib.parse import urlparse, parse_qs
+import threading
+import time
+import uuid
+import copy
 import math # Added for ceil, though not directly used here, good to have if needed
 
+import httplib2
+import google_auth_httplib2
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload, MediaIoBaseDownload
+from googleapiclient.http import HttpRequest, MediaFileUpload, MediaIoBaseUpload, MediaIoBaseDownload
+
+from config import SCOPES, GOOGLE_API_TIMEOUT_SECONDS, DRIVE_RESUMABLE_UPLOAD_MIN_BYTES, MASTER_DRIVE_FOLDER_NAME, MCM_PERIODS_FILENAME_ON_DRIVE, SHEET_READ_CHUNK_ROWS, GROUP_ROW_INDEX_MAX_AGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# The current 15-column layout of a period spreadsheet's first tab. Sheets created before "Record ID"
+# was added have the first 14 columns only; they are read with the record ID left blank.
+SHEET_COLUMNS = [
+    "Audit Group Number", "Audit Circle Number", "GSTIN", "Trade Name", "Category",
+    "Total Amount Detected (Overall Rs)", "Total Amount Recovered (Overall Rs)",
+    "Audit Para Number", "Audit Para Heading",
+    "Revenue Involved (Lakhs Rs)", "Revenue Recovered (Lakhs Rs)", "Status of para",
+    "DAR PDF URL", "Record Created Date", "Record ID"
+]
+RECORD_ID_COLUMN = "Record ID"
+GROUP_COLUMN = "Audit Group Number"
+
+# Declared dtypes for read_from_spreadsheet(typed=True). Columns not listed are left as read.
+SHEET_SCHEMA = {
+    "Audit Group Number": "Int8",
+    "Audit Circle Number": "Int8",
+    "GSTIN": "str",
+    "Trade Name": "str",
+    "Category": "category",
+    "Total Amount Detected (Overall Rs)": "float64",
+    "Total Amount Recovered (Overall Rs)": "float64",
+    "Audit Para Number": "Int16",
+    "Audit Para Heading": "str",
+    "Revenue Involved (Lakhs Rs)": "float64",
+    "Revenue Recovered (Lakhs Rs)": "float64",
+    "Status of para": "category",
+    "DAR PDF URL": "str",
+    "Record Created Date": "datetime64[ns]",
+    "Record ID": "str",
+}
+_INTEGER_DTYPE_BOUNDS = {"Int8": (-128, 127), "Int16": (-32768, 32767)}
+SHEETS_EPOCH = "1899-12-30" # Day 0 of Sheets date serial numbers
+
+
+def _sheet_numbers(series):
+    """Numbers pass through; text cells (e.g. '1,23,456' from a formatted read) have non-digits stripped first."""
+    numeric = pd.to_numeric(series, errors='coerce')
+    text_cells = series[numeric.isna() & series.notna()]
+    if len(text_cells):
+        numeric.loc[text_cells.index] = pd.to_numeric(
+            text_cells.astype(str).str.replace(r'[^\d.]', '', regex=True), errors='coerce')
+    return numeric.astype('float64')
+
+
+def _sheet_datetimes(series):
+    """Serial numbers (UNFORMATTED_VALUE reads) and date strings (formatted reads or text cells) to datetime64."""
+    serials = pd.to_numeric(series, errors='coerce')
+    result = pd.to_datetime(serials, unit='D', origin=SHEETS_EPOCH, errors='coerce').dt.round('s').astype('datetime64[ns]')
+    text_cells = series[serials.isna() & series.notna()]
+    if len(text_cells):
+        parsed = pd.to_datetime(text_cells.astype(str), errors='coerce', format='mixed')
+        # Text that parses to a date outside the datetime64[ns] range (e.g. '1,234' -> year 234) is not a real date
+        parsed = parsed.where(parsed.between(pd.Timestamp.min, pd.Timestamp.max))
+        result.loc[text_cells.index] = parsed.astype('datetime64[ns]')
+    return result
+
+
+def apply_sheet_schema(df):
+    """Converts the columns of a period DataFrame to their SHEET_SCHEMA dtypes (returns a new DataFrame)."""
+    typed_columns = {}
+    for col in df.columns:
+        dtype = SHEET_SCHEMA.get(col)
+        if dtype is None:
+            continue
+        series = df[col]
+        if dtype in _INTEGER_DTYPE_BOUNDS:
+            low, high = _INTEGER_DTYPE_BOUNDS[dtype]
+            numeric = _sheet_numbers(series)
+            # Fractional or out-of-range values cannot be represented and become <NA>
+            numeric = numeric.where((numeric % 1 == 0) & numeric.between(low, high))
+            typed_columns[col] = numeric.astype(dtype)
+        elif dtype == "float64":
+            typed_columns[col] = _sheet_numbers(series)
+        elif dtype.startswith("datetime64"):
+            typed_columns[col] = _sheet_datetimes(series)
+        elif dtype == "category":
+            typed_columns[col] = series.astype("category")
+        else:
+            typed_columns[col] = series.where(series.isna(), series.astype(str)).astype(dtype)
+    return df.assign(**typed_columns) if typed_columns else df.copy()
+
+
+def fill_missing_label(series, label):
+    """fillna that also works for categorical columns of a typed read (adds `label` as a category first)."""
+    if isinstance(series.dtype, pd.CategoricalDtype) and label not in series.cat.categories:
+        series = series.cat.add_categories([label])
+    return series.fillna(label)
+
+
+def dataframe_to_sheet_values(df):
+    """Header row plus data rows as JSON-serialisable values; missing cells are written as ''."""
+    df_prepared = df.copy()
+    for col in df_prepared.columns:
+        if pd.api.types.is_datetime64_any_dtype(df_prepared[col]):
+            df_prepared[col] = df_prepared[col].dt.strftime("%Y-%m-%d %H:%M:%S")
+    df_prepared = df_prepared.astype(object).where(df_prepared.notna(), '')
+    return [df_prepared.columns.values.tolist()] + df_prepared.values.tolist()
+
+
+class ApiTrafficStats:
+    """Process-wide call counts and response payload bytes per Google API method label."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_label = {}
+
+    def record(self, label, response_bytes):
+        with self._lock:
+            entry = self._by_label.setdefault(label, {"calls": 0, "bytes": 0})
+            entry["calls"] += 1
+            entry["bytes"] += response_bytes
+
+    def snapshot(self):
+        with self._lock:
+            return {label: dict(entry) for label, entry in self._by_label.items()}
+
+
+@st.cache_resource
+def get_api_traffic_stats():
+    """Process-wide traffic counters shared by every session."""
+    return ApiTrafficStats()
+
+
+def _measured(request, on_response_bytes):
+    # HttpRequest.postproc receives the raw (still undecoded) response body
+    postproc = request.postproc
+    def measuring_postproc(resp, content):
+        on_response_bytes(len(content or b""))
+        return postproc(resp, content)
+    request.postproc = measuring_postproc
+    return request
+
+
+def _execute(request, label):
+    """
+    Executes a Drive/Sheets request built with its field mask, recording the response size under
+    `label` (e.g. "sheets.values.get"). Every API call in this module goes through here.
+    """
+    stats = get_api_traffic_stats()
+    return _measured(request, lambda size: stats.record(label, size)).execute()
+
+
+# Field masks for the first-tab metadata lookup (title, GID and the header cells)
+FIRST_SHEET_INFO_FIELDS = 'sheets(properties(sheetId,title),data(rowData(values(formattedValue))))'
+FIRST_SHEET_HEADER_RANGE = f"A1:{chr(ord('A') + len(SHEET_COLUMNS) - 1)}1"
+
+
+def compare_field_mask_sizes(sheets_service, drive_service, spreadsheet_id):
+    """
+    Issues a few representative read calls twice, without and with the field masks used in this
+    module, and returns their response sizes as a list of dicts (for the System Status panel).
+    """
+    def response_bytes(request):
+        captured = []
+        _measured(request, captured.append).execute()
+        return captured[0] if captured else 0
+    spreadsheets = sheets_service.spreadsheets()
+    values_range = f"A1:{_column_letter(len(SHEET_COLUMNS) - 1)}200" # Every column of the sheet, Record ID included
+    representative_calls = [
+        ("Spreadsheet metadata (title/GID/header)",
+         lambda: spreadsheets.get(spreadsheetId=spreadsheet_id, ranges=[FIRST_SHEET_HEADER_RANGE], includeGridData=True),
+         lambda: spreadsheets.get(spreadsheetId=spreadsheet_id, ranges=[FIRST_SHEET_HEADER_RANGE], includeGridData=True, fields=FIRST_SHEET_INFO_FIELDS)),
+        ("Sheet values (first 200 rows)",
+         lambda: spreadsheets.values().get(spreadsheetId=spreadsheet_id, range=values_range),
+         lambda: spreadsheets.values().get(spreadsheetId=spreadsheet_id, range=values_range, fields='values')),
+        ("Drive file metadata (parents)",
+         lambda: drive_service.files().get(fileId=spreadsheet_id, fields='*'),
+         lambda: drive_service.files().get(fileId=spreadsheet_id, fields='parents')),
+    ]
+    results = []
+    for call_name, build_unmasked, build_masked in representative_calls:
+        try:
+            unmasked, masked = response_bytes(build_unmasked()), response_bytes(build_masked())
+        except HttpError as error:
+            st.warning(f"Could not measure '{call_name}': {error}")
+            continue
+        results.append({"Call": call_name, "Bytes without mask": unmasked, "Bytes with mask": masked,
+                        "Saved": f"{1 - masked / unmasked:.0%}" if unmasked else "n/a"})
+    return results
+
+
+DRIVE_REVISION_FIELDS = 'modifiedTime,md5Checksum,version'
+
+def drive_revision(file_metadata):
+    """Revision token of a Drive file from its DRIVE_REVISION_FIELDS (md5Checksum is absent for Google Sheets)."""
+    return "|".join(str(file_metadata.get(field, '')) for field in DRIVE_REVISION_FIELDS.split(','))
+
+def get_drive_revision(drive_service, file_id):
+    """Current revision token of a Drive file, from one small files.get. Errors propagate to the caller."""
+    return drive_revision(_execute(drive_service.files().get(fileId=file_id, fields=DRIVE_REVISION_FIELDS), "drive.files.get (revision)"))
+
+
+class RevisionCheckStats:
+    """Process-wide hit/miss counts of revision checks per kind ("config", "sheet"): a hit skips a download."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_kind = {}
+
+    def record(self, kind, hit):
+        with self._lock:
+            entry = self._by_kind.setdefault(kind, {"hits": 0, "misses": 0})
+            entry["hits" if hit else "misses"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {kind: dict(entry) for kind, entry in self._by_kind.items()}
+
+
+@st.cache_resource
+def get_revision_check_stats():
+    """Process-wide revision-check counters shared by every session."""
+    return RevisionCheckStats()
+
+
+class McmPeriodsCache:
+    """Process-wide {file_id: (revision, periods)} for the MCM periods config file."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, file_id, revision):
+        with self._lock:
+            entry = self._entries.get(file_id)
+            return copy.deepcopy(entry[1]) if entry is not None and entry[0] == revision else None
+
+    def put(self, file_id, revision, periods):
+        with self._lock:
+            self._entries[file_id] = (revision, copy.deepcopy(periods))
+
+    def invalidate(self, file_id):
+        with self._lock:
+            self._entries.pop(file_id, None)
+
+
+@st.cache_resource
+def get_mcm_periods_cache():
+    """Process-wide config cache shared by every session."""
+    return McmPeriodsCache()
+
+
+class GoogleServiceFactory:
+    """
+    Drive and Sheets clients built once per process from the static discovery documents and shared
+    by every session and background thread. httplib2 is not thread-safe, so every request is bound
+    to an AuthorizedHttp owned by the calling thread (its connections are reused by that thread's
+    later requests). The shared credentials are refreshed in one place, under a lock, before a
+    request goes out with an expired token.
+    """
+
+    def __init__(self, credentials, timeout=GOOGLE_API_TIMEOUT_SECONDS):
+        self.credentials = credentials
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {"http_clients": 0, "requests": 0, "credential_refreshes": 0}
+        started = time.perf_counter()
+        self.drive = build('drive', 'v3', http=self._thread_http(), requestBuilder=self._build_request,
+                           static_discovery=True, cache_discovery=False)
+        self.sheets = build('sheets', 'v4', http=self._thread_http(), requestBuilder=self._build_request,
+                            static_discovery=True, cache_discovery=False)
+        self.build_seconds = time.perf_counter() - started
+
+    def _thread_http(self):
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=httplib2.Http(timeout=self.timeout))
+            self._local.http = http
+            with self._lock:
+                self._stats["http_clients"] += 1
+        return http
+
+    def _ensure_fresh_credentials(self):
+        if self.credentials.valid:
+            return
+        with self._lock:
+            if not self.credentials.valid: # Another thread may have refreshed while this one waited
+                self.credentials.refresh(google_auth_httplib2.Request(httplib2.Http(timeout=self.timeout)))
+                self._stats["credential_refreshes"] += 1
+
+    def _build_request(self, http, *args, **kwargs):
+        # requestBuilder hook: ignore the build-time http and use the calling thread's own
+        self._ensure_fresh_credentials()
+        with self._lock:
+            self._stats["requests"] += 1
+        return HttpRequest(self._thread_http(), *args, **kwargs)
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["build_seconds"] = self.build_seconds
+        stats["requests_per_client"] = stats["requests"] / stats["http_clients"] if stats["http_clients"] else 0.0
+        return stats
+
+
+@st.cache_resource
+def get_google_service_factory():
+    """Process-wide service factory; raises if the credentials are missing or invalid (not cached then)."""
+    credentials = service_account.Credentials.from_service_account_info(st.secrets["google_credentials"], scopes=SCOPES)
+    return GoogleServiceFactory(credentials)
 
-from config import SCOPES, MASTER_DRIVE_FOLDER_NAME, MCM_PERIODS_FILENAME_ON_DRIVE
 
 def get_google_services():
-    creds = None
     try:
-        creds_dict = st.secrets["google_credentials"]
-        creds = service_account.Credentials.from_service_account_info(
-            creds_dict, scopes=SCOPES
-        )
+        factory = get_google_service_factory()
+        return factory.drive, factory.sheets
     except KeyError:
         st.error("Google credentials not found in Streamlit secrets. Ensure 'google_credentials' are set.")
         return None, None
-    except Exception as e:
-        st.error(f"Failed to load service account credentials from secrets: {e}")
-        return None, None
-
-    if not creds: return None, None
-
-    try:
-        drive_service = build('drive', 'v3', credentials=creds)
-        sheets_service = build('sheets', 'v4', credentials=creds)
-        return drive_service, sheets_service
     except HttpError as error:
         st.error(f"An error occurred initializing Google services: {error}")
         return None, None
     except Exception as e:
-        st.error(f"An unexpected error with Google services: {e}")
+        st.error(f"Failed to initialize Google services from the service account credentials: {e}")
         return None, None
 
 def find_drive_item_by_name(drive_service, name, mime_type=None, parent_id=None):
@@ -47,7 +348,7 @@ def find_drive_item_by_name(drive_service, name, mime_type=None, parent_id=None)
     if parent_id:
         query += f" and '{parent_id}' in parents"
     try:
-        response = drive_service.files().list(q=query, spaces='drive', fields='files(id, name)').execute()
+        response = _execute(drive_service.files().list(q=query, spaces='drive', fields='files(id)', pageSize=1), "drive.files.list")
         items = response.get('files', [])
         if items:
             return items[0].get('id')
@@ -57,16 +358,111 @@ def find_drive_item_by_name(drive_service, name, mime_type=None, parent_id=None)
         st.warning(f"Unexpected error searching for '{name}' in Drive: {e}")
     return None
 
-def set_public_read_permission(drive_service, file_id):
+class DriveIdCache:
+    """
+    Process-wide {(name, mime_type, parent_id): file_id} for the app's fixed Drive items (the master
+    folder and the periods config), so only the first session after a restart searches for them.
+    Entries are trusted until a call on the ID comes back 404.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = {}
+
+    def get(self, name, mime_type=None, parent_id=None):
+        with self._lock:
+            return self._ids.get((name, mime_type, parent_id))
+
+    def put(self, name, mime_type, parent_id, file_id):
+        with self._lock:
+            self._ids[(name, mime_type, parent_id)] = file_id
+
+    def invalidate(self, file_id):
+        # Drops the item and anything cached as being inside it
+        with self._lock:
+            self._ids = {key: cached_id for key, cached_id in self._ids.items() if file_id not in (cached_id, key[2])}
+
+
+@st.cache_resource
+def get_drive_id_cache():
+    """Process-wide Drive ID cache shared by every session."""
+    return DriveIdCache()
+
+
+def find_drive_item_cached(drive_service, name, mime_type=None, parent_id=None):
+    """find_drive_item_by_name through the process-wide ID cache. Items not found are not cached."""
+    cache = get_drive_id_cache()
+    file_id = cache.get(name, mime_type, parent_id)
+    if file_id is None:
+        file_id = find_drive_item_by_name(drive_service, name, mime_type, parent_id)
+        if file_id:
+            cache.put(name, mime_type, parent_id, file_id)
+    return file_id
+
+def forget_missing_drive_ids(error, *file_ids):
+    """
+    After a 404 on a call involving `file_ids`, drops them from the ID cache and this session, so the
+    next run looks them up again (the master folder by re-running the Drive structure setup).
+    """
+    if not isinstance(error, HttpError) or error.resp.status != 404:
+        return
+    for file_id in filter(None, file_ids):
+        get_drive_id_cache().invalidate(file_id)
+        if file_id == st.session_state.get('master_drive_folder_id'):
+            st.session_state.master_drive_folder_id = None
+            st.session_state.mcm_periods_drive_file_id = None
+            st.session_state.drive_structure_initialized = False
+        elif file_id == st.session_state.get('mcm_periods_drive_file_id'):
+            st.session_state.mcm_periods_drive_file_id = None
+
+def _execute_drive_batch(drive_service, labelled_requests):
+    """
+    Sends several Drive requests as one batch round trip. Each response is still recorded under its
+    own label. Returns {index: response or exception}, in the order the requests were given.
+    """
+    stats = get_api_traffic_stats()
+    outcomes = {}
+    def collect(request_id, response, exception):
+        outcomes[int(request_id)] = exception if exception is not None else response
+    batch = drive_service.new_batch_http_request(callback=collect)
+    for index, (request, label) in enumerate(labelled_requests):
+        batch.add(_measured(request, lambda size, label=label: stats.record(label, size)), request_id=str(index))
+    batch.execute()
+    stats.record("drive.batch", 0) # One round trip; payload bytes are counted per request above
+    return outcomes
+
+def set_public_read_permissions(drive_service, file_ids, report=True):
+    """
+    Makes the files readable by anyone with the link, in one round trip (a Drive batch when there are several).
+    Returns {file_id: error} for the files that failed; these are also shown with st.warning unless report=False.
+    """
+    file_ids = [file_id for file_id in file_ids if file_id]
+    permission = {'type': 'anyone', 'role': 'reader'}
+    requests = [(drive_service.permissions().create(fileId=file_id, body=permission, fields='id'), "drive.permissions.create")
+                for file_id in file_ids]
     try:
-        permission = {'type': 'anyone', 'role': 'reader'}
-        drive_service.permissions().create(fileId=file_id, body=permission).execute()
-    except HttpError as error:
-        st.warning(f"Could not set public read permission for file ID {file_id}: {error}.")
+        if len(requests) == 1:
+            outcomes = {0: _execute(*requests[0])}
+        else:
+            outcomes = _execute_drive_batch(drive_service, requests) if requests else {}
     except Exception as e:
-        st.warning(f"Unexpected error setting public permission for file ID {file_id}: {e}")
+        outcomes = {index: e for index in range(len(file_ids))}
+    failures = {file_id: outcomes[index] for index, file_id in enumerate(file_ids) if isinstance(outcomes.get(index), Exception)}
+    if report:
+        for file_id, error in failures.items():
+            st.warning(f"Could not set public read permission for file ID {file_id}: {error}.")
+    return failures
+
+def set_public_read_permission(drive_service, file_id, report=True):
+    return set_public_read_permissions(drive_service, [file_id], report=report)
 
-def create_drive_folder(drive_service, folder_name, parent_id=None):
+def create_drive_folder(drive_service, folder_name, parent_id=None, share=True, raise_errors=False):
+    """
+    Creates a folder (inside `parent_id` if given) and returns (folder_id, webViewLink). With
+    share=False the public read permission is left to the caller, e.g. to batch it with others.
+    With raise_errors=True errors propagate instead of being shown with st.error (and the session's
+    Drive IDs are left alone), for callers off the script thread.
+    """
     try:
         file_metadata = {
             'name': folder_name,
@@ -75,27 +471,33 @@ def create_drive_folder(drive_service, folder_name, parent_id=None):
         if parent_id:
             file_metadata['parents'] = [parent_id]
 
-        folder = drive_service.files().create(body=file_metadata, fields='id, webViewLink').execute()
+        folder = _execute(drive_service.files().create(body=file_metadata, fields='id, webViewLink'), "drive.files.create")
         folder_id = folder.get('id')
-        if folder_id:
-            set_public_read_permission(drive_service, folder_id)
+        if folder_id and share:
+            set_public_read_permission(drive_service, folder_id, report=not raise_errors)
         return folder_id, folder.get('webViewLink')
     except HttpError as error:
+        if raise_errors:
+            raise
+        forget_missing_drive_ids(error, parent_id)
         st.error(f"An error occurred creating Drive folder '{folder_name}': {error}")
         return None, None
     except Exception as e:
+        if raise_errors:
+            raise
         st.error(f"Unexpected error creating Drive folder '{folder_name}': {e}")
         return None, None
 
 def initialize_drive_structure(drive_service):
     master_id = st.session_state.get('master_drive_folder_id')
     if not master_id:
-        master_id = find_drive_item_by_name(drive_service, MASTER_DRIVE_FOLDER_NAME,
-                                            'application/vnd.google-apps.folder')
+        master_id = find_drive_item_cached(drive_service, MASTER_DRIVE_FOLDER_NAME,
+                                           'application/vnd.google-apps.folder')
         if not master_id:
             st.info(f"Master folder '{MASTER_DRIVE_FOLDER_NAME}' not found on Drive, attempting to create it...")
             master_id, _ = create_drive_folder(drive_service, MASTER_DRIVE_FOLDER_NAME, parent_id=None)
             if master_id:
+                get_drive_id_cache().put(MASTER_DRIVE_FOLDER_NAME, 'application/vnd.google-apps.folder', None, master_id)
                 st.success(f"Master folder '{MASTER_DRIVE_FOLDER_NAME}' created successfully.")
             else:
                 st.error(f"Fatal: Failed to create master folder '{MASTER_DRIVE_FOLDER_NAME}'. Cannot proceed.")
@@ -108,8 +510,8 @@ def initialize_drive_structure(drive_service):
 
     mcm_file_id = st.session_state.get('mcm_periods_drive_file_id')
     if not mcm_file_id:
-        mcm_file_id = find_drive_item_by_name(drive_service, MCM_PERIODS_FILENAME_ON_DRIVE,
-                                              parent_id=st.session_state.master_drive_folder_id)
+        mcm_file_id = find_drive_item_cached(drive_service, MCM_PERIODS_FILENAME_ON_DRIVE,
+                                             parent_id=st.session_state.master_drive_folder_id)
         if mcm_file_id:
             st.session_state.mcm_periods_drive_file_id = mcm_file_id
     return True
@@ -118,14 +520,21 @@ def load_mcm_periods(drive_service):
     mcm_periods_file_id = st.session_state.get('mcm_periods_drive_file_id')
     if not mcm_periods_file_id:
         if st.session_state.get('master_drive_folder_id'):
-            mcm_periods_file_id = find_drive_item_by_name(drive_service, MCM_PERIODS_FILENAME_ON_DRIVE,
-                                                          parent_id=st.session_state.master_drive_folder_id)
+            mcm_periods_file_id = find_drive_item_cached(drive_service, MCM_PERIODS_FILENAME_ON_DRIVE,
+                                                         parent_id=st.session_state.master_drive_folder_id)
             st.session_state.mcm_periods_drive_file_id = mcm_periods_file_id
         else:
             return {}
 
     if mcm_periods_file_id:
         try:
+            # Cheap revision check first; the file is downloaded only when it has changed
+            revision = get_drive_revision(drive_service, mcm_periods_file_id)
+            cache = get_mcm_periods_cache()
+            periods = cache.get(mcm_periods_file_id, revision)
+            get_revision_check_stats().record("config", periods is not None)
+            if periods is not None:
+                return periods
             request = drive_service.files().get_media(fileId=mcm_periods_file_id)
             fh = BytesIO()
             downloader = MediaIoBaseDownload(fh, request)
@@ -133,10 +542,13 @@ def load_mcm_periods(drive_service):
             while not done:
                 status, done = downloader.next_chunk()
             fh.seek(0)
-            return json.load(fh)
+            periods = json.load(fh)
+            cache.put(mcm_periods_file_id, revision, periods)
+            return periods
         except HttpError as error:
+            get_mcm_periods_cache().invalidate(mcm_periods_file_id)
             if error.resp.status == 404:
-                st.session_state.mcm_periods_drive_file_id = None
+                forget_missing_drive_ids(error, mcm_periods_file_id) # Looked up again on the next load
             else:
                 st.error(f"Error loading '{MCM_PERIODS_FILENAME_ON_DRIVE}' from Drive: {error}")
             return {}
@@ -157,47 +569,61 @@ def save_mcm_periods(drive_service, periods_data):
     mcm_periods_file_id = st.session_state.get('mcm_periods_drive_file_id')
     file_content = json.dumps(periods_data, indent=4).encode('utf-8')
     fh = BytesIO(file_content)
-    media_body = MediaIoBaseUpload(fh, mimetype='application/json', resumable=True)
+    media_body = MediaIoBaseUpload(fh, mimetype='application/json', resumable=False) # Small file: one multipart request
 
     try:
         if mcm_periods_file_id:
             file_metadata_update = {'name': MCM_PERIODS_FILENAME_ON_DRIVE}
-            drive_service.files().update(
+            saved_file = _execute(drive_service.files().update(
                 fileId=mcm_periods_file_id,
                 body=file_metadata_update,
                 media_body=media_body,
-                fields='id, name'
-            ).execute()
+                fields=f'id,{DRIVE_REVISION_FIELDS}'
+            ), "drive.files.update")
         else:
             file_metadata_create = {'name': MCM_PERIODS_FILENAME_ON_DRIVE, 'parents': [master_folder_id]}
-            new_file = drive_service.files().create(
+            saved_file = _execute(drive_service.files().create(
                 body=file_metadata_create,
                 media_body=media_body,
-                fields='id, name'
-            ).execute()
-            st.session_state.mcm_periods_drive_file_id = new_file.get('id')
+                fields=f'id,{DRIVE_REVISION_FIELDS}'
+            ), "drive.files.create")
+            st.session_state.mcm_periods_drive_file_id = saved_file.get('id')
+            get_drive_id_cache().put(MCM_PERIODS_FILENAME_ON_DRIVE, None, master_folder_id, saved_file.get('id'))
+        # Write-through: the next load finds this revision cached instead of downloading it again
+        get_mcm_periods_cache().put(saved_file.get('id'), drive_revision(saved_file), periods_data)
         return True
     except HttpError as error:
+        forget_missing_drive_ids(error, mcm_periods_file_id or master_folder_id) # The file updated, or the folder created in
         st.error(f"Error saving '{MCM_PERIODS_FILENAME_ON_DRIVE}' to Drive: {error}")
         return False
     except Exception as e:
         st.error(f"Unexpected error saving '{MCM_PERIODS_FILENAME_ON_DRIVE}': {e}")
         return False
 
-def upload_to_drive(drive_service, file_content_or_path, folder_id, filename_on_drive):
+def upload_to_drive(drive_service, file_content_or_path, folder_id, filename_on_drive, share=True, raise_errors=False):
+    """
+    Uploads a PDF into `folder_id` and returns (file_id, webViewLink). With raise_errors=True errors
+    propagate instead of being shown with st.error, for callers off the script thread (a failed share
+    is then only logged; pass share=False and call set_public_read_permissions to get it back).
+    """
     try:
         file_metadata = {'name': filename_on_drive, 'parents': [folder_id]}
         media_body = None
 
+        # Small files go up in one multipart request; a resumable upload costs an extra round trip to start the session
         if isinstance(file_content_or_path, str) and os.path.exists(file_content_or_path):
-            media_body = MediaFileUpload(file_content_or_path, mimetype='application/pdf', resumable=True)
+            media_body = MediaFileUpload(file_content_or_path, mimetype='application/pdf',
+                                         resumable=os.path.getsize(file_content_or_path) >= DRIVE_RESUMABLE_UPLOAD_MIN_BYTES)
         elif isinstance(file_content_or_path, bytes): # Handle bytes directly
             fh = BytesIO(file_content_or_path)
-            media_body = MediaIoBaseUpload(fh, mimetype='application/pdf', resumable=True)
+            media_body = MediaIoBaseUpload(fh, mimetype='application/pdf', resumable=len(file_content_or_path) >= DRIVE_RESUMABLE_UPLOAD_MIN_BYTES)
         elif isinstance(file_content_or_path, BytesIO): # Handle already created BytesIO
             file_content_or_path.seek(0) # Ensure cursor is at the beginning
-            media_body = MediaIoBaseUpload(file_content_or_path, mimetype='application/pdf', resumable=True)
+            media_body = MediaIoBaseUpload(file_content_or_path, mimetype='application/pdf',
+                                           resumable=file_content_or_path.getbuffer().nbytes >= DRIVE_RESUMABLE_UPLOAD_MIN_BYTES)
         else:
+            if raise_errors:
+                raise TypeError(f"Unsupported file content type for Google Drive upload: {type(file_content_or_path)}")
             st.error(f"Unsupported file content type for Google Drive upload: {type(file_content_or_path)}")
             return None, None
 
@@ -210,80 +636,472 @@ def upload_to_drive(drive_service, file_content_or_path, folder_id, filename_on_
             media_body=media_body,
             fields='id, webViewLink' # Request webViewLink for direct access
         )
-        file = request.execute()
+        file = _execute(request, "drive.files.create")
         file_id = file.get('id')
-        if file_id:
-            set_public_read_permission(drive_service, file_id) # Optional: make file publicly readable
+        if file_id and share:
+            permission_failures = set_public_read_permission(drive_service, file_id, report=not raise_errors) # Optional: make file publicly readable
+            if raise_errors and permission_failures:
+                logger.warning("Could not set public read permission for file ID %s: %s", file_id, permission_failures[file_id])
         return file_id, file.get('webViewLink')
     except HttpError as error:
+        if raise_errors:
+            raise
         st.error(f"An API error occurred uploading to Drive: {error}")
         return None, None
     except Exception as e:
+        if raise_errors:
+            raise
         st.error(f"An unexpected error in upload_to_drive: {e}")
         return None, None
 
-def create_spreadsheet(sheets_service, drive_service, title, parent_folder_id=None):
+# Helper function to extract File ID from Google Drive webViewLink
+def get_file_id_from_drive_url(url: str) -> str | None:
+    if not url or not isinstance(url, str):
+        return None
+    parsed_url = urlparse(url)
+    if 'drive.google.com' in parsed_url.netloc:
+        if '/file/d/' in parsed_url.path:
+            try:
+                return parsed_url.path.split('/file/d/')[1].split('/')[0]
+            except IndexError:
+                pass
+        query_params = parse_qs(parsed_url.query)
+        if 'id' in query_params:
+            return query_params['id'][0]
+    return None
+
+def download_drive_file(drive_service, file_id, raise_errors=False):
+    """Downloads a Drive file's bytes. With raise_errors=True errors propagate instead of being shown with st.warning."""
+    try:
+        request = drive_service.files().get_media(fileId=file_id)
+        fh = BytesIO()
+        downloader = MediaIoBaseDownload(fh, request)
+        done = False
+        while not done:
+            status, done = downloader.next_chunk(num_retries=2)
+        return fh.getvalue()
+    except HttpError as error:
+        if raise_errors:
+            raise
+        st.warning(f"Could not download Drive file ID {file_id}: {error}")
+        return None
+    except Exception as e:
+        if raise_errors:
+            raise
+        st.warning(f"Unexpected error downloading Drive file ID {file_id}: {e}")
+        return None
+
+def delete_drive_file(drive_service, file_id, raise_errors=False):
+    """Deletes a Drive file. With raise_errors=True errors propagate instead of being shown with st.warning."""
+    try:
+        _execute(drive_service.files().delete(fileId=file_id), "drive.files.delete")
+        return True
+    except HttpError as error:
+        if raise_errors:
+            raise
+        st.warning(f"Could not delete Drive file ID {file_id}: {error}")
+        return False
+    except Exception as e:
+        if raise_errors:
+            raise
+        st.warning(f"Unexpected error deleting Drive file ID {file_id}: {e}")
+        return False
+
+def create_spreadsheet(sheets_service, drive_service, title, parent_folder_id=None, share=True, raise_errors=False):
+    """
+    Creates an empty spreadsheet and returns (spreadsheet_id, spreadsheet_url). With a Drive service it
+    is created by Drive directly inside `parent_folder_id` (one call, nothing to move afterwards).
+    With share=False the public read permission is left to the caller, e.g. to batch it with others.
+    raise_errors works as in create_drive_folder.
+    """
     try:
+        if drive_service:
+            file_metadata = {'name': title, 'mimeType': 'application/vnd.google-apps.spreadsheet'}
+            if parent_folder_id:
+                file_metadata['parents'] = [parent_folder_id]
+            spreadsheet_id = _execute(drive_service.files().create(body=file_metadata, fields='id'), "drive.files.create").get('id')
+            if spreadsheet_id and share:
+                set_public_read_permission(drive_service, spreadsheet_id, report=not raise_errors) # Optional
+            return spreadsheet_id, f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit" if spreadsheet_id else None
+
         spreadsheet_body = {'properties': {'title': title}}
-        spreadsheet = sheets_service.spreadsheets().create(body=spreadsheet_body,
-                                                           fields='spreadsheetId,spreadsheetUrl').execute()
-        spreadsheet_id = spreadsheet.get('spreadsheetId')
-
-        if spreadsheet_id and drive_service:
-            set_public_read_permission(drive_service, spreadsheet_id) # Optional
-            if parent_folder_id: # Move spreadsheet to the specified folder
-                file = drive_service.files().get(fileId=spreadsheet_id, fields='parents').execute()
-                previous_parents = ",".join(file.get('parents'))
-                drive_service.files().update(fileId=spreadsheet_id,
-                                             addParents=parent_folder_id,
-                                             removeParents=previous_parents,
-                                             fields='id, parents').execute()
-        return spreadsheet_id, spreadsheet.get('spreadsheetUrl')
+        spreadsheet = _execute(sheets_service.spreadsheets().create(body=spreadsheet_body,
+                                                                    fields='spreadsheetId,spreadsheetUrl'), "sheets.spreadsheets.create")
+        return spreadsheet.get('spreadsheetId'), spreadsheet.get('spreadsheetUrl')
     except HttpError as error:
+        if raise_errors:
+            raise
+        forget_missing_drive_ids(error, parent_folder_id)
         st.error(f"An error occurred creating Spreadsheet: {error}")
         return None, None
     except Exception as e:
+        if raise_errors:
+            raise
         st.error(f"An unexpected error occurred creating Spreadsheet: {e}")
         return None, None
 
-def append_to_spreadsheet(sheets_service, spreadsheet_id, values_to_append):
+class SpreadsheetMetadataCache:
+    """
+    Process-wide cache of first-tab metadata per spreadsheet ID: {"title", "gid", "has_header", "header"}.
+    Writers keep it current (append/update record the header they wrote) and drop an entry when a call that relied
+    on it fails, so a renamed tab or recreated sheet is picked up on the next call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, spreadsheet_id):
+        with self._lock:
+            entry = self._entries.get(spreadsheet_id)
+            return dict(entry) if entry else None
+
+    def put(self, spreadsheet_id, title, gid, header):
+        with self._lock:
+            self._entries[spreadsheet_id] = {"title": title, "gid": gid, "has_header": bool(header), "header": list(header)}
+
+    def mark_header_written(self, spreadsheet_id, header=SHEET_COLUMNS):
+        with self._lock:
+            if spreadsheet_id in self._entries:
+                self._entries[spreadsheet_id].update(has_header=True, header=list(header))
+
+    def invalidate(self, spreadsheet_id):
+        with self._lock:
+            self._entries.pop(spreadsheet_id, None)
+
+
+@st.cache_resource
+def get_sheet_metadata_cache():
+    """Process-wide metadata cache shared by every session."""
+    return SpreadsheetMetadataCache()
+
+
+class SheetWriteListeners:
+    """
+    Callbacks run after this app writes to a spreadsheet's first tab, as listener(spreadsheet_id, kind)
+    with kind "append", "update", "delete" or "rewrite". Lets local copies of a sheet stay current.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def add(self, listener):
+        with self._lock:
+            if listener not in self._listeners:
+                self._listeners.append(listener)
+
+    def notify(self, spreadsheet_id, kind):
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(spreadsheet_id, kind)
+            except Exception as e:
+                logger.error("Sheet write listener failed for %s: %s", spreadsheet_id, e)
+
+
+@st.cache_resource
+def get_sheet_write_listeners():
+    """Process-wide listener registry shared by every session."""
+    return SheetWriteListeners()
+
+
+def get_first_sheet_info(sheets_service, spreadsheet_id, refresh=False):
+    """
+    Title, GID and header state of a spreadsheet's first tab, as a dict. A cache miss costs one
+    spreadsheets.get that also returns the header cells, so the header check needs no extra read.
+    API errors propagate to the caller.
+    """
+    cache = get_sheet_metadata_cache()
+    if not refresh:
+        cached = cache.get(spreadsheet_id)
+        if cached:
+            return cached
+    sheet_metadata = _execute(sheets_service.spreadsheets().get(
+        spreadsheetId=spreadsheet_id, ranges=[FIRST_SHEET_HEADER_RANGE], includeGridData=True, fields=FIRST_SHEET_INFO_FIELDS
+    ), "sheets.spreadsheets.get")
+    first_sheet = sheet_metadata.get('sheets', [{}])[0]
+    properties = first_sheet.get('properties', {})
+    header_cells = [cell for grid in first_sheet.get('data', []) for row in grid.get('rowData', []) for cell in row.get('values', [])]
+    header = [cell.get('formattedValue', '') for cell in header_cells]
+    while header and not header[-1]:
+        header.pop()
+    cache.put(spreadsheet_id, properties.get('title', "Sheet1"), properties.get('sheetId', 0), header)
+    return cache.get(spreadsheet_id)
+
+
+class RecordRowIndex:
+    """
+    Process-wide {record_id: sheet_row_number} per spreadsheet for the first tab, so a record can be
+    addressed without reading the sheet. Rows are hints: callers verify the cells they target before
+    writing, and rebuild an entry from the Record ID column when it turns out to be stale.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, spreadsheet_id):
+        with self._lock:
+            entry = self._entries.get(spreadsheet_id)
+            return dict(entry) if entry is not None else None
+
+    def put(self, spreadsheet_id, rows_by_id):
+        with self._lock:
+            self._entries[spreadsheet_id] = dict(rows_by_id)
+
+    def add_rows(self, spreadsheet_id, first_row, record_ids):
+        # Only extends an index that is already loaded; a missing one is built on first use
+        with self._lock:
+            entry = self._entries.get(spreadsheet_id)
+            if entry is not None:
+                entry.update({record_id: first_row + offset for offset, record_id in enumerate(record_ids) if record_id})
+
+    def remove_rows(self, spreadsheet_id, deleted_rows):
+        deleted_rows = sorted(set(deleted_rows))
+        deleted_set = set(deleted_rows)
+        with self._lock:
+            entry = self._entries.get(spreadsheet_id)
+            if entry is not None:
+                self._entries[spreadsheet_id] = {
+                    record_id: row - int(np.searchsorted(deleted_rows, row)) # Rows below a deletion move up
+                    for record_id, row in entry.items() if row not in deleted_set
+                }
+
+    def invalidate(self, spreadsheet_id):
+        with self._lock:
+            self._entries.pop(spreadsheet_id, None)
+
+
+@st.cache_resource
+def get_record_row_index():
+    """Process-wide record-ID index shared by every session."""
+    return RecordRowIndex()
+
+
+def group_key(value):
+    """Audit group number as the index keys it ('7' for 7, 7.0 or '7'); None for a blank cell."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)) or str(value).strip() == '':
+        return None
     try:
-        body = {'values': values_to_append}
-        sheet_metadata = sheets_service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
-        sheets = sheet_metadata.get('sheets', '')
-        first_sheet_title = sheets[0].get("properties", {}).get("title", "Sheet1")
-
-        # Check if header exists
-        range_to_check_header = f"{first_sheet_title}!A1:N1" # Check up to N (14th column)
-        result_header_check = sheets_service.spreadsheets().values().get(
-            spreadsheetId=spreadsheet_id,
-            range=range_to_check_header
-        ).execute()
-        header_row_in_sheet = result_header_check.get('values', [])
-
-        if not header_row_in_sheet: # No header at all, create it
-            header_to_write = [[
-                "Audit Group Number", "Audit Circle Number", "GSTIN", "Trade Name", "Category",
-                "Total Amount Detected (Overall Rs)", "Total Amount Recovered (Overall Rs)",
-                "Audit Para Number", "Audit Para Heading",
-                "Revenue Involved (Lakhs Rs)", "Revenue Recovered (Lakhs Rs)", "Status of para",
-                "DAR PDF URL", "Record Created Date"
-            ]]
-            sheets_service.spreadsheets().values().append(
-                spreadsheetId=spreadsheet_id,
-                range=f"{first_sheet_title}!A1", # Start at A1
-                valueInputOption='USER_ENTERED',
-                body={'values': header_to_write}
-            ).execute()
+        return str(int(float(value)))
+    except (TypeError, ValueError):
+        return str(value).strip()
 
-        # Append data rows
-        append_result = sheets_service.spreadsheets().values().append(
-            spreadsheetId=spreadsheet_id,
-            range=f"{first_sheet_title}!A1", # Appends after the last row with data in this range
-            valueInputOption='USER_ENTERED',
-            body=body # values_to_append should not include header
-        ).execute()
-        return append_result
+
+class GroupRowIndex:
+    """
+    Process-wide {group: [sheet_row_number, ...]} per spreadsheet for the first tab, built from one read
+    of the Audit Group Number column, so a group can fetch only its own rows. Kept current by this
+    app's appends and deletes; other writes drop it, and entries older than
+    GROUP_ROW_INDEX_MAX_AGE_SECONDS are rebuilt so rows written from elsewhere are picked up.
+    """
+
+    def __init__(self, max_age_seconds=GROUP_ROW_INDEX_MAX_AGE_SECONDS):
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, spreadsheet_id):
+        with self._lock:
+            entry = self._entries.get(spreadsheet_id)
+            if entry is None or time.time() - entry[0] > self.max_age_seconds:
+                return None
+            return {group: list(rows) for group, rows in entry[1].items()}
+
+    def put(self, spreadsheet_id, rows_by_group):
+        with self._lock:
+            self._entries[spreadsheet_id] = (time.time(), {group: sorted(rows) for group, rows in rows_by_group.items()})
+
+    def add_rows(self, spreadsheet_id, first_row, group_values):
+        with self._lock:
+            entry = self._entries.get(spreadsheet_id)
+            if entry is not None:
+                for offset, value in enumerate(group_values):
+                    if group_key(value) is not None:
+                        entry[1].setdefault(group_key(value), []).append(first_row + offset)
+
+    def remove_rows(self, spreadsheet_id, deleted_rows):
+        deleted_rows = sorted(set(deleted_rows))
+        deleted_set = set(deleted_rows)
+        with self._lock:
+            entry = self._entries.get(spreadsheet_id)
+            if entry is not None:
+                self._entries[spreadsheet_id] = (entry[0], {
+                    group: [row - int(np.searchsorted(deleted_rows, row)) for row in rows if row not in deleted_set]
+                    for group, rows in entry[1].items()
+                })
+
+    def invalidate(self, spreadsheet_id):
+        with self._lock:
+            self._entries.pop(spreadsheet_id, None)
+
+
+@st.cache_resource
+def get_group_row_index():
+    """Process-wide group index shared by every session."""
+    return GroupRowIndex()
+
+
+def record_id_of_row(row):
+    """The Record ID cell of a row in SHEET_COLUMNS order, or None if it has none."""
+    position = SHEET_COLUMNS.index(RECORD_ID_COLUMN)
+    return str(row[position]) if len(row) > position and row[position] not in (None, '') else None
+
+def _load_record_rows(sheets_service, spreadsheet_id, sheet_title):
+    # One read of the Record ID column only
+    record_id_col = _column_letter(SHEET_COLUMNS.index(RECORD_ID_COLUMN))
+    result = _execute(sheets_service.spreadsheets().values().get(
+        spreadsheetId=spreadsheet_id, range=f"{sheet_title}!{record_id_col}2:{record_id_col}", fields='values'
+    ), "sheets.values.get")
+    rows_by_id = {str(row[0]): sheet_row for sheet_row, row in enumerate(result.get('values', []), start=2) if row and row[0]}
+    get_record_row_index().put(spreadsheet_id, rows_by_id)
+    return rows_by_id
+
+def _record_ids_at_rows(sheets_service, spreadsheet_id, sheet_title, sheet_rows):
+    """{sheet_row: record_id or None} for the given rows, from one batchGet of their Record ID cells."""
+    record_id_col = _column_letter(SHEET_COLUMNS.index(RECORD_ID_COLUMN))
+    blocks = _row_blocks(sorted(set(sheet_rows)))
+    response = _execute(sheets_service.spreadsheets().values().batchGet(
+        spreadsheetId=spreadsheet_id,
+        ranges=[f"{sheet_title}!{record_id_col}{first}:{record_id_col}{last}" for first, last in blocks],
+        fields='valueRanges(values)'
+    ), "sheets.values.batchGet")
+    ids_at_rows = {}
+    for (first, last), value_range in zip(blocks, response.get('valueRanges', [])):
+        cells = value_range.get('values', [])
+        for offset in range(last - first + 1):
+            cell = cells[offset] if offset < len(cells) else []
+            ids_at_rows[first + offset] = str(cell[0]) if cell and cell[0] != '' else None
+    return ids_at_rows
+
+def find_record_rows(sheets_service, spreadsheet_id, record_ids):
+    """
+    Current sheet row numbers of the given record IDs, as {record_id: sheet_row}; IDs not in the sheet
+    are left out. Served from the record index and checked against the sheet with one small batchGet;
+    a stale index is rebuilt from the Record ID column once. API errors propagate to the caller.
+    """
+    sheet_title = get_first_sheet_info(sheets_service, spreadsheet_id)['title']
+    record_ids = [str(record_id) for record_id in record_ids]
+    rows_by_id = get_record_row_index().get(spreadsheet_id)
+    freshly_loaded = rows_by_id is None
+    if freshly_loaded:
+        rows_by_id = _load_record_rows(sheets_service, spreadsheet_id, sheet_title)
+    while True:
+        found = {record_id: rows_by_id[record_id] for record_id in record_ids if record_id in rows_by_id}
+        if freshly_loaded:
+            return found
+        ids_at_rows = _record_ids_at_rows(sheets_service, spreadsheet_id, sheet_title, found.values()) if found else {}
+        if len(found) == len(record_ids) and all(ids_at_rows[row] == record_id for record_id, row in found.items()):
+            return found
+        # Rows moved, or IDs unknown to this process's index: rebuild it once
+        rows_by_id = _load_record_rows(sheets_service, spreadsheet_id, sheet_title)
+        freshly_loaded = True
+
+def delete_records(sheets_service, spreadsheet_id, record_ids, missing_ok=False):
+    """
+    Deletes the rows of the given record IDs from the first sheet in one batchUpdate, wherever they
+    are now (rows added or removed by others since the caller's read do not matter).
+
+    Returns:
+        bool: True if successful, False otherwise. If any ID is not in the sheet nothing is deleted and
+        False is returned, unless missing_ok is set by a caller that has just re-read the sheet itself
+        (then IDs no longer in the sheet count as deleted).
+    """
+    try:
+        rows_by_id = find_record_rows(sheets_service, spreadsheet_id, record_ids)
+        missing = len(set(map(str, record_ids))) - len(rows_by_id)
+        if missing and not missing_ok:
+            st.warning(f"{missing} of the selected record(s) could not be found in the Spreadsheet. Nothing was deleted; reload and try again.")
+            return False
+        sheet_rows = sorted(rows_by_id.values())
+        if not sheet_rows:
+            return True
+        requests = [{
+            "deleteDimension": {
+                "range": {"sheetId": get_first_sheet_info(sheets_service, spreadsheet_id)['gid'], "dimension": "ROWS",
+                          "startIndex": first - 1, "endIndex": last} # Sheet row n is index n - 1
+            }
+        } for first, last in reversed(_row_blocks(sheet_rows))]
+        _execute(sheets_service.spreadsheets().batchUpdate(
+            spreadsheetId=spreadsheet_id, body={'requests': requests}, fields='spreadsheetId'), "sheets.spreadsheets.batchUpdate")
+        get_record_row_index().remove_rows(spreadsheet_id, sheet_rows)
+        get_group_row_index().remove_rows(spreadsheet_id, sheet_rows)
+        get_sheet_write_listeners().notify(spreadsheet_id, "delete")
+        return True
+    except HttpError as error:
+        get_sheet_metadata_cache().invalidate(spreadsheet_id)
+        get_record_row_index().invalidate(spreadsheet_id)
+        get_group_row_index().invalidate(spreadsheet_id)
+        st.error(f"An error occurred deleting records from Spreadsheet: {error}")
+        return False
+    except Exception as e:
+        st.error(f"Unexpected error deleting records: {e}")
+        return False
+
+
+def is_legacy_header(header):
+    """True for the header of a sheet created before the trailing columns of SHEET_COLUMNS were added."""
+    return 0 < len(header) < len(SHEET_COLUMNS) and list(header) == SHEET_COLUMNS[:len(header)]
+
+def new_record_id():
+    """
+    A short random ID for the "Record ID" column, generated once when a row is first submitted. The
+    leading letter keeps Sheets from reading it as a number (e.g. all digits, or "123e456") when the
+    row is written USER_ENTERED.
+    """
+    return "R" + uuid.uuid4().hex[:11]
+
+def _append_rows(sheets_service, spreadsheet_id, values_to_append, sheet_info):
+    rows = values_to_append if sheet_info["has_header"] else [SHEET_COLUMNS] + values_to_append # No header at all, create it
+    if is_legacy_header(sheet_info.get("header", [])):
+        # Complete an older sheet's header so the new trailing cells are labelled
+        legacy_width = len(sheet_info["header"])
+        _execute(sheets_service.spreadsheets().values().update(
+            spreadsheetId=spreadsheet_id, range=f"{sheet_info['title']}!{_column_letter(legacy_width)}1",
+            valueInputOption='RAW', body={'values': [SHEET_COLUMNS[legacy_width:]]}, fields='updatedCells'
+        ), "sheets.values.update")
+    append_result = _execute(sheets_service.spreadsheets().values().append(
+        spreadsheetId=spreadsheet_id,
+        range=f"{sheet_info['title']}!A1", # Appends after the last row with data in this range
+        valueInputOption='USER_ENTERED',
+        body={'values': rows},
+        fields='updates(updatedRange,updatedRows)'
+    ), "sheets.values.append")
+    get_sheet_metadata_cache().mark_header_written(spreadsheet_id)
+    first_row = _first_row_of_range(append_result['updates']['updatedRange']) + (len(rows) - len(values_to_append))
+    get_record_row_index().add_rows(spreadsheet_id, first_row, [record_id_of_row(row) for row in values_to_append])
+    group_position = SHEET_COLUMNS.index(GROUP_COLUMN)
+    get_group_row_index().add_rows(spreadsheet_id, first_row, [row[group_position] if len(row) > group_position else None for row in values_to_append])
+    get_sheet_write_listeners().notify(spreadsheet_id, "append")
+    return append_result
+
+def append_rows_to_first_sheet(sheets_service, spreadsheet_id, values_to_append):
+    """
+    Appends data rows (without header) to the first tab, writing the header first if the tab is empty.
+    With the tab's metadata cached this is a single values.append call. Errors propagate, for callers
+    that handle them themselves (e.g. the background append journal).
+    """
+    try:
+        sheet_info = get_sheet_metadata_cache().get(spreadsheet_id)
+        if sheet_info is None:
+            return _append_rows(sheets_service, spreadsheet_id, values_to_append, get_first_sheet_info(sheets_service, spreadsheet_id))
+        try:
+            return _append_rows(sheets_service, spreadsheet_id, values_to_append, sheet_info)
+        except HttpError as error:
+            if error.resp.status not in (400, 404):
+                raise
+            # The cached tab title may be stale (tab renamed); refetch and retry once
+            return _append_rows(sheets_service, spreadsheet_id, values_to_append, get_first_sheet_info(sheets_service, spreadsheet_id, refresh=True))
+    except Exception:
+        get_sheet_metadata_cache().invalidate(spreadsheet_id)
+        raise
+
+def append_to_spreadsheet(sheets_service, spreadsheet_id, values_to_append):
+    """append_rows_to_first_sheet that reports errors on the page and returns None instead of raising."""
+    try:
+        return append_rows_to_first_sheet(sheets_service, spreadsheet_id, values_to_append)
     except HttpError as error:
         st.error(f"An error occurred appending to Spreadsheet: {error}")
         return None
@@ -291,184 +1109,640 @@ def append_to_spreadsheet(sheets_service, spreadsheet_id, values_to_append):
         st.error(f"Unexpected error appending to Spreadsheet: {e}")
         return None
 
-def read_from_spreadsheet(sheets_service, spreadsheet_id, sheet_name="Sheet1"):
+def fixed_width_rows(rows, width):
+    """Pads short rows with None and truncates long ones in a single pass; full-width rows are reused as-is."""
+    padding = [None] * width
+    return [row if len(row) == width else (row + padding)[:width] for row in rows]
+
+def fixed_width_frame(rows, columns):
+    """DataFrame from the ragged value rows the Sheets API returns (trailing blank cells are omitted)."""
+    return pd.DataFrame(fixed_width_rows(rows, len(columns)), columns=list(columns))
+
+def resolve_sheet_columns(header_in_sheet, first_data_row):
+    """
+    Chooses the column layout for a sheet's data rows from its header and first data row: the current
+    SHEET_COLUMNS when they fit, otherwise the sheet's own header if it is consistent with the data.
+    """
+    expected_cols_header = SHEET_COLUMNS
+    num_cols_in_header = len(header_in_sheet)
+    num_cols_in_first_data_row = len(first_data_row)
+
+    if header_in_sheet == expected_cols_header:
+        # Ideal case: Header matches expected.
+        return expected_cols_header
+
+    elif is_legacy_header(header_in_sheet):
+        # Older sheet without the newer trailing columns; they are read as blank.
+        return expected_cols_header
+
+    elif num_cols_in_first_data_row == len(expected_cols_header):
+        # Data structure matches expected 14 columns, but header in sheet might be old/different.
+        # Prioritize using expected_cols_header for the DataFrame.
+        st.warning(f"Spreadsheet header mismatched ({num_cols_in_header} cols), but data rows appear to have the current expected {len(expected_cols_header)} columns. Applying current headers.")
+        return expected_cols_header
+
+    elif num_cols_in_header == num_cols_in_first_data_row:
+        # Header is different from expected, but consistent with data. Use sheet's header.
+        #st.warning(f"Spreadsheet header ({num_cols_in_header} cols) differs from expected ({len(expected_cols_header)} cols), but is consistent with data rows. Using header from sheet: {header_in_sheet}")
+        return header_in_sheet
+    else:
+        # Significant mismatch, e.g. header is 12, data is 14.
+        # This was the problematic case. Try to use expected_cols_header if data matches it.
+        error_message = (f"Spreadsheet structure conflict: Header has {num_cols_in_header} columns, "
+                         f"first data row has {num_cols_in_first_data_row} columns. "
+                         f"Expected {len(expected_cols_header)} columns based on current app version.")
+        st.error(error_message)
+        # For safety, build a DataFrame with expected columns and fill with what we can.
+        st.info("Attempting to load data with current expected columns. Data might be misaligned.")
+        return expected_cols_header
+
+
+def sheet_values_to_dataframe(values, typed=False):
+    """
+    Builds the period DataFrame from the raw `values` list returned by the Sheets API, reconciling the
+    sheet's header with SHEET_COLUMNS. With typed=True the columns are converted per SHEET_SCHEMA.
+    """
+    if not values:
+        return pd.DataFrame() # Return empty DataFrame if sheet is empty
+
+    expected_cols_header = SHEET_COLUMNS
+
+    header_in_sheet = values[0]
+    data_rows = values[1:]
+
+    if not data_rows : # Only header or empty after header
+        if header_in_sheet == expected_cols_header or is_legacy_header(header_in_sheet):
+            df_empty = pd.DataFrame(columns=expected_cols_header) # Correct header, no data
+        # Potentially incorrect header, or just some other content
+        # Try to return what's there, might be messy, or return empty with expected if too different
+        elif len(header_in_sheet) > 5 : # Heuristic: if it looks somewhat like a header
+            df_empty = pd.DataFrame(columns=header_in_sheet)
+        else:
+            df_empty = pd.DataFrame(columns=expected_cols_header) # Fallback to expected if header is very short/unlikely
+        return apply_sheet_schema(df_empty) if typed else df_empty
+
+    columns = resolve_sheet_columns(header_in_sheet, data_rows[0])
+    df = fixed_width_frame(data_rows, columns)
+    return apply_sheet_schema(df) if typed else df
+
+def _read_render_options(typed):
+    return {'valueRenderOption': 'UNFORMATTED_VALUE', 'dateTimeRenderOption': 'SERIAL_NUMBER'} if typed else {}
+
+def read_from_spreadsheet(sheets_service, spreadsheet_id, sheet_name="Sheet1", typed=False):
+    """
+    Reads the whole first tab into a DataFrame.
+
+    By default every cell comes back as its formatted display string. With typed=True the sheet is
+    read with UNFORMATTED_VALUE (numbers as numbers, dates as serial numbers) and converted once
+    according to SHEET_SCHEMA, so callers get numeric, categorical and datetime columns directly.
+    """
+    expected_cols_header = SHEET_COLUMNS
     try:
-        result = sheets_service.spreadsheets().values().get(
+        result = _execute(sheets_service.spreadsheets().values().get(
             spreadsheetId=spreadsheet_id,
-            range=sheet_name  # Read the whole sheet
-        ).execute()
-        values = result.get('values', [])
-
-        if not values:
-            return pd.DataFrame() # Return empty DataFrame if sheet is empty
-
-        expected_cols_header = [ # This is the current, correct 14-column header
-            "Audit Group Number", "Audit Circle Number", "GSTIN", "Trade Name", "Category",
-            "Total Amount Detected (Overall Rs)", "Total Amount Recovered (Overall Rs)",
-            "Audit Para Number", "Audit Para Heading",
-            "Revenue Involved (Lakhs Rs)", "Revenue Recovered (Lakhs Rs)", "Status of para",
-            "DAR PDF URL", "Record Created Date"
-        ]
-
-        header_in_sheet = values[0]
-        data_rows = values[1:]
-
-        if not data_rows : # Only header or empty after header
-            if header_in_sheet == expected_cols_header:
-                return pd.DataFrame(columns=expected_cols_header) # Correct header, no data
-            else: # Potentially incorrect header, or just some other content
-                 # Try to return what's there, might be messy, or return empty with expected if too different
-                if len(header_in_sheet) > 5 : # Heuristic: if it looks somewhat like a header
-                    return pd.DataFrame(columns=header_in_sheet)
-                return pd.DataFrame(columns=expected_cols_header) # Fallback to expected if header is very short/unlikely
-
-        num_cols_in_header = len(header_in_sheet)
-        num_cols_in_first_data_row = len(data_rows[0]) if data_rows else 0 # Check first data row
-
-        if header_in_sheet == expected_cols_header:
-            # Ideal case: Header matches expected.
-            # Ensure all data rows have a consistent number of columns. Pad if necessary.
-            processed_data_rows = []
-            for row in data_rows:
-                if len(row) < len(expected_cols_header):
-                    processed_data_rows.append(row + [None] * (len(expected_cols_header) - len(row)))
-                elif len(row) > len(expected_cols_header):
-                    processed_data_rows.append(row[:len(expected_cols_header)])
-                else:
-                    processed_data_rows.append(row)
-            return pd.DataFrame(processed_data_rows, columns=header_in_sheet)
-
-        elif num_cols_in_first_data_row == len(expected_cols_header):
-            # Data structure matches expected 14 columns, but header in sheet might be old/different.
-            # Prioritize using expected_cols_header for the DataFrame.
-            st.warning(f"Spreadsheet header mismatched ({num_cols_in_header} cols), but data rows appear to have the current expected {len(expected_cols_header)} columns. Applying current headers.")
-            # Pad/truncate all data rows to match expected_cols_header length
-            standardized_data_rows = []
-            for row in data_rows:
-                if len(row) < len(expected_cols_header):
-                    standardized_data_rows.append(row + [None] * (len(expected_cols_header) - len(row)))
-                elif len(row) > len(expected_cols_header):
-                    standardized_data_rows.append(row[:len(expected_cols_header)])
-                else:
-                    standardized_data_rows.append(row)
-            return pd.DataFrame(standardized_data_rows, columns=expected_cols_header)
-
-        elif num_cols_in_header == num_cols_in_first_data_row:
-            # Header is different from expected, but consistent with data. Use sheet's header.
-            #st.warning(f"Spreadsheet header ({num_cols_in_header} cols) differs from expected ({len(expected_cols_header)} cols), but is consistent with data rows. Using header from sheet: {header_in_sheet}")
-            return pd.DataFrame(data_rows, columns=header_in_sheet)
+            range=sheet_name,  # Read the whole sheet
+            fields='values',
+            **_read_render_options(typed)
+        ), "sheets.values.get")
+        return sheet_values_to_dataframe(result.get('values', []), typed=typed)
+
+    except HttpError as error:
+        st.error(f"An API error occurred reading from Spreadsheet: {error}")
+        df_empty = pd.DataFrame(columns=expected_cols_header) # Return empty DF with expected structure
+    except Exception as e:
+        st.error(f"Unexpected error reading from Spreadsheet: {e}")
+        df_empty = pd.DataFrame(columns=expected_cols_header) # Return empty DF with expected structure
+    return apply_sheet_schema(df_empty) if typed else df_empty
+
+def iter_spreadsheet_chunks(sheets_service, spreadsheet_id, sheet_name="Sheet1", chunk_rows=SHEET_READ_CHUNK_ROWS, typed=False):
+    """
+    Reads the sheet in windows of `chunk_rows` rows and yields one DataFrame per window, so only one
+    window of raw values is held at a time and callers can show rows before the whole sheet arrives.
+
+    The column layout is resolved once from the header and first data row; every chunk is indexed by
+    its 0-based data-row position, exactly as in a full read. API errors propagate to the caller.
+    """
+    sheet_metadata = _execute(sheets_service.spreadsheets().get(
+        spreadsheetId=spreadsheet_id, fields='sheets.properties(title,gridProperties.rowCount)'
+    ), "sheets.spreadsheets.get")
+    row_count = next((sh['properties'].get('gridProperties', {}).get('rowCount', 0) for sh in sheet_metadata.get('sheets', [])
+                      if sh['properties'].get('title') == sheet_name), None)
+    if row_count is None:
+        raise ValueError(f"Sheet '{sheet_name}' not found in spreadsheet.")
+
+    values_api = sheets_service.spreadsheets().values()
+    render_options = _read_render_options(typed)
+    header_in_sheet = None
+    columns = None
+    next_position = 0
+    blank_rows_carried = 0
+    start_row = 1 # The first window also carries the header row
+    while start_row <= row_count:
+        end_row = min(start_row + chunk_rows - (0 if start_row == 1 else 1), row_count)
+        window = _execute(values_api.get(
+            spreadsheetId=spreadsheet_id, range=f"{sheet_name}!{start_row}:{end_row}", fields='values', **render_options
+        ), "sheets.values.get").get('values', [])
+        if header_in_sheet is None:
+            if not window: # Nothing at all in the sheet
+                return
+            header_in_sheet, rows = window[0], window[1:]
+            window_size = end_row - start_row # Header row excluded
         else:
-            # Significant mismatch, e.g. header is 12, data is 14.
-            # This was the problematic case. Try to use expected_cols_header if data matches it.
-            error_message = (f"Spreadsheet structure conflict: Header has {num_cols_in_header} columns, "
-                             f"first data row has {num_cols_in_first_data_row} columns. "
-                             f"Expected {len(expected_cols_header)} columns based on current app version.")
-            st.error(error_message)
-            # Fallback: return raw values, which might lead to issues upstream, or an empty DF with expected cols.
-            # For safety, let's try to build a DataFrame with expected columns and fill with what we can.
-            st.info("Attempting to load data with current expected columns. Data might be misaligned.")
-            try:
-                # Pad/truncate all data rows to match expected_cols_header length
-                standardized_data_rows_fallback = []
-                for row_idx, row_val in enumerate(data_rows):
-                    new_row = [None] * len(expected_cols_header)
-                    for i in range(min(len(row_val), len(expected_cols_header))):
-                        new_row[i] = row_val[i]
-                    standardized_data_rows_fallback.append(new_row)
-                return pd.DataFrame(standardized_data_rows_fallback, columns=expected_cols_header)
-            except Exception as fallback_e:
-                st.error(f"Fallback data loading also failed: {fallback_e}")
-                return pd.DataFrame(columns=expected_cols_header) # Empty DF with correct columns
+            rows = window
+            window_size = end_row - start_row + 1
+        # Trailing empty rows are omitted from each response; ones that turn out to sit between
+        # data rows are restored below so positions match a full read
+        trailing_blank_rows = window_size - len(rows)
+        if rows:
+            rows = [[]] * blank_rows_carried + rows
+            blank_rows_carried = 0
+            if columns is None:
+                columns = resolve_sheet_columns(header_in_sheet, rows[0])
+            chunk = fixed_width_frame(rows, columns)
+            chunk.index = pd.RangeIndex(next_position, next_position + len(chunk))
+            next_position += len(chunk)
+            yield apply_sheet_schema(chunk) if typed else chunk
+        blank_rows_carried += trailing_blank_rows
+        start_row = end_row + 1
+
+def concat_sheet_chunks(chunks):
+    """
+    pd.concat for chunks from iter_spreadsheet_chunks. Column dtypes are re-inferred over the whole
+    frame (a chunk with an all-blank column infers differently) and typed categoricals stay categorical.
+    """
+    chunks = list(chunks)
+    if not chunks:
+        return pd.DataFrame()
+    df = pd.concat(chunks).infer_objects()
+    categorical_columns = [col for col in df.columns if SHEET_SCHEMA.get(col) == "category" and df[col].dtype == object]
+    return df.astype({col: "category" for col in categorical_columns}) if categorical_columns else df
 
+def read_from_spreadsheet_chunked(sheets_service, spreadsheet_id, aggregate, sheet_name="Sheet1", chunk_rows=SHEET_READ_CHUNK_ROWS, typed=False):
+    """
+    Feeds every chunk of the sheet to `aggregate(chunk)` as it arrives.
+
+    Returns:
+        bool: True once the whole sheet has been read, False if reading failed part-way
+              (the error is reported; whatever `aggregate` holds is then incomplete).
+    """
+    try:
+        for chunk in iter_spreadsheet_chunks(sheets_service, spreadsheet_id, sheet_name, chunk_rows, typed):
+            aggregate(chunk)
+        return True
     except HttpError as error:
         st.error(f"An API error occurred reading from Spreadsheet: {error}")
-        return pd.DataFrame(columns=expected_cols_header) # Return empty DF with expected structure
+        return False
     except Exception as e:
         st.error(f"Unexpected error reading from Spreadsheet: {e}")
-        return pd.DataFrame(columns=expected_cols_header) # Return empty DF with expected structure
+        return False
+
+def read_rows_from(sheets_service, spreadsheet_id, first_sheet_row):
+    """
+    Raw (formatted) value rows of the first tab from sheet row `first_sheet_row` (1-based) to the end,
+    in one values.get. Trailing empty rows are omitted, as in every values read. Errors propagate.
+    """
+    sheet_title = get_first_sheet_info(sheets_service, spreadsheet_id)['title']
+    result = _execute(sheets_service.spreadsheets().values().get(
+        spreadsheetId=spreadsheet_id, range=f"{sheet_title}!A{first_sheet_row}:{_column_letter(len(SHEET_COLUMNS) - 1)}", fields='values'
+    ), "sheets.values.get")
+    return result.get('values', [])
+
+GROUP_ROWS_MAX_RANGES_PER_CALL = 100 # Keeps the batchGet URL well under the request size limit
+
+def _load_group_rows(sheets_service, spreadsheet_id, sheet_title):
+    # One read of the Audit Group Number column only
+    group_col = _column_letter(SHEET_COLUMNS.index(GROUP_COLUMN))
+    result = _execute(sheets_service.spreadsheets().values().get(
+        spreadsheetId=spreadsheet_id, range=f"{sheet_title}!{group_col}2:{group_col}", fields='values'
+    ), "sheets.values.get (group index)")
+    rows_by_group = {}
+    for sheet_row, row in enumerate(result.get('values', []), start=2):
+        if row and group_key(row[0]) is not None:
+            rows_by_group.setdefault(group_key(row[0]), []).append(sheet_row)
+    get_group_row_index().put(spreadsheet_id, rows_by_group)
+    return rows_by_group
+
+def _rows_in_blocks(sheets_service, spreadsheet_id, sheet_title, sheet_rows):
+    """{sheet_row: raw row} for the given rows, read as coalesced ranges in as few batchGets as possible."""
+    blocks = _row_blocks(sorted(set(sheet_rows)))
+    last_col = _column_letter(len(SHEET_COLUMNS) - 1)
+    rows_by_sheet_row = {}
+    for start in range(0, len(blocks), GROUP_ROWS_MAX_RANGES_PER_CALL):
+        call_blocks = blocks[start:start + GROUP_ROWS_MAX_RANGES_PER_CALL]
+        response = _execute(sheets_service.spreadsheets().values().batchGet(
+            spreadsheetId=spreadsheet_id,
+            ranges=[f"{sheet_title}!A{first}:{last_col}{last}" for first, last in call_blocks],
+            fields='valueRanges(values)'
+        ), "sheets.values.batchGet (group rows)")
+        for (first, last), value_range in zip(call_blocks, response.get('valueRanges', [])):
+            rows = value_range.get('values', [])
+            for offset in range(last - first + 1):
+                rows_by_sheet_row[first + offset] = rows[offset] if offset < len(rows) else []
+    return rows_by_sheet_row
+
+def read_group_rows(sheets_service, spreadsheet_id, group_number):
+    """
+    Only one audit group's rows of the first tab, as a DataFrame indexed by data-row position (the same
+    index a full read gives those rows). The rows come from the group index and are read as a few
+    coalesced ranges; if any of them no longer belongs to the group the index is rebuilt once.
+    Formatted values, as read_from_spreadsheet. API errors propagate to the caller.
+    """
+    sheet_info = get_first_sheet_info(sheets_service, spreadsheet_id)
+    wanted = group_key(group_number)
+    group_position = SHEET_COLUMNS.index(GROUP_COLUMN)
+    rows_by_group = get_group_row_index().get(spreadsheet_id)
+    for refresh in (False, True):
+        if refresh or rows_by_group is None:
+            rows_by_group = _load_group_rows(sheets_service, spreadsheet_id, sheet_info['title'])
+        sheet_rows = rows_by_group.get(wanted, [])
+        rows_by_sheet_row = _rows_in_blocks(sheets_service, spreadsheet_id, sheet_info['title'], sheet_rows) if sheet_rows else {}
+        if all(len(row) > group_position and group_key(row[group_position]) == wanted for row in rows_by_sheet_row.values()):
+            break
+    else:
+        # Still inconsistent after a rebuild (the sheet changed in between): keep the rows that match
+        sheet_rows = [sheet_row for sheet_row in sheet_rows if group_key((rows_by_sheet_row[sheet_row] + [None] * (group_position + 1))[group_position]) == wanted]
+    header = sheet_info.get('header') or list(SHEET_COLUMNS)
+    rows = [rows_by_sheet_row[sheet_row] for sheet_row in sheet_rows]
+    columns = resolve_sheet_columns(header, rows[0]) if rows else list(SHEET_COLUMNS)
+    df = fixed_width_frame(rows, columns)
+    df.index = pd.Index([sheet_row - 2 for sheet_row in sheet_rows]) # Data row 0 is sheet row 2
+    return df
+
+def delete_spreadsheet_rows(sheets_service, spreadsheet_id, sheet_id_gid, row_indices_to_delete, base_df=None):
+    """
+    Deletes data rows from the first sheet in one batchUpdate, with runs of adjacent rows coalesced
+    into a single deleteDimension range.
 
-def delete_spreadsheet_rows(sheets_service, spreadsheet_id, sheet_id_gid, row_indices_to_delete):
-    # row_indices_to_delete are 0-based indices of the *data* rows (DataFrame iloc from read_from_spreadsheet)
-    if not row_indices_to_delete:
+    Args:
+        row_indices_to_delete: 0-based positions of the *data* rows (DataFrame index from read_from_spreadsheet).
+        base_df (pd.DataFrame, optional): The (untyped) read the positions refer to. If given, the rows
+            are re-read first (one batchGet) and nothing is deleted if any of them changed or moved.
+
+    Returns:
+        bool: True if successful, False otherwise.
+    """
+    if not len(row_indices_to_delete):
         return True
-    requests = []
-    # Sort in descending order to avoid index shifting issues during deletion
-    for data_row_index in sorted(row_indices_to_delete, reverse=True):
-        # Sheet API uses 0-based indexing for rows *within the specified range*,
-        # but deleteDimension needs 0-based index relative to start of sheet if sheetId is used.
-        # If header is row 0 in API terms, data row 0 is sheet row 1.
-        # The 'startIndex' for deleteDimension is 0-based and exclusive of the header if sheet data starts from row 1 (0-indexed) after header.
-        # Assuming read_from_spreadsheet gives data starting from what would be sheet row index 1 (if header is 0).
-        # So, if `data_row_index` is 0 (first data row), it means the 2nd row in the sheet (1-indexed), which is row index 1 for the API.
-        sheet_row_start_index = data_row_index + 1 # If data starts at physical row 2 (index 1)
-        requests.append({
+    row_positions = sorted({int(position) for position in row_indices_to_delete})
+    try:
+        if base_df is not None:
+            sheet_title = get_first_sheet_info(sheets_service, spreadsheet_id)['title']
+            if not _current_rows_match_base(sheets_service, spreadsheet_id, sheet_title, row_positions,
+                                            base_df, _sheet_value_array(base_df), False):
+                st.error("The spreadsheet was modified by someone else after it was loaded. "
+                         "Nothing was deleted; please reload the entries and select them again.")
+                return False
+        # Bottom-up, so deleting one range does not shift the rows of the ranges still to come.
+        # Data row 0 is sheet row index 1 (the header is index 0).
+        requests = [{
             "deleteDimension": {
-                "range": {
-                    "sheetId": sheet_id_gid,
-                    "dimension": "ROWS",
-                    "startIndex": sheet_row_start_index, # This is the 0-based index of the row in the sheet (header is 0)
-                    "endIndex": sheet_row_start_index + 1
-                }
+                "range": {"sheetId": sheet_id_gid, "dimension": "ROWS", "startIndex": first + 1, "endIndex": last + 2}
             }
-        })
-    if requests:
-        try:
-            body = {'requests': requests}
-            sheets_service.spreadsheets().batchUpdate(
-                spreadsheetId=spreadsheet_id, body=body).execute()
-            return True
-        except HttpError as error:
-            st.error(f"An error occurred deleting rows from Spreadsheet: {error}")
-            return False
-        except Exception as e:
-            st.error(f"Unexpected error deleting rows: {e}")
-            return False
-    return True# # google_utils.py
-def update_spreadsheet_from_df(sheets_service, spreadsheet_id, df_to_write):
+        } for first, last in reversed(_row_blocks(row_positions))]
+        _execute(sheets_service.spreadsheets().batchUpdate(
+            spreadsheetId=spreadsheet_id, body={'requests': requests}, fields='spreadsheetId'), "sheets.spreadsheets.batchUpdate")
+        get_record_row_index().remove_rows(spreadsheet_id, [position + 2 for position in row_positions])
+        get_group_row_index().remove_rows(spreadsheet_id, [position + 2 for position in row_positions])
+        get_sheet_write_listeners().notify(spreadsheet_id, "delete")
+        return True
+    except HttpError as error:
+        get_sheet_metadata_cache().invalidate(spreadsheet_id) # The GID may be stale
+        get_record_row_index().invalidate(spreadsheet_id)
+        get_group_row_index().invalidate(spreadsheet_id)
+        st.error(f"An error occurred deleting rows from Spreadsheet: {error}")
+        return False
+    except Exception as e:
+        st.error(f"Unexpected error deleting rows: {e}")
+        return False
+
+# # google_utils.py
+def _column_letter(col_index):
+    """0-based column index -> A1 column letters (0 -> 'A', 26 -> 'AA')."""
+    letters = ""
+    col_index += 1
+    while col_index:
+        col_index, remainder = divmod(col_index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+def _sheet_value_array(df):
+    """Data rows of `df` exactly as dataframe_to_sheet_values would write them, as a 2-D object array."""
+    rows = dataframe_to_sheet_values(df)[1:]
+    values = np.empty((len(rows), len(df.columns)), dtype=object)
+    values[:] = rows
+    return values
+
+def _row_blocks(row_positions):
+    """Coalesces sorted data-row positions into (first, last) runs of consecutive rows."""
+    blocks = []
+    for position in row_positions:
+        if blocks and position == blocks[-1][1] + 1:
+            blocks[-1][1] = position
+        else:
+            blocks.append([position, position])
+    return [tuple(block) for block in blocks]
+
+def changed_cell_runs(base_values, new_values):
+    """(row_position, first_col, last_col) for every run of adjacent changed cells within a row."""
+    changed = base_values != new_values
+    runs = []
+    for row_position in np.flatnonzero(changed.any(axis=1)):
+        changed_cols = np.flatnonzero(changed[row_position])
+        for run in np.split(changed_cols, np.flatnonzero(np.diff(changed_cols) > 1) + 1):
+            runs.append((int(row_position), int(run[0]), int(run[-1])))
+    return runs
+
+def _current_rows_match_base(sheets_service, spreadsheet_id, sheet_title, row_positions, base_df, base_values, typed, sheet_rows=None):
+    """
+    Re-reads the given data rows (one batchGet) and checks they still hold what `base_df` was read with.
+    `sheet_rows` maps a base position to the sheet row to check (default: where it was read, position + 2).
+    """
+    sheet_rows = sheet_rows or {position: position + 2 for position in row_positions} # Data row 0 is sheet row 2
+    blocks = _row_blocks(sorted({sheet_rows[position] for position in row_positions}))
+    last_col = _column_letter(len(base_df.columns) - 1)
+    response = _execute(sheets_service.spreadsheets().values().batchGet(
+        spreadsheetId=spreadsheet_id,
+        ranges=[f"{sheet_title}!A{first}:{last_col}{last}" for first, last in blocks],
+        fields='valueRanges(values)',
+        **_read_render_options(typed)
+    ), "sheets.values.batchGet")
+    rows_by_sheet_row = {}
+    for (first, last), value_range in zip(blocks, response.get('valueRanges', [])):
+        rows = value_range.get('values', [])
+        for offset in range(last - first + 1):
+            rows_by_sheet_row[first + offset] = rows[offset] if offset < len(rows) else [] # Trailing empty rows are omitted
+    current = fixed_width_frame([rows_by_sheet_row[sheet_rows[position]] for position in row_positions], base_df.columns)
+    if typed:
+        current = apply_sheet_schema(current)
+    # base_values rows follow base_df's order; its index holds the data positions (a group-only read is sparse)
+    return bool((_sheet_value_array(current) == base_values[base_df.index.get_indexer(list(row_positions))]).all())
+
+def _locate_base_rows(sheets_service, spreadsheet_id, sheet_title, base_df, base_values, row_positions, typed):
+    """
+    Where the given base rows are now, as {position: sheet_row}, or None if any of them changed. Rows
+    with a record ID are found through the record index wherever they have moved (rebuilding it once
+    if it is stale); rows without one are expected at the position they were read from.
+    """
+    record_ids = {}
+    if RECORD_ID_COLUMN in base_df.columns:
+        record_ids = {position: record_id for position, record_id in zip(row_positions, base_df[RECORD_ID_COLUMN].iloc[row_positions])
+                      if isinstance(record_id, str) and record_id}
+    for refresh in (False, True):
+        rows_by_id = {}
+        if record_ids:
+            rows_by_id = (None if refresh else get_record_row_index().get(spreadsheet_id)) or _load_record_rows(sheets_service, spreadsheet_id, sheet_title)
+        sheet_rows = {position: rows_by_id.get(record_ids.get(position), position + 2) for position in row_positions}
+        if _current_rows_match_base(sheets_service, spreadsheet_id, sheet_title, row_positions, base_df, base_values, typed, sheet_rows):
+            return sheet_rows
+        if not record_ids:
+            return None
+    return None
+
+def _sheet_matches_base(sheets_service, spreadsheet_id, sheet_title, base_df, base_values, typed):
+    """Whole-sheet variant of the conflict check, used before a full rewrite."""
+    result = _execute(sheets_service.spreadsheets().values().get(
+        spreadsheetId=spreadsheet_id, range=sheet_title, fields='values', **_read_render_options(typed)
+    ), "sheets.values.get")
+    values = result.get('values', [])
+    current = fixed_width_frame(values[1:], base_df.columns) if values else pd.DataFrame(columns=base_df.columns)
+    if typed:
+        current = apply_sheet_schema(current)
+    current_values = _sheet_value_array(current)
+    return current_values.shape == base_values.shape and bool((current_values == base_values).all())
+
+def update_spreadsheet_from_df(sheets_service, spreadsheet_id, df_to_write, base_df=None, typed=False):
     """
-    Clears the first sheet in a spreadsheet and updates it with data from a pandas DataFrame.
+    Writes a pandas DataFrame (with its header row) to the first sheet in a spreadsheet.
+
+    With `base_df` - the DataFrame as it was last read from the sheet, `typed` as used for that read -
+    only the cells that differ from it are sent, in a single values.batchUpdate, after checking that
+    the rows being changed still hold what was read; rows with a record ID are written wherever they
+    have moved since (rows added or deleted by others do not conflict). Changed columns, added/removed rows or a missing
+    base fall back to clearing and rewriting the sheet (with a base, only if the sheet is unchanged).
+    If someone else modified the sheet in the meantime nothing is written and the conflict is reported.
 
     Args:
         sheets_service: The authenticated Google Sheets service object.
         spreadsheet_id (str): The ID of the spreadsheet to update.
         df_to_write (pd.DataFrame): The DataFrame containing the new data.
+        base_df (pd.DataFrame, optional): Snapshot of the sheet the edits were made against.
+        typed (bool): Whether `base_df` came from read_from_spreadsheet(typed=True).
 
     Returns:
         bool: True if successful, False otherwise.
     """
     try:
         # Get the title of the first sheet, which is the target for clearing and updating
-        sheet_metadata = sheets_service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
-        first_sheet_title = sheet_metadata['sheets'][0]['properties']['title']
+        first_sheet_title = get_first_sheet_info(sheets_service, spreadsheet_id)['title']
+        conflict_message = ("The spreadsheet was modified by someone else after it was loaded. "
+                            "Nothing was saved; please reload the data and re-apply your changes.")
+
+        structure_unchanged = (
+            base_df is not None
+            and list(base_df.columns) == list(df_to_write.columns)
+            and base_df.index.equals(pd.RangeIndex(len(base_df))) # Index = data-row position in the sheet
+            and base_df.index.equals(df_to_write.index)
+        )
+        base_values = _sheet_value_array(base_df) if base_df is not None else None
+
+        if structure_unchanged:
+            runs = changed_cell_runs(base_values, _sheet_value_array(df_to_write))
+            if not runs:
+                return True # Nothing changed
+            sheet_rows = _locate_base_rows(sheets_service, spreadsheet_id, first_sheet_title, base_df, base_values,
+                                           sorted({row for row, _, _ in runs}), typed)
+            if sheet_rows is None:
+                st.error(conflict_message)
+                return False
+            new_values = _sheet_value_array(df_to_write)
+            data = [{
+                'range': f"{first_sheet_title}!{_column_letter(first_col)}{sheet_rows[row]}:{_column_letter(last_col)}{sheet_rows[row]}",
+                'values': [new_values[row, first_col:last_col + 1].tolist()],
+            } for row, first_col, last_col in runs]
+            _execute(sheets_service.spreadsheets().values().batchUpdate(
+                spreadsheetId=spreadsheet_id,
+                body={'valueInputOption': 'USER_ENTERED', 'data': data},
+                fields='totalUpdatedCells'
+            ), "sheets.values.batchUpdate")
+            if GROUP_COLUMN in df_to_write.columns:
+                group_col = list(df_to_write.columns).index(GROUP_COLUMN)
+                if any(first_col <= group_col <= last_col for _, first_col, last_col in runs):
+                    get_group_row_index().invalidate(spreadsheet_id) # A row moved to another group
+            get_sheet_write_listeners().notify(spreadsheet_id, "update")
+            return True
+
+        # Structural change (or no snapshot to diff against): full rewrite
+        if base_df is not None and not _sheet_matches_base(sheets_service, spreadsheet_id, first_sheet_title, base_df, base_values, typed):
+            st.error(conflict_message)
+            return False
 
         # Step 1: Clear the entire sheet to remove old data
         clear_range = f"{first_sheet_title}"
-        sheets_service.spreadsheets().values().clear(
+        _execute(sheets_service.spreadsheets().values().clear(
             spreadsheetId=spreadsheet_id,
-            range=clear_range
-        ).execute()
+            range=clear_range,
+            fields='clearedRange'
+        ), "sheets.values.clear")
 
         # Step 2: Prepare the DataFrame for writing
-        # Replace NaN/NaT values with empty strings, as the API handles them better
-        df_prepared = df_to_write.fillna('')
-        # Convert the DataFrame (including headers) to a list of lists
-        values_to_write = [df_prepared.columns.values.tolist()] + df_prepared.values.tolist()
+        # Replace NaN/NaT values with empty strings, as the API handles them better.
+        # Typed reads (categorical/datetime/nullable int columns) are converted to plain values.
+        values_to_write = dataframe_to_sheet_values(df_to_write)
 
         # Step 3: Write the new data to the sheet starting from cell A1
         update_range = f"{first_sheet_title}!A1"
         body = {'values': values_to_write}
-        sheets_service.spreadsheets().values().update(
+        _execute(sheets_service.spreadsheets().values().update(
             spreadsheetId=spreadsheet_id,
             range=update_range,
             valueInputOption='USER_ENTERED',
-            body=body
-        ).execute()
+            body=body,
+            fields='updatedCells'
+        ), "sheets.values.update")
+        get_record_row_index().invalidate(spreadsheet_id)
+        get_group_row_index().invalidate(spreadsheet_id)
+        get_sheet_write_listeners().notify(spreadsheet_id, "rewrite")
+        if len(df_to_write.columns):
+            get_sheet_metadata_cache().mark_header_written(spreadsheet_id, [str(col) for col in df_to_write.columns])
+        else: # Sheet was only cleared
+            get_sheet_metadata_cache().invalidate(spreadsheet_id)
         
         return True
 
     except HttpError as error:
+        get_sheet_metadata_cache().invalidate(spreadsheet_id)
         st.error(f"An API error occurred while updating the Spreadsheet: {error}")
         return False
     except Exception as e:
+        get_sheet_metadata_cache().invalidate(spreadsheet_id)
         st.error(f"An unexpected error occurred while updating the Spreadsheet: {e}")
         return False
+
+def write_dataframe_to_sheet_tab(sheets_service, spreadsheet_id, tab_title, df_to_write):
+    """
+    Writes a DataFrame (with header row) to a named tab, creating the tab if needed and replacing
+    its previous contents. The first sheet (the period's para data) is never touched.
+
+    Returns:
+        bool: True if successful, False otherwise.
+    """
+    try:
+        sheet_metadata = _execute(sheets_service.spreadsheets().get(
+            spreadsheetId=spreadsheet_id, fields='sheets.properties.title'
+        ), "sheets.spreadsheets.get")
+        existing_titles = [sh['properties']['title'] for sh in sheet_metadata.get('sheets', [])]
+        if tab_title not in existing_titles:
+            _execute(sheets_service.spreadsheets().batchUpdate(
+                spreadsheetId=spreadsheet_id,
+                body={'requests': [{'addSheet': {'properties': {'title': tab_title}}}]},
+                fields='spreadsheetId'
+            ), "sheets.spreadsheets.batchUpdate")
+        else:
+            _execute(sheets_service.spreadsheets().values().clear(spreadsheetId=spreadsheet_id, range=f"'{tab_title}'", fields='clearedRange'), "sheets.values.clear")
+
+        values_to_write = dataframe_to_sheet_values(df_to_write)
+        _execute(sheets_service.spreadsheets().values().update(
+            spreadsheetId=spreadsheet_id,
+            range=f"'{tab_title}'!A1",
+            valueInputOption='RAW',
+            body={'values': values_to_write},
+            fields='updatedCells'
+        ), "sheets.values.update")
+        return True
+    except HttpError as error:
+        st.error(f"An error occurred writing tab '{tab_title}': {error}")
+        return False
+    except Exception as e:
+        st.error(f"Unexpected error writing tab '{tab_title}': {e}")
+        return False
+
+def _is_missing_tab_error(error):
+    return error.resp.status == 400 and 'Unable to parse range' in str(error)
+
+def read_keyed_tab(sheets_service, spreadsheet_id, tab_title):
+    """
+    Reads a small tab whose first column is a key (e.g. the MCM decisions tab).
+
+    Returns:
+        dict: {key: (sheet_row_number, row_values)} for the data rows, {} if the tab does not exist
+              yet, or None if the read failed (the error is reported).
+    """
+    try:
+        result = _execute(sheets_service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id, range=f"'{tab_title}'", fields='values'
+        ), "sheets.values.get")
+    except HttpError as error:
+        if _is_missing_tab_error(error):
+            return {}
+        st.error(f"An error occurred reading tab '{tab_title}': {error}")
+        return None
+    except Exception as e:
+        st.error(f"Unexpected error reading tab '{tab_title}': {e}")
+        return None
+    keyed_rows = {}
+    for sheet_row_number, row in enumerate(result.get('values', [])[1:], start=2): # Row 1 is the header
+        if row and row[0]:
+            keyed_rows[str(row[0])] = (sheet_row_number, row)
+    return keyed_rows
+
+def _first_row_of_range(a1_range):
+    # "'MCM Decisions'!A5:D7" -> 5
+    cell_part = a1_range.rsplit('!', 1)[-1].split(':')[0]
+    return int(''.join(ch for ch in cell_part if ch.isdigit()))
+
+def upsert_keyed_rows(sheets_service, spreadsheet_id, tab_title, header, rows_by_key, existing):
+    """
+    Writes `rows_by_key` ({key: [key, ...values]}) to a keyed tab. Keys already in `existing` (from
+    read_keyed_tab) are overwritten in place with one values.batchUpdate; new keys are appended in
+    one values.append, creating the tab with `header` on first use. Only the given rows are sent.
+    `existing` is updated in place with the rows written.
+
+    Returns:
+        bool: True if successful, False otherwise.
+    """
+    last_col = _column_letter(len(header) - 1)
+    updates = {key: row for key, row in rows_by_key.items() if key in existing}
+    new_rows = [(key, row) for key, row in rows_by_key.items() if key not in existing]
+    try:
+        if updates:
+            _execute(sheets_service.spreadsheets().values().batchUpdate(
+                spreadsheetId=spreadsheet_id,
+                body={'valueInputOption': 'RAW', 'data': [
+                    {'range': f"'{tab_title}'!A{existing[key][0]}:{last_col}{existing[key][0]}", 'values': [row]}
+                    for key, row in updates.items()
+                ]},
+                fields='totalUpdatedCells'
+            ), "sheets.values.batchUpdate")
+            for key, row in updates.items():
+                existing[key] = (existing[key][0], row)
+        if new_rows:
+            values_to_append = [row for _, row in new_rows]
+            first_data_offset = 0
+            try:
+                append_result = _execute(sheets_service.spreadsheets().values().append(
+                    spreadsheetId=spreadsheet_id, range=f"'{tab_title}'!A1", valueInputOption='RAW',
+                    body={'values': values_to_append}, fields='updates(updatedRange)'
+                ), "sheets.values.append")
+            except HttpError as error:
+                if not _is_missing_tab_error(error):
+                    raise
+                _execute(sheets_service.spreadsheets().batchUpdate(
+                    spreadsheetId=spreadsheet_id,
+                    body={'requests': [{'addSheet': {'properties': {'title': tab_title}}}]},
+                    fields='spreadsheetId'
+                ), "sheets.spreadsheets.batchUpdate")
+                append_result = _execute(sheets_service.spreadsheets().values().append(
+                    spreadsheetId=spreadsheet_id, range=f"'{tab_title}'!A1", valueInputOption='RAW',
+                    body={'values': [header] + values_to_append}, fields='updates(updatedRange)'
+                ), "sheets.values.append")
+                first_data_offset = 1
+            first_row = _first_row_of_range(append_result['updates']['updatedRange']) + first_data_offset
+            for position, (key, row) in enumerate(new_rows):
+                existing[key] = (first_row + position, row)
+        return True
+    except HttpError as error:
+        st.error(f"An error occurred writing to tab '{tab_title}': {error}")
+        return False
+    except Exception as e:
+        st.error(f"Unexpected error writing to tab '{tab_title}': {e}")
+        return False
@@ -0,0 +1,392 @@
+# job_scheduler.py
+import os
+import json
+import logging
+import threading
+import time
+import uuid
+import math
+import datetime
+import calendar
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from config import EXTRACTION_MAX_CONCURRENT_JOBS, EXTRACTION_DEADLINE_BOOST_DAYS, LOCAL_STATE_DIR
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+JOB_LOST = "lost"  # Persisted as queued/running, but the process that owned it has restarted
+FINISHED_JOB_STATES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+logger = logging.getLogger(__name__)
+
+DEADLINE_BOOST_LEVELS = 4  # Boost is bucketed so groups inside the same band still rotate fairly
+
+
+class ExtractionJob:
+    def __init__(self, group_key, fn, args, kwargs, deadline=None, priority=0, owner=None, label=None, cancel_event=None,
+                 persist=False, context=None):
+        self.job_id = uuid.uuid4().hex
+        self.group_key = group_key
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.deadline = deadline  # Epoch seconds, or None for no deadline
+        self.priority = priority
+        self.owner = owner
+        self.label = label
+        self.persist = persist
+        self.context = context or {}
+        self.status = JOB_QUEUED
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = cancel_event or threading.Event()
+        self._done_event = threading.Event()
+
+    def wait(self, timeout=None):
+        """Blocks until the job finishes or `timeout` elapses. Returns True if finished."""
+        return self._done_event.wait(timeout)
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_JOB_STATES
+
+    @property
+    def wait_seconds(self):
+        end = self.started_at or self.finished_at or time.time()
+        return max(0.0, end - self.submitted_at)
+
+    def to_record(self):
+        return {
+            "job_id": self.job_id, "group_key": self.group_key, "owner": self.owner, "label": self.label,
+            "context": self.context, "status": self.status, "result": self.result, "error": self.error,
+            "submitted_at": self.submitted_at, "started_at": self.started_at, "finished_at": self.finished_at,
+        }
+
+
+class JobResultStore:
+    """
+    JSON-file store for job records, so a result outlives the script run, the session and the process.
+    One file per job under `directory`; writes are atomic via os.replace.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def save(self, record):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            existing = self._read(record["job_id"]) or {}
+            self._write({**existing, **record, "consumed": existing.get("consumed", False)})
+
+    def _write(self, record):
+        tmp_path = self._path(record["job_id"]) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(record, fh, default=str)
+        os.replace(tmp_path, self._path(record["job_id"]))
+
+    def _read(self, job_id):
+        try:
+            with open(self._path(job_id), "r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def load(self, job_id):
+        with self._lock:
+            return self._read(job_id)
+
+    def mark_consumed(self, job_id):
+        with self._lock:
+            record = self._read(job_id)
+            if record is None:
+                return
+            record["consumed"] = True
+            self._write(record)
+
+    def latest_for_owner(self, owner, unconsumed_only=True):
+        with self._lock:
+            if not os.path.isdir(self.directory):
+                return None
+            candidates = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(".json"):
+                    continue
+                record = self._read(name[:-5])
+                if record and record.get("owner") == owner and not (unconsumed_only and record.get("consumed")):
+                    candidates.append(record)
+            return max(candidates, key=lambda r: r.get("submitted_at") or 0, default=None)
+
+    def prune(self, max_age_seconds=7 * 86400):
+        cutoff = time.time() - max_age_seconds
+        with self._lock:
+            if not os.path.isdir(self.directory):
+                return
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+
+class FairShareScheduler:
+    """
+    In-process scheduler for extraction jobs.
+
+    Every group gets its own FIFO queue. When a worker slot frees up, the next job is taken from
+    the group whose head job has the highest effective priority (base priority plus a deadline
+    boost), breaking ties in favour of the group with the fewest running jobs and then the group
+    served least recently. A single group uploading many DARs therefore cannot starve the rest.
+    """
+
+    def __init__(self, max_concurrent=EXTRACTION_MAX_CONCURRENT_JOBS, boost_window_days=EXTRACTION_DEADLINE_BOOST_DAYS, result_store=None):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.result_store = result_store
+        self.boost_window_seconds = max(1, boost_window_days) * 86400
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix="emcm-extract")
+        self._queues = {}  # group_key -> deque of queued jobs
+        self._running_by_group = {}
+        self._running_total = 0
+        self._last_served = {}  # group_key -> dispatch sequence number
+        self._dispatch_seq = 0
+        self._jobs = {}
+        self._wait_samples = deque(maxlen=500)  # Recent queue wait times in seconds
+        self._completed_count = 0
+        self._failed_count = 0
+        self._cancelled_count = 0
+
+    # --- Public API ---
+    def submit(self, group_key, fn, args=(), kwargs=None, deadline=None, priority=0, owner=None, label=None, cancel_event=None,
+               persist=False, context=None):
+        """
+        Queues `fn(*args, **kwargs)` for `group_key` and returns its job ID.
+        With persist=True the job record (and later its result) is written to the result store.
+        """
+        job = ExtractionJob(group_key, fn, tuple(args), dict(kwargs or {}), deadline=deadline, priority=priority,
+                            owner=owner, label=label, cancel_event=cancel_event, persist=persist, context=context)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._queues.setdefault(group_key, deque()).append(job)
+        self._persist(job)
+        self._dispatch()
+        return job.job_id
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def job_snapshot(self, job_id):
+        """Job record from the live registry, falling back to the result store (e.g. after a restart)."""
+        job = self.get(job_id)
+        if job is not None:
+            return job.to_record()
+        if self.result_store is None:
+            return None
+        record = self.result_store.load(job_id)
+        if record and record.get("status") not in FINISHED_JOB_STATES:
+            record["status"] = JOB_LOST
+        return record
+
+    def latest_job_for_owner(self, owner):
+        """Most recent persisted job of `owner` whose result has not been consumed yet."""
+        if self.result_store is None or not owner:
+            return None
+        record = self.result_store.latest_for_owner(owner)
+        return self.job_snapshot(record["job_id"]) if record else None
+
+    def mark_consumed(self, job_id):
+        if self.result_store is not None and job_id:
+            self.result_store.mark_consumed(job_id)
+
+    def cancel(self, job_id):
+        """Cancels a queued job outright; a running job is only signalled through its cancel_event."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return False
+            job.cancel_event.set()
+            if job.status == JOB_QUEUED:
+                queue = self._queues.get(job.group_key)
+                if queue and job in queue:
+                    queue.remove(job)
+                self._finish_locked(job, JOB_CANCELLED)
+        self._persist(job)
+        return True
+
+    def queue_position(self, job_id):
+        """Number of queued jobs (all groups) that would currently be dispatched before this one."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != JOB_QUEUED:
+                return 0
+            now = time.time()
+            job_key = self._sort_key_locked(job, now, position_in_group=list(self._queues[job.group_key]).index(job))
+            ahead = 0
+            for group_key, queue in self._queues.items():
+                for pos, other in enumerate(queue):
+                    if other is not job and self._sort_key_locked(other, now, position_in_group=pos) < job_key:
+                        ahead += 1
+            return ahead
+
+    def forget_finished(self, max_age_seconds=3600):
+        """Drops finished jobs older than `max_age_seconds` from the in-memory registry."""
+        cutoff = time.time() - max_age_seconds
+        with self._lock:
+            for job_id in [jid for jid, j in self._jobs.items() if j.finished and (j.finished_at or 0) < cutoff]:
+                del self._jobs[job_id]
+
+    def metrics(self):
+        with self._lock:
+            now = time.time()
+            queued_by_group = {g: len(q) for g, q in self._queues.items() if q}
+            oldest_wait = max((now - q[0].submitted_at for q in self._queues.values() if q), default=0.0)
+            waits = sorted(self._wait_samples)
+            return {
+                "max_concurrent": self.max_concurrent,
+                "running": self._running_total,
+                "queued": sum(queued_by_group.values()),
+                "queued_by_group": queued_by_group,
+                "running_by_group": {g: n for g, n in self._running_by_group.items() if n},
+                "oldest_queued_wait_s": oldest_wait,
+                "avg_wait_s": (sum(waits) / len(waits)) if waits else 0.0,
+                "p95_wait_s": waits[min(len(waits) - 1, int(math.ceil(0.95 * len(waits))) - 1)] if waits else 0.0,
+                "max_wait_s": waits[-1] if waits else 0.0,
+                "completed": self._completed_count,
+                "failed": self._failed_count,
+                "cancelled": self._cancelled_count,
+            }
+
+    # --- Internals ---
+    def _persist(self, job):
+        if job.persist and self.result_store is not None:
+            try:
+                self.result_store.save(job.to_record())
+            except (OSError, TypeError, ValueError) as e:
+                logger.error("Could not persist job %s: %s", job.job_id, e)
+
+    def _deadline_level(self, job, now):
+        if job.deadline is None:
+            return 0
+        remaining = job.deadline - now
+        if remaining <= 0:
+            return DEADLINE_BOOST_LEVELS
+        if remaining >= self.boost_window_seconds:
+            return 0
+        return int(math.ceil((1.0 - remaining / self.boost_window_seconds) * DEADLINE_BOOST_LEVELS))
+
+    def _sort_key_locked(self, job, now, position_in_group=0):
+        # Lower sorts first: highest effective priority, then least busy group, then least recently served.
+        return (-(job.priority + self._deadline_level(job, now)),
+                position_in_group,
+                self._running_by_group.get(job.group_key, 0),
+                self._last_served.get(job.group_key, -1),
+                job.submitted_at)
+
+    def _pick_next_locked(self, now):
+        best_job, best_key = None, None
+        for queue in self._queues.values():
+            if not queue:
+                continue
+            key = self._sort_key_locked(queue[0], now)
+            if best_key is None or key < best_key:
+                best_job, best_key = queue[0], key
+        return best_job
+
+    def _dispatch(self):
+        to_start = []
+        with self._lock:
+            now = time.time()
+            while self._running_total < self.max_concurrent:
+                job = self._pick_next_locked(now)
+                if job is None:
+                    break
+                self._queues[job.group_key].popleft()
+                job.status = JOB_RUNNING
+                job.started_at = time.time()
+                self._wait_samples.append(job.started_at - job.submitted_at)
+                self._running_total += 1
+                self._running_by_group[job.group_key] = self._running_by_group.get(job.group_key, 0) + 1
+                self._dispatch_seq += 1
+                self._last_served[job.group_key] = self._dispatch_seq
+                to_start.append(job)
+        for job in to_start:
+            self._executor.submit(self._run, job)
+
+    def _run(self, job):
+        final_status, result, error = JOB_DONE, None, None
+        try:
+            if job.cancel_event.is_set():
+                final_status = JOB_CANCELLED
+            else:
+                result = job.fn(*job.args, **job.kwargs)
+                if job.cancel_event.is_set():
+                    final_status = JOB_CANCELLED
+        except Exception as e:
+            final_status, error = JOB_FAILED, f"{type(e).__name__}: {e}"
+        with self._lock:
+            self._running_total -= 1
+            self._running_by_group[job.group_key] = max(0, self._running_by_group.get(job.group_key, 1) - 1)
+            job.result = result
+            job.error = error
+            self._finish_locked(job, final_status)
+        self._persist(job)
+        self._dispatch()
+
+    def _finish_locked(self, job, status):
+        job.status = status
+        job.finished_at = time.time()
+        if status == JOB_DONE:
+            self._completed_count += 1
+        elif status == JOB_FAILED:
+            self._failed_count += 1
+        else:
+            self._cancelled_count += 1
+        job._done_event.set()
+
+
+@st.cache_resource
+def get_io_executor():
+    """Process-wide thread pool for network-bound side work (Drive uploads etc.) that should not take an extraction slot."""
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="emcm-io")
+
+
+@st.cache_resource
+def get_extraction_scheduler():
+    """Process-wide scheduler shared by every session."""
+    store = JobResultStore(os.path.join(LOCAL_STATE_DIR, "jobs"))
+    store.prune()
+    return FairShareScheduler(result_store=store)
+
+
+def period_deadline(mcm_period_info):
+    """
+    Deadline (epoch seconds) used for priority boosting of a period's extraction jobs.
+    Uses the optional 'mcm_deadline' (YYYY-MM-DD) from the period config, otherwise the end of the period month.
+    """
+    if not mcm_period_info:
+        return None
+    explicit = mcm_period_info.get("mcm_deadline")
+    try:
+        if explicit:
+            deadline_date = datetime.datetime.strptime(explicit, "%Y-%m-%d")
+        else:
+            year, month = int(mcm_period_info.get("year")), int(mcm_period_info.get("month_num"))
+            deadline_date = datetime.datetime(year, month, calendar.monthrange(year, month)[1])
+    except (TypeError, ValueError):
+        return None
+    return (deadline_date + datetime.timedelta(days=1)).timestamp()  # End of the deadline day
@@ -0,0 +1,353 @@
+# period_mirror.py
+import os
+import re
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+import streamlit as st
+
+from config import LOCAL_STATE_DIR, MIRROR_TAIL_SYNC_SECONDS, MIRROR_FULL_RESYNC_SECONDS, PERIOD_FRAME_CACHE_ENTRIES
+from google_utils import (
+    SHEET_COLUMNS, GROUP_COLUMN, apply_sheet_schema, concat_sheet_chunks, fixed_width_frame, iter_spreadsheet_chunks, read_rows_from,
+    read_group_rows, get_first_sheet_info, get_sheet_write_listeners, get_drive_revision, get_revision_check_stats
+)
+
+INDEXED_COLUMNS = ["Audit Group Number", "Audit Circle Number", "GSTIN", "Trade Name"]
+WATERMARK_COLUMN = "Record Created Date"
+# Handing every session a shallow copy of one shared frame is only safe under copy-on-write (always on from
+# pandas 3). On an older pandas an in-place edit in one session would show up in all of them, so copy deep.
+COPY_SHARED_FRAMES_DEEP = int(pd.__version__.split(".")[0]) < 3
+
+
+def _quoted(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _db_values(df):
+    """Rows of a sheet DataFrame (SHEET_COLUMNS order) as plain tuples, missing cells as None."""
+    df = df.reindex(columns=SHEET_COLUMNS)
+    return [tuple(row) for row in df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)]
+
+
+def _latest_created(df):
+    created = pd.to_datetime(df[WATERMARK_COLUMN], errors='coerce', format='mixed') if WATERMARK_COLUMN in df.columns else pd.Series(dtype='datetime64[ns]')
+    return created.max() if created.notna().any() else None
+
+
+class PeriodMirror:
+    """
+    Local SQLite copy of the period spreadsheets: one table per period holding the first tab's rows as
+    read (formatted values, blank rows included), keyed by sheet row, with indexes on group, circle,
+    GSTIN and trade name. Dashboards query it instead of reading the sheet on every run.
+
+    A stale period is brought up to date with one read of the rows from the last mirrored row down:
+    that row must still match, and new rows must not be older than the Record Created Date watermark,
+    otherwise the period is re-read in full (streamed chunk by chunk into a shadow table that then
+    replaces the live one). Writes made through google_utils mark the period stale ("append") or in
+    need of a full re-read (edits and deletes) via the sheet write listeners; edits made directly in
+    Google Sheets are picked up by the periodic full re-read.
+
+    Whole-period queries are served from a process-wide cache of the built DataFrames, so concurrent
+    sessions share one copy: each caller gets a shallow copy, which copy-on-write keeps independent of
+    the cached frame. A tail sync patches the cached frames with the new rows; a full re-read or a
+    non-append write drops them.
+    """
+
+    def __init__(self, db_path, tail_sync_seconds=MIRROR_TAIL_SYNC_SECONDS, full_resync_seconds=MIRROR_FULL_RESYNC_SECONDS,
+                 frame_cache_entries=PERIOD_FRAME_CACHE_ENTRIES):
+        self.db_path = db_path
+        self.tail_sync_seconds = tail_sync_seconds
+        self.full_resync_seconds = full_resync_seconds
+        self.frame_cache_entries = frame_cache_entries
+        self._frames = OrderedDict()  # (period_key, typed) -> (spreadsheet_id, DataFrame), least recently used first
+        self.frame_hits = 0
+        self.frame_misses = 0
+        self._lock = threading.Lock()  # Guards the connection
+        self._period_locks = {}
+        self._stale = set()  # spreadsheet IDs written to by this app since their last sync
+        self._needs_full = set()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS mirror_periods (
+                    period_key TEXT PRIMARY KEY,
+                    spreadsheet_id TEXT NOT NULL,
+                    columns_json TEXT NOT NULL,
+                    mirrored_rows INTEGER NOT NULL,
+                    watermark TEXT,
+                    synced_at REAL NOT NULL,
+                    full_synced_at REAL NOT NULL,
+                    revision TEXT
+                )""")
+            if "revision" not in [column[1] for column in self._conn.execute("PRAGMA table_info(mirror_periods)")]:
+                self._conn.execute("ALTER TABLE mirror_periods ADD COLUMN revision TEXT")  # Mirrors created before revision checks
+
+    # --- Public API ---
+    def on_sheet_write(self, spreadsheet_id, kind):
+        """Sheet write listener: appends only need the new rows, other writes a full re-read."""
+        with self._lock:
+            (self._stale if kind == "append" else self._needs_full).add(spreadsheet_id)
+            if kind != "append":
+                self._drop_frames(spreadsheet_id=spreadsheet_id)
+
+    def has_period(self, period_key):
+        return self._state(period_key) is not None
+
+    def sync(self, sheets_service, period_key, spreadsheet_id, force_full=False, on_chunk=None, allow_full=True, drive_service=None):
+        """
+        Brings one period up to date if it is stale (a no-op otherwise). `on_chunk(df)` is called with
+        each chunk of a full re-read, for progress display. With allow_full=False nothing is read when
+        only a full re-read would do. Given a `drive_service`, a period that is only due by age is
+        first checked against the spreadsheet's Drive revision and not read at all if it is unchanged.
+        Returns True if the mirrored copy is current. API errors propagate; the previous copy is left intact.
+        """
+        with self._period_lock(period_key):
+            state = self._state(period_key)
+            now = time.time()
+            with self._lock:
+                needs_full = spreadsheet_id in self._needs_full
+                stale = spreadsheet_id in self._stale
+            full_needed = force_full or needs_full or state is None or state["spreadsheet_id"] != spreadsheet_id
+            full_due = full_needed or now - state["full_synced_at"] > self.full_resync_seconds
+            if not full_due and not stale and now - state["synced_at"] <= self.tail_sync_seconds:
+                return True
+            known_changed = full_needed or stale
+            revision = None
+            if drive_service is not None:
+                revision = get_drive_revision(drive_service, spreadsheet_id)  # Taken before reading: a write during the read changes it
+                if not known_changed:
+                    unchanged = state["revision"] is not None and state["revision"] == revision
+                    get_revision_check_stats().record("sheet", unchanged)
+                    if unchanged:
+                        self._mark_checked(period_key, full=full_due)
+                        return True
+            if full_due:
+                if not allow_full:
+                    return False
+                self._sync_full(sheets_service, period_key, spreadsheet_id, on_chunk, revision)
+            elif state["mirrored_rows"] == 0 or not self._sync_tail(sheets_service, period_key, spreadsheet_id, state, revision):
+                if not allow_full:
+                    with self._lock:
+                        self._needs_full.add(spreadsheet_id)  # The tail did not line up; the next full reader re-reads
+                    return False
+                self._sync_full(sheets_service, period_key, spreadsheet_id, on_chunk, revision)
+            return True
+
+    def query(self, period_key, filters=None, typed=False):
+        """
+        The mirrored rows of a period as a DataFrame indexed by data-row position (as read_from_spreadsheet).
+        `filters` maps a column to a value or list of values (compared as the sheet shows them, e.g. "7").
+        Unfiltered queries are served from the shared frame cache.
+        """
+        if not filters:
+            return self._shared_frame(period_key, typed).copy(deep=COPY_SHARED_FRAMES_DEEP)
+        return self._select(period_key, filters, typed)
+
+    def _select(self, period_key, filters=None, typed=False, after_sheet_row=None):
+        clauses, params = [], []
+        if after_sheet_row is not None:
+            clauses.append("sheet_row > ?")
+            params.append(after_sheet_row)
+        for column, wanted in (filters or {}).items():
+            wanted = [str(value) for value in wanted] if isinstance(wanted, (list, tuple, set)) else [str(wanted)]
+            clauses.append(f"{_quoted(column)} IN ({', '.join('?' * len(wanted))})")
+            params.extend(wanted)
+        sql = f"SELECT * FROM {_quoted(self._table_name(period_key))}"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        with self._lock:
+            df = pd.read_sql_query(sql + " ORDER BY sheet_row", self._conn, params=params)
+        df.index = pd.Index(df.pop("sheet_row") - 2)  # Data row 0 is sheet row 2
+        return apply_sheet_schema(df) if typed else df
+
+    def status(self):
+        with self._lock:
+            return [dict(zip(("period_key", "mirrored_rows", "synced_at", "full_synced_at"), row)) for row in self._conn.execute(
+                "SELECT period_key, mirrored_rows, synced_at, full_synced_at FROM mirror_periods ORDER BY period_key DESC")]
+
+    def metrics(self):
+        periods = self.status()
+        with self._lock:
+            return {"periods": periods, "cached_frames": len(self._frames), "frame_hits": self.frame_hits, "frame_misses": self.frame_misses}
+
+    # --- Internals ---
+    def _shared_frame(self, period_key, typed):
+        with self._period_lock(period_key):  # One build per period, however many sessions ask at once
+            with self._lock:
+                cached = self._frames.get((period_key, typed))
+                if cached is not None:
+                    self._frames.move_to_end((period_key, typed))
+                    self.frame_hits += 1
+                    return cached[1]
+                self.frame_misses += 1
+            state = self._state(period_key)
+            df = self._select(period_key, typed=typed)
+            with self._lock:
+                self._frames[(period_key, typed)] = (state["spreadsheet_id"] if state else None, df)
+                while len(self._frames) > self.frame_cache_entries:
+                    self._frames.popitem(last=False)
+            return df
+
+    def _drop_frames(self, period_key=None, spreadsheet_id=None):
+        # Caller holds self._lock
+        for key in [key for key, (sheet_id, _) in self._frames.items() if key[0] == period_key or (spreadsheet_id is not None and sheet_id == spreadsheet_id)]:
+            del self._frames[key]
+
+    def _patch_frames(self, period_key, new_rows):
+        """Appends the rows a tail sync added (indexed by data-row position) to the cached frames of the period."""
+        with self._lock:
+            for typed in (False, True):
+                cached = self._frames.get((period_key, typed))
+                if cached is not None:
+                    patch = apply_sheet_schema(new_rows) if typed else new_rows
+                    self._frames[(period_key, typed)] = (cached[0], concat_sheet_chunks([cached[1], patch]))
+
+    def _period_lock(self, period_key):
+        with self._lock:
+            return self._period_locks.setdefault(period_key, threading.Lock())
+
+    @staticmethod
+    def _table_name(period_key):
+        return "period_" + re.sub(r"\W", "_", str(period_key))
+
+    def _state(self, period_key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT spreadsheet_id, columns_json, mirrored_rows, watermark, synced_at, full_synced_at, revision "
+                "FROM mirror_periods WHERE period_key = ?", (period_key,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("spreadsheet_id", "columns_json", "mirrored_rows", "watermark", "synced_at", "full_synced_at", "revision"), row))
+
+    def _insert(self, table, first_position, df):
+        placeholders = ", ".join("?" * (len(SHEET_COLUMNS) + 1))
+        rows = [(first_position + offset + 2,) + values for offset, values in enumerate(_db_values(df))]
+        with self._lock, self._conn:
+            self._conn.executemany(f"INSERT INTO {_quoted(table)} VALUES ({placeholders})", rows)
+
+    def _create_table(self, table):
+        columns = ", ".join(_quoted(col) for col in SHEET_COLUMNS)
+        with self._lock, self._conn:
+            self._conn.execute(f"DROP TABLE IF EXISTS {_quoted(table)}")
+            self._conn.execute(f"CREATE TABLE {_quoted(table)} (sheet_row INTEGER PRIMARY KEY, {columns})")
+
+    def _mark_checked(self, period_key, full=False):
+        # The sheet is unchanged since the last sync: the copy counts as freshly synced
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE mirror_periods SET synced_at = ?" + (", full_synced_at = ?" if full else "") + " WHERE period_key = ?",
+                               (now, now, period_key) if full else (now, period_key))
+
+    def _sync_full(self, sheets_service, period_key, spreadsheet_id, on_chunk=None, revision=None):
+        with self._lock:
+            self._stale.discard(spreadsheet_id)  # Cleared before reading, so a write from here on marks it again
+            self._needs_full.discard(spreadsheet_id)
+        table = self._table_name(period_key)
+        shadow = table + "__sync"
+        self._create_table(shadow)
+        sheet_title = get_first_sheet_info(sheets_service, spreadsheet_id)['title']
+        columns, mirrored_rows, watermark = list(SHEET_COLUMNS), 0, None
+        for chunk in iter_spreadsheet_chunks(sheets_service, spreadsheet_id, sheet_name=sheet_title):
+            if mirrored_rows == 0:
+                columns = list(chunk.columns)
+            self._insert(shadow, mirrored_rows, chunk)
+            mirrored_rows += len(chunk)
+            latest = _latest_created(chunk)
+            if latest is not None and (watermark is None or latest > watermark):
+                watermark = latest
+            if on_chunk is not None:
+                on_chunk(chunk)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(f"DROP TABLE IF EXISTS {_quoted(table)}")
+            self._conn.execute(f"ALTER TABLE {_quoted(shadow)} RENAME TO {_quoted(table)}")
+            for col in INDEXED_COLUMNS:
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS {_quoted(f'{table}__{col}')} ON {_quoted(table)} ({_quoted(col)})")
+            self._conn.execute("INSERT OR REPLACE INTO mirror_periods VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                               (period_key, spreadsheet_id, json.dumps(columns), mirrored_rows,
+                                watermark.isoformat() if watermark is not None else None, now, now, revision))
+            self._drop_frames(period_key=period_key)
+
+    def _sync_tail(self, sheets_service, period_key, spreadsheet_id, state, revision=None):
+        """Appends the rows added below the mirrored ones. Returns False if a full re-read is needed instead."""
+        with self._lock:
+            self._stale.discard(spreadsheet_id)
+        table = self._table_name(period_key)
+        columns = json.loads(state["columns_json"])
+        last_sheet_row = state["mirrored_rows"] + 1
+        rows = read_rows_from(sheets_service, spreadsheet_id, last_sheet_row)  # Last mirrored row + everything below
+        if not rows:
+            return False  # Even the last mirrored row is gone: rows were deleted
+        overlap = fixed_width_frame(rows[:1], columns)
+        with self._lock:
+            mirrored_last = self._conn.execute(f"SELECT * FROM {_quoted(table)} WHERE sheet_row = ?", (last_sheet_row,)).fetchone()
+        if mirrored_last is None or _db_values(overlap)[0] != tuple(mirrored_last[1:]):
+            return False  # Rows above were deleted, moved or edited
+        new_rows = fixed_width_frame(rows[1:], columns)
+        watermark = pd.Timestamp(state["watermark"]) if state["watermark"] else None
+        latest = _latest_created(new_rows) if len(new_rows) else None
+        if watermark is not None and len(new_rows):
+            created = pd.to_datetime(new_rows[WATERMARK_COLUMN], errors='coerce', format='mixed') if WATERMARK_COLUMN in new_rows.columns else pd.Series(dtype='datetime64[ns]')
+            if (created < watermark).any():
+                return False  # Older records below newer ones: the sheet was re-sorted or rows were moved
+        if len(new_rows):
+            self._insert(table, state["mirrored_rows"], new_rows)
+            self._patch_frames(period_key, self._select(period_key, after_sheet_row=last_sheet_row))
+        if latest is not None and (watermark is None or latest > watermark):
+            watermark = latest
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE mirror_periods SET mirrored_rows = ?, watermark = ?, synced_at = ?, revision = ? WHERE period_key = ?",
+                               (state["mirrored_rows"] + len(new_rows), watermark.isoformat() if watermark is not None else None,
+                                time.time(), revision, period_key))
+        return True
+
+
+@st.cache_resource
+def get_period_mirror():
+    """Process-wide mirror shared by every session, kept current by this app's own sheet writes."""
+    mirror = PeriodMirror(os.path.join(LOCAL_STATE_DIR, "period_mirror.sqlite3"))
+    get_sheet_write_listeners().add(mirror.on_sheet_write)
+    return mirror
+
+
+def read_period(sheets_service, period_key, spreadsheet_id, filters=None, typed=False, refresh=False, on_chunk=None, drive_service=None):
+    """
+    A period's rows from the local mirror, synced first if stale (with a Drive revision check first
+    when `drive_service` is given). If Google Sheets cannot be reached the last synced copy is served
+    with a warning. Returns None (error shown) if there is no copy.
+    """
+    mirror = get_period_mirror()
+    try:
+        mirror.sync(sheets_service, period_key, spreadsheet_id, force_full=refresh, on_chunk=on_chunk, drive_service=drive_service)
+    except Exception as e:
+        if not mirror.has_period(period_key):
+            st.error(f"An error occurred reading the period spreadsheet: {e}")
+            return None
+        st.warning(f"Could not refresh from Google Sheets ({e}); showing the last synced copy.")
+    return mirror.query(period_key, filters, typed)
+
+
+def read_group_period(sheets_service, period_key, spreadsheet_id, group_number, refresh=False, drive_service=None):
+    """
+    One audit group's rows of a period (formatted values, indexed by data-row position). Served from
+    the mirror while it is current or can be caught up from its tail; when only a full re-read of the
+    period would do (or on refresh), just the group's own rows are read from Sheets through the group
+    row index instead. Returns None (error shown) if neither works.
+    """
+    mirror = get_period_mirror()
+    try:
+        if not refresh and mirror.sync(sheets_service, period_key, spreadsheet_id, allow_full=False, drive_service=drive_service):
+            return mirror.query(period_key, {GROUP_COLUMN: group_number})
+        return read_group_rows(sheets_service, spreadsheet_id, group_number).reindex(columns=SHEET_COLUMNS)
+    except Exception as e:
+        if not mirror.has_period(period_key):
+            st.error(f"An error occurred reading the period spreadsheet: {e}")
+            return None
+        st.warning(f"Could not refresh from Google Sheets ({e}); showing the last synced copy.")
+        return mirror.query(period_key, {GROUP_COLUMN: group_number})
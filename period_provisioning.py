@@ -0,0 +1,197 @@
+# period_provisioning.py
+import os
+import json
+import logging
+import threading
+import time
+import datetime
+
+import streamlit as st
+
+from google_utils import create_drive_folder, create_spreadsheet, set_public_read_permissions, delete_drive_file
+from job_scheduler import get_io_executor
+from config import LOCAL_STATE_DIR, PREPROVISION_MONTHS_AHEAD, PREPROVISION_RETRY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+MONTH_NAMES = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October",
+               "November", "December"]
+
+
+def period_key_for(year, month_num):
+    return f"{year}-{month_num:02d}"
+
+
+def upcoming_period_keys(months_ahead=PREPROVISION_MONTHS_AHEAD, today=None):
+    """The current month's period key followed by the next `months_ahead` months'."""
+    today = today or datetime.date.today()
+    keys = []
+    for offset in range(months_ahead + 1):
+        month_index = today.month - 1 + offset
+        keys.append(period_key_for(today.year + month_index // 12, month_index % 12 + 1))
+    return keys
+
+
+def provision_period(drive_service, sheets_service, master_folder_id, year, month_num, active=True, executor=None):
+    """
+    Creates a period's Drive folder and spreadsheet concurrently and shares both in one batch. Does not
+    call Streamlit, as it also runs on the background provisioner's thread: errors propagate (if only one
+    of the two was created, it is deleted again first) and failed permissions are returned as messages.
+
+    Returns:
+        tuple: (period config entry, list of permission warning texts)
+    """
+    month_name = MONTH_NAMES[month_num - 1]
+    executor = executor or get_io_executor()
+    futures = [
+        executor.submit(create_drive_folder, drive_service, f"MCM_DARs_{month_name}_{year}",
+                        parent_id=master_folder_id, share=False, raise_errors=True),
+        executor.submit(create_spreadsheet, sheets_service, drive_service, f"MCM_Audit_Paras_{month_name}_{year}",
+                        parent_folder_id=master_folder_id, share=False, raise_errors=True),
+    ]
+    created, errors = [], []
+    for future in futures:
+        try:
+            created.append(future.result())
+        except Exception as e:
+            errors.append(e)
+    if not errors and not all(file_id for file_id, _ in created):
+        errors.append(RuntimeError(f"Drive returned no ID for the folder or spreadsheet of {month_name} {year}"))
+    if errors:
+        for orphan_id, _ in created:
+            if orphan_id:
+                try:
+                    delete_drive_file(drive_service, orphan_id, raise_errors=True)
+                except Exception as e:
+                    logger.warning("Could not delete %s after a failed provisioning: %s", orphan_id, e)
+        raise errors[0]
+    (folder_id, folder_url), (sheet_id, sheet_url) = created
+    # Both permissions in one batch round trip
+    permission_failures = set_public_read_permissions(drive_service, [folder_id, sheet_id], report=False)
+    return {
+        "year": year, "month_num": month_num, "month_name": month_name,
+        "drive_folder_id": folder_id, "drive_folder_url": folder_url,
+        "spreadsheet_id": sheet_id, "spreadsheet_url": sheet_url, "active": active
+    }, [f"Could not set public read permission for file ID {file_id}: {error}." for file_id, error in permission_failures.items()]
+
+
+class PeriodProvisioner:
+    """
+    Provisions upcoming periods' folders and spreadsheets in the background, so creating one of those periods
+    only has to add its entry to the periods config. Finished entries wait in a local JSON file (one per master
+    folder) rather than in the Drive config, so no tab lists a period before the PCO has created it, and
+    resources made just before a restart are still used afterwards instead of being created again.
+    With months_ahead <= 0 nothing is provisioned in advance (entries made earlier can still be claimed).
+    """
+
+    def __init__(self, state_path, executor, months_ahead=PREPROVISION_MONTHS_AHEAD):
+        self.state_path = state_path
+        self._executor = executor
+        self.months_ahead = months_ahead
+        self._lock = threading.Lock()
+        self._ready = {}  # (master_folder_id, period_key) -> period entry
+        self._in_flight = set()
+        self._failed_at = {}
+        self._provisioned_count = 0
+        self._claimed_count = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as fh:
+                records = json.load(fh)
+        except (OSError, ValueError):
+            return
+        for record in records:
+            self._ready[(record["master_folder_id"], record["period_key"])] = record["entry"]
+
+    def _persist_locked(self):
+        records = [{"master_folder_id": master_id, "period_key": key, "entry": entry}
+                   for (master_id, key), entry in self._ready.items()]
+        tmp_path = self.state_path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as fh:
+                json.dump(records, fh)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logger.error("Could not save pre-provisioned periods: %s", e)
+
+    def start(self, drive_service, sheets_service, master_folder_id, existing_keys=(), today=None):
+        """
+        Starts provisioning the upcoming periods (upcoming_period_keys) that are not configured, ready or in
+        flight. Returns the keys started; none when pre-provisioning is turned off.
+        """
+        if self.months_ahead <= 0:
+            return []
+        period_keys = upcoming_period_keys(self.months_ahead, today)
+        now = time.time()
+        with self._lock:
+            keys = [key for key in period_keys
+                    if key not in existing_keys
+                    and (master_folder_id, key) not in self._ready
+                    and (master_folder_id, key) not in self._in_flight
+                    and now - self._failed_at.get((master_folder_id, key), 0) >= PREPROVISION_RETRY_SECONDS]
+            self._in_flight.update((master_folder_id, key) for key in keys)
+        if keys:
+            threading.Thread(target=self._run, args=(drive_service, sheets_service, master_folder_id, keys),
+                             name="emcm-provision", daemon=True).start()
+        return keys
+
+    def _run(self, drive_service, sheets_service, master_folder_id, keys):
+        # Periods go one at a time; each one's folder and spreadsheet are still created concurrently
+        for key in keys:
+            year, month_num = (int(part) for part in key.split("-"))
+            try:
+                entry, permission_warnings = provision_period(drive_service, sheets_service, master_folder_id, year, month_num,
+                                                              active=False, executor=self._executor)
+                for text in permission_warnings:
+                    logger.warning("Pre-provisioning MCM period %s: %s", key, text)
+            except Exception as e:
+                logger.error("Pre-provisioning MCM period %s failed: %s", key, e)
+                entry = None
+            with self._lock:
+                self._in_flight.discard((master_folder_id, key))
+                if entry:
+                    self._ready[(master_folder_id, key)] = entry
+                    self._failed_at.pop((master_folder_id, key), None)
+                    self._provisioned_count += 1
+                    self._persist_locked()
+                else:
+                    self._failed_at[(master_folder_id, key)] = time.time()
+
+    def is_pending(self, master_folder_id, period_key):
+        with self._lock:
+            return (master_folder_id, period_key) in self._in_flight
+
+    def claim(self, master_folder_id, period_key):
+        """Removes and returns the ready entry for the period, or None if it has not been provisioned."""
+        with self._lock:
+            entry = self._ready.pop((master_folder_id, period_key), None)
+            if entry is not None:
+                self._claimed_count += 1
+                self._persist_locked()
+        return entry
+
+    def release(self, master_folder_id, period_key, entry):
+        """Puts back an entry whose claim could not be completed (e.g. the config save failed)."""
+        with self._lock:
+            self._ready[(master_folder_id, period_key)] = entry
+            self._claimed_count -= 1
+            self._persist_locked()
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "ready": sorted(key for _, key in self._ready),
+                "in_flight": sorted(key for _, key in self._in_flight),
+                "failed": len(self._failed_at),
+                "provisioned": self._provisioned_count,
+                "claimed": self._claimed_count,
+            }
+
+
+@st.cache_resource
+def get_period_provisioner():
+    """Process-wide provisioner shared by every PCO session."""
+    return PeriodProvisioner(os.path.join(LOCAL_STATE_DIR, "provisioned_periods.json"), get_io_executor())
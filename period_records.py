@@ -0,0 +1,79 @@
+# period_records.py
+"""
+Stable identifiers for the para rows of a period spreadsheet, and the MCM decisions kept against
+them in a separate tab of the same spreadsheet (so saving a decision never rewrites the data sheet).
+"""
+import datetime
+
+import pandas as pd
+
+from google_utils import RECORD_ID_COLUMN, get_file_id_from_drive_url, read_keyed_tab, upsert_keyed_rows
+
+DECISIONS_TAB_TITLE = "MCM Decisions"
+DECISIONS_TAB_HEADER = ["Record Key", "MCM Decision", "Decided By", "Decided At"]
+
+
+def record_key(dar_pdf_url, para_number, para_heading, record_id=None):
+    """
+    Key of one para row: its Record ID when it has one. Rows submitted before record IDs existed use
+    the DAR's Drive file ID plus the para number, or the heading for rows without a number
+    (header-only / manual entries). Stable across reads, sorts and row deletions.
+    """
+    if isinstance(record_id, str) and record_id:
+        return record_id
+    dar_part = get_file_id_from_drive_url(dar_pdf_url) or (str(dar_pdf_url) if pd.notna(dar_pdf_url) else "")
+    try:
+        para_part = str(int(float(para_number)))
+    except (TypeError, ValueError):
+        para_part = str(para_heading) if pd.notna(para_heading) else ""
+    return f"{dar_part}#{para_part}"
+
+
+def record_keys(df):
+    """record_key for every row of a period DataFrame, as a Series aligned with its index."""
+    def column(name):
+        return df[name].astype(object) if name in df.columns else pd.Series(None, index=df.index, dtype=object)
+    return pd.Series([record_key(*cells) for cells in
+                      zip(column('DAR PDF URL'), column('Audit Para Number'), column('Audit Para Heading'), column(RECORD_ID_COLUMN))],
+                     index=df.index, dtype=object)
+
+
+def load_decisions(sheets_service, spreadsheet_id):
+    """{record_key: (sheet_row_number, row_values)} from the decisions tab; {} if none saved yet, None on error."""
+    return read_keyed_tab(sheets_service, spreadsheet_id, DECISIONS_TAB_TITLE)
+
+
+def decision_of(decisions, key):
+    row = decisions.get(key, (None, []))[1]
+    return row[1] if len(row) > 1 and row[1] else None
+
+
+def attach_decisions(df, decisions):
+    """
+    Sets the 'MCM Decision' column of a period DataFrame from the decisions tab. A decision written
+    into the data sheet itself by older versions is kept where the tab has none for that record.
+    """
+    from_tab = record_keys(df).map(lambda key: decision_of(decisions, key))
+    if 'MCM Decision' in df.columns:
+        legacy = df['MCM Decision'].astype(object).where(df['MCM Decision'].astype(str).str.strip().ne(''))
+        from_tab = from_tab.where(from_tab.notna(), legacy)
+    df['MCM Decision'] = from_tab
+    return df
+
+
+def save_decisions(sheets_service, spreadsheet_id, decisions, decisions_by_key, decided_by):
+    """
+    Upserts only the decisions in `decisions_by_key` ({record_key: decision}) that differ from what the
+    tab holds. `decisions` (from load_decisions) is updated in place.
+
+    Returns:
+        int | None: number of decision rows written, or None if the write failed (error reported).
+    """
+    decided_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    changed_rows = {key: [key, decision, decided_by, decided_at] for key, decision in decisions_by_key.items()
+                    if decision_of(decisions, key) != decision}
+    if not changed_rows:
+        return 0
+    if not upsert_keyed_rows(sheets_service, spreadsheet_id, DECISIONS_TAB_TITLE, DECISIONS_TAB_HEADER, changed_rows, decisions):
+        return None
+    return len(changed_rows)
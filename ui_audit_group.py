@@ -1,19 +1,26 @@
 # ui_audit_group.py
 import streamlit as st
 import pandas as pd
+import numpy as np
 import datetime
 import math # For math.ceil
 from io import BytesIO
 import time
+import threading
+import hashlib
 
 # Assuming these utilities are correctly defined and imported
 from google_utils import (
     load_mcm_periods, upload_to_drive, append_to_spreadsheet,
-    read_from_spreadsheet, delete_spreadsheet_rows
+    delete_spreadsheet_rows,
+    get_first_sheet_info, new_record_id, delete_records, RECORD_ID_COLUMN
 )
-from dar_processor import preprocess_pdf_text
-from gemini_utils import get_structured_data_with_gemini
-from validation_utils import validate_data_for_sheet, VALID_CATEGORIES, VALID_PARA_STATUSES
+from extraction_pipeline import run_dar_upload_and_extraction, upload_dar_unless_cancelled, manual_entry_row
+from job_scheduler import get_extraction_scheduler, get_io_executor, period_deadline, JOB_QUEUED, JOB_DONE, JOB_LOST, FINISHED_JOB_STATES
+from append_journal import get_append_journal
+from period_mirror import read_group_period
+from config import EXTRACTION_JOB_POLL_SECONDS
+from validation_utils import IncrementalValidator, VALID_CATEGORIES, VALID_PARA_STATUSES
 from config import USER_CREDENTIALS, AUDIT_GROUP_NUMBERS
 from models import ParsedDARReport
 
@@ -24,20 +31,6 @@ SHEET_DATA_COLUMNS_ORDER = [
     "audit_para_number", "audit_para_heading",
     "revenue_involved_lakhs_rs", "revenue_recovered_lakhs_rs", "status_of_para",
 ]
-# --- Caching helper for MCM Periods ---
-def get_cached_mcm_periods_ag(drive_service, ttl_seconds=120):
-    cache_key_data = 'ag_ui_cached_mcm_periods_data'
-    cache_key_ts = 'ag_ui_cached_mcm_periods_timestamp'
-    current_time = time.time()
-    if (cache_key_data in st.session_state and
-            cache_key_ts in st.session_state and
-            (current_time - st.session_state[cache_key_ts] < ttl_seconds)):
-        return st.session_state[cache_key_data]
-    periods = load_mcm_periods(drive_service)
-    st.session_state[cache_key_data] = periods
-    st.session_state[cache_key_ts] = current_time
-    return periods
-# --- End Caching helper ---
 
 # Column names as they are in the DataFrame returned by read_from_spreadsheet (matching expected_cols_header in google_utils)
 # These are Title Cased
@@ -46,7 +39,7 @@ SHEET_COLUMN_NAMES = [
     "Total Amount Detected (Overall Rs)", "Total Amount Recovered (Overall Rs)",
     "Audit Para Number", "Audit Para Heading",
     "Revenue Involved (Lakhs Rs)", "Revenue Recovered (Lakhs Rs)", "Status of para",
-    "DAR PDF URL", "Record Created Date" # These are added by append logic or already in sheet
+    "DAR PDF URL", "Record Created Date", "Record ID" # These are added by append logic or already in sheet
 ]
 
 
@@ -80,11 +73,283 @@ def calculate_audit_circle(audit_group_number_val):
     except (ValueError, TypeError, AttributeError):
         return None
 
+NUMERIC_EDITOR_COLUMNS = ["total_amount_detected_overall_rs", "total_amount_recovered_overall_rs", "audit_para_number", "revenue_involved_lakhs_rs", "revenue_recovered_lakhs_rs"]
+
+
+def editor_validator(validator_state_key, editor_key, base_df):
+    """
+    The IncrementalValidator behind a review editor, rebuilt only when the editor or its base data
+    changes. It is brought up to date with the editor's current deltas before being returned.
+    """
+    entry = st.session_state.get(validator_state_key)
+    if entry is None or entry[0] != editor_key or entry[1] is not base_df:
+        validator = IncrementalValidator(
+            base_df[DISPLAY_COLUMN_ORDER_EDITOR], numeric_columns=NUMERIC_EDITOR_COLUMNS,
+            fixed_values={"audit_group_number": st.session_state.audit_group_no, "audit_circle_number": calculate_audit_circle(st.session_state.audit_group_no)})
+        entry = (editor_key, base_df, validator)
+        st.session_state[validator_state_key] = entry
+    entry[2].apply_editor_state(st.session_state.get(editor_key))
+    return entry[2]
+
+
+def apply_editor_delta(validator_state_key, editor_key):
+    # data_editor on_change: re-check only the rows touched by this edit
+    entry = st.session_state.get(validator_state_key)
+    if entry is not None and entry[0] == editor_key:
+        entry[2].apply_editor_state(st.session_state.get(editor_key))
+
+
+def render_live_validation(validator):
+    live_errors = [err for err in validator.errors() if err != "No data to validate."]
+    if live_errors:
+        with st.expander(f"⚠️ {len(live_errors)} issue(s) to fix before submission (updated as you edit)"):
+            for live_err in live_errors: st.caption(f"- {live_err}")
+    else:
+        st.caption("✅ No validation issues in the rows above.")
+
+
+@st.fragment(run_every=EXTRACTION_JOB_POLL_SECONDS)
+def render_extraction_job_status(job_id):
+    # Cheap poll: only this fragment reruns until the job finishes, then the whole script reruns once.
+    scheduler = get_extraction_scheduler()
+    job_snapshot = scheduler.job_snapshot(job_id)
+    if job_snapshot is None or job_snapshot["status"] in FINISHED_JOB_STATES + (JOB_LOST,):
+        st.rerun()
+    elapsed = time.time() - (job_snapshot.get("submitted_at") or time.time())
+    if job_snapshot["status"] == JOB_QUEUED:
+        st.info(f"⏳ '{job_snapshot.get('label')}' is waiting in the extraction queue "
+                f"({scheduler.queue_position(job_id)} job(s) ahead, {elapsed:.0f}s). You can switch tabs; the result will be kept.")
+    else:
+        st.info(f"⚙️ Uploading and extracting '{job_snapshot.get('label')}' ({elapsed:.0f}s)... You can switch tabs; the result will be kept.")
+
+
+def apply_extraction_job_result(job_snapshot):
+    """Moves a finished extraction job's result into the editor session state."""
+    result = job_snapshot.get("result") or {}
+    temp_list_for_df = list(result.get("rows") or [])
+    st.session_state.ag_extraction_messages = [tuple(m) for m in result.get("messages") or []]
+    st.session_state.ag_pdf_drive_url = result.get("drive_url")
+    if job_snapshot["status"] != JOB_DONE:
+        st.session_state.ag_extraction_messages.append(("error", f"Data extraction failed: {job_snapshot.get('error') or job_snapshot['status']}"))
+
+    if not temp_list_for_df:
+        temp_list_for_df.append(manual_entry_row(st.session_state.audit_group_no, calculate_audit_circle(st.session_state.audit_group_no), "Manual Entry - Extraction Issue"))
+
+    df_extracted = pd.DataFrame(temp_list_for_df)
+    for col in DISPLAY_COLUMN_ORDER_EDITOR: # Ensure columns for editor
+        if col not in df_extracted.columns: df_extracted[col] = None
+    st.session_state.ag_editor_data = df_extracted[DISPLAY_COLUMN_ORDER_EDITOR] # Populate session state
+    st.session_state.ag_extraction_messages.append(("success", "Data extraction processed. Review and edit below."))
+    st.session_state.ag_extraction_job_applied = True
+
+
+def start_dar_job(drive_service, mcm_info_current, api_key, file_name, pdf_bytes, persist=True):
+    """
+    Starts the Drive upload on the I/O pool right away and queues the extraction on the fair-share
+    scheduler; both share one cancel event so cancelling the job stops the work and removes the upload.
+    Returns the scheduler job ID.
+    """
+    cancel_event = threading.Event()
+    dar_filename_on_drive = f"AG{st.session_state.audit_group_no}_{file_name}"
+    upload_future = get_io_executor().submit(upload_dar_unless_cancelled, drive_service, pdf_bytes,
+                                             mcm_info_current['drive_folder_id'], dar_filename_on_drive, cancel_event)
+    return get_extraction_scheduler().submit(
+        f"AG{st.session_state.audit_group_no}", run_dar_upload_and_extraction,
+        args=(upload_future, drive_service, pdf_bytes, st.session_state.audit_group_no, calculate_audit_circle(st.session_state.audit_group_no), api_key),
+        kwargs={"cancel_event": cancel_event}, cancel_event=cancel_event,
+        deadline=period_deadline(mcm_info_current), owner=st.session_state.username,
+        label=file_name, persist=persist,
+        context={"mcm_key": st.session_state.ag_current_mcm_key, "file_name": file_name})
+
+
+def submit_extraction_job(drive_service, mcm_info_current, api_key):
+    """Starts the background job for the file selected in single-DAR mode."""
+    pdf_bytes = st.session_state.ag_current_uploaded_file_obj.getvalue()
+    st.session_state.ag_pdf_drive_url = None
+    st.session_state.ag_validation_errors = []
+    st.session_state.ag_extraction_messages = []
+    st.session_state.ag_extraction_job_id = start_dar_job(drive_service, mcm_info_current, api_key,
+                                                          st.session_state.ag_current_uploaded_file_name, pdf_bytes)
+    st.session_state.ag_extraction_job_applied = False
+
+
+def clear_extraction_job():
+    """Forgets the session's extraction job so a later reconnect does not restore it; unfinished work is cancelled."""
+    if st.session_state.get('ag_extraction_job_id') and not st.session_state.get('ag_extraction_job_applied'):
+        get_extraction_scheduler().cancel(st.session_state.ag_extraction_job_id)
+    get_extraction_scheduler().mark_consumed(st.session_state.get('ag_extraction_job_id'))
+    st.session_state.ag_extraction_job_id = None
+    st.session_state.ag_extraction_job_applied = False
+    st.session_state.ag_extraction_messages = []
+
+
+def clear_bulk_jobs():
+    """Cancels unfinished bulk jobs and resets the bulk review state."""
+    scheduler = get_extraction_scheduler()
+    for job_id in st.session_state.get('ag_bulk_jobs', {}).values():
+        scheduler.cancel(job_id)
+    st.session_state.ag_bulk_jobs = {}
+    st.session_state.ag_bulk_editor_data = None
+    st.session_state.ag_bulk_drive_urls = {}
+    st.session_state.ag_bulk_messages = []
+    st.session_state.ag_bulk_validation_errors = []
+
+
+@st.fragment(run_every=EXTRACTION_JOB_POLL_SECONDS)
+def render_bulk_job_progress(bulk_jobs):
+    # Same cheap polling as the single-file status; one full rerun once every file is finished.
+    scheduler = get_extraction_scheduler()
+    snapshots = {name: scheduler.job_snapshot(job_id) for name, job_id in bulk_jobs.items()}
+    finished = [name for name, snap in snapshots.items() if snap is None or snap["status"] in FINISHED_JOB_STATES + (JOB_LOST,)]
+    if len(finished) == len(snapshots):
+        st.rerun()
+    st.progress(len(finished) / len(snapshots), text=f"Processed {len(finished)} of {len(snapshots)} DAR(s)")
+    progress_rows = []
+    for name, snap in snapshots.items():
+        if name in finished:
+            progress_text = "✅ Done" if snap and snap["status"] == JOB_DONE else f"❌ {snap['status'] if snap else 'lost'}"
+        elif snap["status"] == JOB_QUEUED:
+            progress_text = f"⏳ Queued ({scheduler.queue_position(snap['job_id'])} ahead)"
+        else:
+            progress_text = f"⚙️ Uploading / extracting ({time.time() - (snap.get('started_at') or time.time()):.0f}s)"
+        progress_rows.append({"DAR File": name, "Progress": progress_text})
+    st.dataframe(pd.DataFrame(progress_rows), hide_index=True, use_container_width=True)
+
+
+def collect_bulk_job_results():
+    """Builds the combined review frame from the finished bulk jobs (one source_file per row)."""
+    scheduler = get_extraction_scheduler()
+    frames, drive_urls, messages = [], {}, []
+    for name, job_id in st.session_state.ag_bulk_jobs.items():
+        job_snapshot = scheduler.job_snapshot(job_id) or {"status": JOB_LOST}
+        result = job_snapshot.get("result") or {}
+        rows = list(result.get("rows") or [])
+        if job_snapshot["status"] != JOB_DONE:
+            messages.append(("error", f"{name}: data extraction failed ({job_snapshot.get('error') or job_snapshot['status']})."))
+        messages.extend((level, f"{name}: {text}") for level, text in result.get("messages") or [] if level != "success")
+        if not rows:
+            rows.append(manual_entry_row(st.session_state.audit_group_no, calculate_audit_circle(st.session_state.audit_group_no), "Manual Entry - Extraction Issue"))
+        df_file = pd.DataFrame(rows)
+        for col in DISPLAY_COLUMN_ORDER_EDITOR:
+            if col not in df_file.columns: df_file[col] = None
+        df_file.insert(0, "source_file", name)
+        frames.append(df_file[["source_file"] + DISPLAY_COLUMN_ORDER_EDITOR])
+        drive_urls[name] = result.get("drive_url")
+    st.session_state.ag_bulk_editor_data = pd.concat(frames, ignore_index=True)
+    st.session_state.ag_bulk_drive_urls = drive_urls
+    st.session_state.ag_bulk_messages = messages
+
+
+def submit_rows_to_period_sheet(sheets_service, spreadsheet_id, rows_for_sheet, dar_urls):
+    """
+    Queues the rows in the local append journal, which writes them to the sheet in the background, so
+    the submission does not wait on (or fail with) a slow Sheets API. The idempotency key is derived
+    from the DAR PDFs, so a repeated click cannot queue the same DARs twice. Falls back to a direct
+    append if the journal cannot be written.
+    """
+    idempotency_key = hashlib.sha1("|".join([spreadsheet_id] + sorted(set(map(str, dar_urls)))).encode("utf-8")).hexdigest()
+    if get_append_journal().enqueue(spreadsheet_id, rows_for_sheet, idempotency_key,
+                                    owner=st.session_state.username, label=f"Group {st.session_state.audit_group_no}"):
+        return True
+    return bool(append_to_spreadsheet(sheets_service, spreadsheet_id, rows_for_sheet))
+
+def render_bulk_dar_upload(drive_service, sheets_service, mcm_info_current, api_key):
+    """Multi-DAR mode: every file is uploaded, extracted and pre-validated concurrently, reviewed in one editor and appended in one call."""
+    uploaded_files = st.file_uploader("Choose DAR PDFs", type="pdf", accept_multiple_files=True,
+                                      key=f"ag_bulk_uploader_{st.session_state.ag_current_mcm_key}_{st.session_state.ag_bulk_uploader_key_suffix}")
+    bulk_jobs = st.session_state.ag_bulk_jobs
+
+    if not bulk_jobs:
+        if uploaded_files and st.button(f"Upload and Extract {len(uploaded_files)} DAR(s)", key="ag_bulk_extract_btn", use_container_width=True):
+            names_seen = set()
+            for f in uploaded_files:
+                if f.name in names_seen: continue # Same file picked twice
+                names_seen.add(f.name)
+                bulk_jobs[f.name] = start_dar_job(drive_service, mcm_info_current, api_key, f.name, f.getvalue(), persist=False)
+            st.session_state.ag_bulk_jobs = bulk_jobs
+            st.rerun()
+        return
+
+    if st.session_state.ag_bulk_editor_data is None:
+        scheduler = get_extraction_scheduler()
+        all_finished = all((scheduler.job_snapshot(job_id) or {"status": JOB_LOST})["status"] in FINISHED_JOB_STATES + (JOB_LOST,)
+                           for job_id in bulk_jobs.values())
+        if not all_finished:
+            render_bulk_job_progress(bulk_jobs)
+            if st.button("Cancel bulk upload", key="ag_bulk_cancel_btn"):
+                clear_bulk_jobs(); st.session_state.ag_bulk_uploader_key_suffix += 1
+                st.rerun()
+            return
+        collect_bulk_job_results()
+
+    for msg_level, msg_text in st.session_state.ag_bulk_messages:
+        getattr(st, msg_level)(msg_text)
+    files_without_pdf = [name for name, url in st.session_state.ag_bulk_drive_urls.items() if not url]
+
+    st.markdown(f"<h4>Review and Edit Extracted Data ({len(bulk_jobs)} DARs):</h4>", unsafe_allow_html=True)
+    col_conf = {
+        "source_file": st.column_config.SelectboxColumn("DAR File", options=list(bulk_jobs.keys()), required=True, width="medium"),
+        "audit_group_number": st.column_config.NumberColumn(disabled=True), "audit_circle_number": st.column_config.NumberColumn(disabled=True),
+        "gstin": st.column_config.TextColumn(width="medium"), "trade_name": st.column_config.TextColumn(width="large"),
+        "category": st.column_config.SelectboxColumn(options=[None] + VALID_CATEGORIES, required=False, width="small"),
+        "total_amount_detected_overall_rs": st.column_config.NumberColumn("Total Detect (Rs)", format="%.2f", width="medium"),
+        "total_amount_recovered_overall_rs": st.column_config.NumberColumn("Total Recover (Rs)", format="%.2f", width="medium"),
+        "audit_para_number": st.column_config.NumberColumn("Para No.", format="%d", width="small", help="Integer only"),
+        "audit_para_heading": st.column_config.TextColumn("Para Heading", width="xlarge"),
+        "revenue_involved_lakhs_rs": st.column_config.NumberColumn("Rev. Involved (Lakhs)", format="%.2f", width="small"),
+        "revenue_recovered_lakhs_rs": st.column_config.NumberColumn("Rev. Recovered (Lakhs)", format="%.2f", width="small"),
+        "status_of_para": st.column_config.SelectboxColumn("Para Status", options=[None] + VALID_PARA_STATUSES, required=False, width="medium")}
+    bulk_editor_key = f"ag_bulk_editor_{st.session_state.ag_current_mcm_key}_{st.session_state.ag_bulk_uploader_key_suffix}"
+    bulk_validator = editor_validator("ag_bulk_editor_validator", bulk_editor_key, st.session_state.ag_bulk_editor_data)
+    edited_bulk_df = pd.DataFrame(st.data_editor(
+        st.session_state.ag_bulk_editor_data.copy(), column_config=col_conf, num_rows="dynamic",
+        key=bulk_editor_key, on_change=apply_editor_delta, args=("ag_bulk_editor_validator", bulk_editor_key),
+        use_container_width=True, hide_index=True, height=min(len(st.session_state.ag_bulk_editor_data) * 45 + 70, 600)))
+    render_live_validation(bulk_validator)
+
+    col_submit, col_discard = st.columns([3, 1])
+    with col_discard:
+        if st.button("Discard", key="ag_bulk_discard_btn", use_container_width=True):
+            clear_bulk_jobs(); st.session_state.ag_bulk_uploader_key_suffix += 1
+            st.rerun()
+    with col_submit:
+        submit_clicked = st.button("Validate and Submit All to MCM Sheet", key="ag_bulk_submit_btn", use_container_width=True, disabled=edited_bulk_df.empty)
+    if submit_clicked:
+        df_to_submit = edited_bulk_df.dropna(how='all', subset=DISPLAY_COLUMN_ORDER_EDITOR).reset_index(drop=True)
+        required_cols = ['gstin', 'trade_name', 'audit_para_heading']
+        if df_to_submit.empty:
+            st.error("Submission failed: Only empty rows were found. Please fill in the details.")
+        elif df_to_submit[required_cols + ["source_file"]].isnull().any(axis=1).any():
+            st.error("Submission failed: At least one row is missing required information (e.g., DAR File, GSTIN, Trade Name, or Para Heading). Please complete all fields.")
+        elif set(df_to_submit["source_file"]) & set(files_without_pdf):
+            st.error(f"Submission failed: the PDF upload failed for {', '.join(sorted(set(df_to_submit['source_file']) & set(files_without_pdf)))}. Remove those rows or process the file again.")
+        else:
+            df_to_submit["audit_group_number"] = st.session_state.audit_group_no
+            df_to_submit["audit_circle_number"] = calculate_audit_circle(st.session_state.audit_group_no)
+            for nc in NUMERIC_EDITOR_COLUMNS:
+                df_to_submit[nc] = pd.to_numeric(df_to_submit[nc], errors='coerce')
+            st.session_state.ag_bulk_validation_errors = bulk_validator.errors() # Kept current from the editor deltas
+
+            if not st.session_state.ag_bulk_validation_errors:
+                with st.spinner(f"Submitting {len(df_to_submit)} row(s) to Google Sheet..."):
+                    ts = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    rows_for_sheet = [[r.get(col) for col in SHEET_DATA_COLUMNS_ORDER] + [st.session_state.ag_bulk_drive_urls[r["source_file"]], ts, new_record_id()]
+                                      for _, r in df_to_submit.iterrows()]
+                    dar_urls = [st.session_state.ag_bulk_drive_urls[f] for f in df_to_submit["source_file"].unique()]
+                    if submit_rows_to_period_sheet(sheets_service, mcm_info_current['spreadsheet_id'], rows_for_sheet, dar_urls):
+                        st.success(f"Data for {df_to_submit['source_file'].nunique()} DAR(s) submitted successfully! It is written to the MCM sheet in the background."); st.balloons(); time.sleep(1)
+                        clear_bulk_jobs(); st.session_state.ag_bulk_uploader_key_suffix += 1
+                        st.rerun()
+                    else: st.error("Failed to append to Google Sheet.")
+    if st.session_state.ag_bulk_validation_errors:
+        st.error("Validation Failed! Correct errors.")
+        st.subheader("⚠️ Validation Errors:"); [st.warning(f"- {err}") for err in st.session_state.ag_bulk_validation_errors]
+
 def audit_group_dashboard(drive_service, sheets_service):
     st.markdown(f"<div class='sub-header'>Audit Group {st.session_state.audit_group_no} Dashboard</div>",
                 unsafe_allow_html=True)
     
-    mcm_periods_all = get_cached_mcm_periods_ag(drive_service)
+    mcm_periods_all = load_mcm_periods(drive_service) # Re-downloaded only when the file's Drive revision changes
     active_periods = {k: v for k, v in mcm_periods_all.items() if v.get("active")}
 
     YOUR_GEMINI_API_KEY = st.secrets.get("GEMINI_API_KEY", "YOUR_API_KEY_HERE_FALLBACK")
@@ -96,14 +361,33 @@ def audit_group_dashboard(drive_service, sheets_service):
         'ag_editor_data': pd.DataFrame(columns=DISPLAY_COLUMN_ORDER_EDITOR), # For the editor
         'ag_pdf_drive_url': None,
         'ag_validation_errors': [],
+        'ag_extraction_job_id': None,
+        'ag_extraction_job_applied': False,
+        'ag_speculative_extraction': True,
+        'ag_bulk_jobs': {}, # file name -> scheduler job ID
+        'ag_bulk_editor_data': None,
+        'ag_bulk_drive_urls': {}, # file name -> DAR PDF URL
+        'ag_bulk_messages': [],
+        'ag_bulk_validation_errors': [],
+        'ag_bulk_uploader_key_suffix': 0,
+        'ag_extraction_messages': [],
         'ag_uploader_key_suffix': 0,
         'ag_row_to_delete_details': None,
         'ag_show_delete_confirm': False,
-        'ag_deletable_map': {}
+        'ag_deletable_map': {}, # entry label -> data row position
+        'ag_del_sheet_view': {} # {'period_key', 'df'}: the delete tab's read of the period sheet
     }
+    is_new_session = 'ag_extraction_job_id' not in st.session_state
     for key, value in default_ag_states.items():
         if key not in st.session_state:
             st.session_state[key] = value
+    if is_new_session:
+        # Reconnect / re-login: pick up this user's last extraction whose result was never submitted.
+        pending_job = get_extraction_scheduler().latest_job_for_owner(st.session_state.username)
+        if pending_job and pending_job.get("status") != JOB_LOST and (pending_job.get("context") or {}).get("mcm_key") in active_periods:
+            st.session_state.ag_current_mcm_key = pending_job["context"]["mcm_key"]
+            st.session_state.ag_current_uploaded_file_name = pending_job["context"].get("file_name")
+            st.session_state.ag_extraction_job_id = pending_job["job_id"]
 
     with st.sidebar:
         try: st.image("logo.png", width=80)
@@ -149,188 +433,176 @@ def audit_group_dashboard(drive_service, sheets_service):
 
                 if st.session_state.ag_current_mcm_key != new_mcm_key:
                     st.session_state.ag_current_mcm_key = new_mcm_key
+                    clear_extraction_job(); clear_bulk_jobs()
                     st.session_state.ag_current_uploaded_file_obj = None; st.session_state.ag_current_uploaded_file_name = None
                     st.session_state.ag_editor_data = pd.DataFrame(columns=DISPLAY_COLUMN_ORDER_EDITOR); st.session_state.ag_pdf_drive_url = None
                     st.session_state.ag_validation_errors = []; st.session_state.ag_uploader_key_suffix += 1
                     st.rerun()
 
                 st.info(f"Uploading for: {mcm_info_current['month_name']} {mcm_info_current['year']}")
-                uploaded_file = st.file_uploader("Choose DAR PDF", type="pdf", key=f"ag_uploader_main_final_{st.session_state.ag_current_mcm_key}_{st.session_state.ag_uploader_key_suffix}")
-
-                if uploaded_file:
-                    if st.session_state.ag_current_uploaded_file_name != uploaded_file.name or st.session_state.ag_current_uploaded_file_obj is None:
-                        st.session_state.ag_current_uploaded_file_obj = uploaded_file; st.session_state.ag_current_uploaded_file_name = uploaded_file.name
-                        st.session_state.ag_editor_data = pd.DataFrame(columns=DISPLAY_COLUMN_ORDER_EDITOR); st.session_state.ag_pdf_drive_url = None
-                        st.session_state.ag_validation_errors = []
-                        # st.rerun() # Avoid rerun here, let extract button control flow
-
-                extract_button_key = f"extract_data_btn_final_{st.session_state.ag_current_mcm_key}_{st.session_state.ag_current_uploaded_file_name or 'no_file_yet'}"
-                if st.session_state.ag_current_uploaded_file_obj and st.button("Extract Data from PDF", key=extract_button_key, use_container_width=True):
-                    with st.spinner(f"Processing '{st.session_state.ag_current_uploaded_file_name}'... This might take a moment."):
-                        pdf_bytes = st.session_state.ag_current_uploaded_file_obj.getvalue()
-                        st.session_state.ag_pdf_drive_url = None 
-                        st.session_state.ag_validation_errors = []
-
-                        dar_filename_on_drive = f"AG{st.session_state.audit_group_no}_{st.session_state.ag_current_uploaded_file_name}"
-                        pdf_drive_id, pdf_drive_url_temp = upload_to_drive(drive_service, BytesIO(pdf_bytes),
-                                                                           mcm_info_current['drive_folder_id'], dar_filename_on_drive)
-                        temp_list_for_df = []
-                        if not pdf_drive_id:
-                            st.error("Failed to upload PDF to Drive. Cannot proceed with extraction.")
-                            base_row_manual = {col: None for col in INTERNAL_DF_COLUMNS_FOR_EDIT}
-                            base_row_manual.update({"audit_group_number": st.session_state.audit_group_no, "audit_circle_number": calculate_audit_circle(st.session_state.audit_group_no), "audit_para_heading": "Manual Entry - PDF Upload Failed"})
-                            temp_list_for_df.append(base_row_manual)
+                upload_mode = st.radio("Upload mode", ["Single DAR", "Multiple DARs (bulk)"], horizontal=True, key="ag_upload_mode",
+                                       help="Bulk mode uploads and extracts several DARs at once and submits them together.")
+                if upload_mode == "Multiple DARs (bulk)":
+                    render_bulk_dar_upload(drive_service, sheets_service, mcm_info_current, YOUR_GEMINI_API_KEY)
+                else:
+                    uploaded_file = st.file_uploader("Choose DAR PDF", type="pdf", key=f"ag_uploader_main_final_{st.session_state.ag_current_mcm_key}_{st.session_state.ag_uploader_key_suffix}")
+
+                    st.toggle("Start processing as soon as a file is selected", key="ag_speculative_extraction",
+                              help="Uploads and extracts in the background while you check the file; choosing another file cancels it.")
+
+                    if uploaded_file:
+                        if st.session_state.ag_current_uploaded_file_name != uploaded_file.name or st.session_state.ag_current_uploaded_file_obj is None:
+                            clear_extraction_job() # Cancels any speculative work for the previously selected file
+                            st.session_state.ag_current_uploaded_file_obj = uploaded_file; st.session_state.ag_current_uploaded_file_name = uploaded_file.name
+                            st.session_state.ag_editor_data = pd.DataFrame(columns=DISPLAY_COLUMN_ORDER_EDITOR); st.session_state.ag_pdf_drive_url = None
+                            st.session_state.ag_validation_errors = []
+                            if st.session_state.ag_speculative_extraction:
+                                submit_extraction_job(drive_service, mcm_info_current, YOUR_GEMINI_API_KEY)
+                            # st.rerun() # Avoid rerun here, let extract button control flow
+                    elif st.session_state.ag_current_uploaded_file_obj is not None and st.session_state.ag_extraction_job_id and not st.session_state.ag_extraction_job_applied:
+                        # File removed from the uploader while its job was still running
+                        clear_extraction_job()
+                        st.session_state.ag_current_uploaded_file_obj = None; st.session_state.ag_current_uploaded_file_name = None
+
+                    extract_button_key = f"extract_data_btn_final_{st.session_state.ag_current_mcm_key}_{st.session_state.ag_current_uploaded_file_name or 'no_file_yet'}"
+                    extraction_in_flight = bool(st.session_state.ag_extraction_job_id) and not st.session_state.ag_extraction_job_applied
+                    if st.session_state.ag_current_uploaded_file_obj and st.button("Extract Data from PDF", key=extract_button_key, use_container_width=True, disabled=extraction_in_flight):
+                        # Upload and preprocess -> Gemini -> validate run concurrently in the background; the
+                        # script only keeps the job ID and polls for the result.
+                        submit_extraction_job(drive_service, mcm_info_current, YOUR_GEMINI_API_KEY)
+                        st.rerun()
+
+                    if st.session_state.ag_extraction_job_id and not st.session_state.ag_extraction_job_applied:
+                        job_snapshot = get_extraction_scheduler().job_snapshot(st.session_state.ag_extraction_job_id)
+                        if job_snapshot is None or job_snapshot["status"] == JOB_LOST:
+                            st.error("The extraction job was interrupted (the app restarted). Please extract again.")
+                            get_extraction_scheduler().mark_consumed(st.session_state.ag_extraction_job_id)
+                            st.session_state.ag_extraction_job_id = None
+                        elif job_snapshot["status"] in FINISHED_JOB_STATES:
+                            apply_extraction_job_result(job_snapshot)
+                            st.rerun() # Rerun to make editor display the new data in ag_editor_data
                         else:
-                            st.session_state.ag_pdf_drive_url = pdf_drive_url_temp
-                            st.success(f"DAR PDF uploaded to Drive: [Link]({st.session_state.ag_pdf_drive_url})")
-                            preprocessed_text = preprocess_pdf_text(BytesIO(pdf_bytes))
-
-                            if preprocessed_text.startswith("Error"):
-                                st.error(f"PDF Preprocessing Error: {preprocessed_text}")
-                                base_row_manual = {col: None for col in INTERNAL_DF_COLUMNS_FOR_EDIT}
-                                base_row_manual.update({"audit_group_number": st.session_state.audit_group_no, "audit_circle_number": calculate_audit_circle(st.session_state.audit_group_no), "audit_para_heading": "Manual Entry - PDF Error"})
-                                temp_list_for_df.append(base_row_manual)
-                            else:
-                                parsed_data: ParsedDARReport = get_structured_data_with_gemini(YOUR_GEMINI_API_KEY, preprocessed_text)
-                                if parsed_data.parsing_errors: st.warning(f"AI Parsing Issues: {parsed_data.parsing_errors}")
-
-                                header_dict = parsed_data.header.model_dump() if parsed_data.header else {}
-                                base_info = { # Use INTERNAL_DF_COLUMNS_FOR_EDIT (lowercase_underscore)
-                                    "audit_group_number": st.session_state.audit_group_no,
-                                    "audit_circle_number": calculate_audit_circle(st.session_state.audit_group_no),
-                                    "gstin": header_dict.get("gstin"), "trade_name": header_dict.get("trade_name"), "category": header_dict.get("category"),
-                                    "total_amount_detected_overall_rs": header_dict.get("total_amount_detected_overall_rs"),
-                                    "total_amount_recovered_overall_rs": header_dict.get("total_amount_recovered_overall_rs"),
-                                }
-                                if parsed_data.audit_paras:
-                                    for para_obj in parsed_data.audit_paras:
-                                        para_dict = para_obj.model_dump(); row = base_info.copy(); row.update({k: para_dict.get(k) for k in ["audit_para_number", "audit_para_heading", "revenue_involved_lakhs_rs", "revenue_recovered_lakhs_rs", "status_of_para"]}); temp_list_for_df.append(row)
-                                elif base_info.get("trade_name"):
-                                    row = base_info.copy(); row.update({"audit_para_number": None, "audit_para_heading": "N/A - Header Info Only (Add Paras Manually)", "status_of_para": None}); temp_list_for_df.append(row)
-                                else:
-                                    st.error("AI failed key header info."); row = base_info.copy(); row.update({"audit_para_heading": "Manual Entry Required", "status_of_para": None}); temp_list_for_df.append(row)
-                        
-                        if not temp_list_for_df: 
-                             base_row_manual = {col: None for col in INTERNAL_DF_COLUMNS_FOR_EDIT}
-                             base_row_manual.update({"audit_group_number": st.session_state.audit_group_no, "audit_circle_number": calculate_audit_circle(st.session_state.audit_group_no), "audit_para_heading": "Manual Entry - Extraction Issue"})
-                             temp_list_for_df.append(base_row_manual)
-                        
-                        df_extracted = pd.DataFrame(temp_list_for_df)
-                        for col in DISPLAY_COLUMN_ORDER_EDITOR: # Ensure columns for editor
-                            if col not in df_extracted.columns: df_extracted[col] = None
-                        st.session_state.ag_editor_data = df_extracted[DISPLAY_COLUMN_ORDER_EDITOR] # Populate session state
-                        st.success("Data extraction processed. Review and edit below.")
-                        st.rerun() # Rerun to make editor display the new data in ag_editor_data
-
-                # --- Data Editor and Submission ---
-                edited_df_local_copy = pd.DataFrame(columns=DISPLAY_COLUMN_ORDER_EDITOR) # Default empty
-                if not st.session_state.ag_editor_data.empty:
-                    st.markdown("<h4>Review and Edit Extracted Data:</h4>", unsafe_allow_html=True)
-                    col_conf = {
-                        "audit_group_number": st.column_config.NumberColumn(disabled=True), "audit_circle_number": st.column_config.NumberColumn(disabled=True),
-                        "gstin": st.column_config.TextColumn(width="medium"), "trade_name": st.column_config.TextColumn(width="large"),
-                        "category": st.column_config.SelectboxColumn(options=[None] + VALID_CATEGORIES, required=False, width="small"),
-                        "total_amount_detected_overall_rs": st.column_config.NumberColumn("Total Detect (Rs)", format="%.2f", width="medium"),
-                        "total_amount_recovered_overall_rs": st.column_config.NumberColumn("Total Recover (Rs)", format="%.2f", width="medium"),
-                        "audit_para_number": st.column_config.NumberColumn("Para No.", format="%d", width="small", help="Integer only"),
-                        "audit_para_heading": st.column_config.TextColumn("Para Heading", width="xlarge"),
-                        "revenue_involved_lakhs_rs": st.column_config.NumberColumn("Rev. Involved (Lakhs)", format="%.2f", width="small"),
-                        "revenue_recovered_lakhs_rs": st.column_config.NumberColumn("Rev. Recovered (Lakhs)", format="%.2f", width="small"),
-                        "status_of_para": st.column_config.SelectboxColumn("Para Status", options=[None] + VALID_PARA_STATUSES, required=False, width="medium")}
-                    final_editor_col_conf = {k: v for k, v in col_conf.items() if k in DISPLAY_COLUMN_ORDER_EDITOR}
+                            render_extraction_job_status(st.session_state.ag_extraction_job_id)
+
+                    for msg_level, msg_text in st.session_state.ag_extraction_messages:
+                        getattr(st, msg_level)(msg_text)
+
+                    # --- Data Editor and Submission ---
+                    edited_df_local_copy = pd.DataFrame(columns=DISPLAY_COLUMN_ORDER_EDITOR) # Default empty
+                    if not st.session_state.ag_editor_data.empty:
+                        st.markdown("<h4>Review and Edit Extracted Data:</h4>", unsafe_allow_html=True)
+                        col_conf = {
+                            "audit_group_number": st.column_config.NumberColumn(disabled=True), "audit_circle_number": st.column_config.NumberColumn(disabled=True),
+                            "gstin": st.column_config.TextColumn(width="medium"), "trade_name": st.column_config.TextColumn(width="large"),
+                            "category": st.column_config.SelectboxColumn(options=[None] + VALID_CATEGORIES, required=False, width="small"),
+                            "total_amount_detected_overall_rs": st.column_config.NumberColumn("Total Detect (Rs)", format="%.2f", width="medium"),
+                            "total_amount_recovered_overall_rs": st.column_config.NumberColumn("Total Recover (Rs)", format="%.2f", width="medium"),
+                            "audit_para_number": st.column_config.NumberColumn("Para No.", format="%d", width="small", help="Integer only"),
+                            "audit_para_heading": st.column_config.TextColumn("Para Heading", width="xlarge"),
+                            "revenue_involved_lakhs_rs": st.column_config.NumberColumn("Rev. Involved (Lakhs)", format="%.2f", width="small"),
+                            "revenue_recovered_lakhs_rs": st.column_config.NumberColumn("Rev. Recovered (Lakhs)", format="%.2f", width="small"),
+                            "status_of_para": st.column_config.SelectboxColumn("Para Status", options=[None] + VALID_PARA_STATUSES, required=False, width="medium")}
+                        final_editor_col_conf = {k: v for k, v in col_conf.items() if k in DISPLAY_COLUMN_ORDER_EDITOR}
                     
-                    editor_key = f"data_editor_stable_{st.session_state.ag_current_mcm_key}_{st.session_state.ag_current_uploaded_file_name or 'no_file_active'}"
+                        editor_key = f"data_editor_stable_{st.session_state.ag_current_mcm_key}_{st.session_state.ag_current_uploaded_file_name or 'no_file_active'}"
                     
-                    # The editor reads from st.session_state.ag_editor_data (which is result of last extraction)
-                    # Its output `edited_df_local_copy` contains the current visual state including user's edits for this run.
-                    edited_df_local_copy = pd.DataFrame(st.data_editor(
-                        st.session_state.ag_editor_data.copy(), # Pass a copy of the extracted data
-                        column_config=final_editor_col_conf, num_rows="dynamic",
-                        key=editor_key, use_container_width=True, hide_index=True, 
-                        height=min(len(st.session_state.ag_editor_data) * 45 + 70, 450) if not st.session_state.ag_editor_data.empty else 200
-                    ))
-                    # Do NOT assign edited_df_local_copy back to st.session_state.ag_editor_data here to prevent blink
-
-                submit_button_key = f"submit_btn_stable_{st.session_state.ag_current_mcm_key}_{st.session_state.ag_current_uploaded_file_name or 'no_file_active'}"
-                # Enable submit button only if there is data in the editor (even if it's just the template row from failed extraction)
-                can_submit = not edited_df_local_copy.empty if not st.session_state.ag_editor_data.empty else False
-                if st.button("Validate and Submit to MCM Sheet", key=submit_button_key, use_container_width=True, disabled=not can_submit):
-                    # Start with the data from the editor
-                    df_from_editor = edited_df_local_copy.copy()
-
-                    # 1. Silently drop any completely empty rows
-                    df_to_submit = df_from_editor.dropna(how='all').reset_index(drop=True)
-
-                    if df_to_submit.empty and not df_from_editor.empty:
-                        # This case handles if the user only created empty rows and nothing else
-                        st.error("Submission failed: Only empty rows were found. Please fill in the details.")
-                    else:
-                        # 2. Check for missing data in essential columns for the remaining rows
-                        # The 'audit_para_heading' is critical as it caused the original error
-                        required_cols = ['gstin', 'trade_name', 'audit_para_heading']
+                        # The editor reads from st.session_state.ag_editor_data (which is result of last extraction)
+                        # Its output `edited_df_local_copy` contains the current visual state including user's edits for this run.
+                        live_validator = editor_validator("ag_editor_validator", editor_key, st.session_state.ag_editor_data)
+                        edited_df_local_copy = pd.DataFrame(st.data_editor(
+                            st.session_state.ag_editor_data.copy(), # Pass a copy of the extracted data
+                            column_config=final_editor_col_conf, num_rows="dynamic",
+                            key=editor_key, on_change=apply_editor_delta, args=("ag_editor_validator", editor_key),
+                            use_container_width=True, hide_index=True, 
+                            height=min(len(st.session_state.ag_editor_data) * 45 + 70, 450) if not st.session_state.ag_editor_data.empty else 200
+                        ))
+                        render_live_validation(live_validator) # Only rows touched since the last edit were re-checked
+                        # Do NOT assign edited_df_local_copy back to st.session_state.ag_editor_data here to prevent blink
+
+                    submit_button_key = f"submit_btn_stable_{st.session_state.ag_current_mcm_key}_{st.session_state.ag_current_uploaded_file_name or 'no_file_active'}"
+                    # Enable submit button only if there is data in the editor (even if it's just the template row from failed extraction)
+                    can_submit = not edited_df_local_copy.empty if not st.session_state.ag_editor_data.empty else False
+                    if st.button("Validate and Submit to MCM Sheet", key=submit_button_key, use_container_width=True, disabled=not can_submit):
+                        # Start with the data from the editor
+                        df_from_editor = edited_df_local_copy.copy()
+
+                        # 1. Silently drop any completely empty rows
+                        df_to_submit = df_from_editor.dropna(how='all').reset_index(drop=True)
+
+                        if df_to_submit.empty and not df_from_editor.empty:
+                            # This case handles if the user only created empty rows and nothing else
+                            st.error("Submission failed: Only empty rows were found. Please fill in the details.")
+                        else:
+                            # 2. Check for missing data in essential columns for the remaining rows
+                            # The 'audit_para_heading' is critical as it caused the original error
+                            required_cols = ['gstin', 'trade_name', 'audit_para_heading']
                         
-                        # Create a boolean Series: True for any row that has a null in any required_col
-                        missing_required = df_to_submit[required_cols].isnull().any(axis=1)
+                            # Create a boolean Series: True for any row that has a null in any required_col
+                            missing_required = df_to_submit[required_cols].isnull().any(axis=1)
 
-                        if missing_required.any():
-                            st.error("Submission failed: At least one row is missing required information (e.g., GSTIN, Trade Name, or Para Heading). Please complete all fields.")
-                        else:
-                            # 3. If all checks pass, proceed with the original logic
-                            df_to_submit["audit_group_number"] = st.session_state.audit_group_no
-                            df_to_submit["audit_circle_number"] = calculate_audit_circle(st.session_state.audit_group_no)
+                            if missing_required.any():
+                                st.error("Submission failed: At least one row is missing required information (e.g., GSTIN, Trade Name, or Para Heading). Please complete all fields.")
+                            else:
+                                # 3. If all checks pass, proceed with the original logic
+                                df_to_submit["audit_group_number"] = st.session_state.audit_group_no
+                                df_to_submit["audit_circle_number"] = calculate_audit_circle(st.session_state.audit_group_no)
 
-                            num_cols_to_convert = ["total_amount_detected_overall_rs", "total_amount_recovered_overall_rs", "audit_para_number", "revenue_involved_lakhs_rs", "revenue_recovered_lakhs_rs"]
-                            for nc in num_cols_to_convert:
-                                if nc in df_to_submit.columns: df_to_submit[nc] = pd.to_numeric(df_to_submit[nc], errors='coerce')
+                                num_cols_to_convert = ["total_amount_detected_overall_rs", "total_amount_recovered_overall_rs", "audit_para_number", "revenue_involved_lakhs_rs", "revenue_recovered_lakhs_rs"]
+                                for nc in num_cols_to_convert:
+                                    if nc in df_to_submit.columns: df_to_submit[nc] = pd.to_numeric(df_to_submit[nc], errors='coerce')
                             
-                            st.session_state.ag_validation_errors = validate_data_for_sheet(df_to_submit)
-                # if st.button("Validate and Submit to MCM Sheet", key=submit_button_key, use_container_width=True, disabled=not can_submit):
-                #     df_to_submit = edited_df_local_copy.copy() # Use the current state from the editor widget
+                                # Validation results are kept current incrementally from the editor's deltas
+                                st.session_state.ag_validation_errors = live_validator.errors()
+                    # if st.button("Validate and Submit to MCM Sheet", key=submit_button_key, use_container_width=True, disabled=not can_submit):
+                    #     df_to_submit = edited_df_local_copy.copy() # Use the current state from the editor widget
                     
-                #     df_to_submit["audit_group_number"] = st.session_state.audit_group_no
-                #     df_to_submit["audit_circle_number"] = calculate_audit_circle(st.session_state.audit_group_no)
+                    #     df_to_submit["audit_group_number"] = st.session_state.audit_group_no
+                    #     df_to_submit["audit_circle_number"] = calculate_audit_circle(st.session_state.audit_group_no)
 
-                #     num_cols_to_convert = ["total_amount_detected_overall_rs", "total_amount_recovered_overall_rs", "audit_para_number", "revenue_involved_lakhs_rs", "revenue_recovered_lakhs_rs"]
-                #     for nc in num_cols_to_convert:
-                #         if nc in df_to_submit.columns: df_to_submit[nc] = pd.to_numeric(df_to_submit[nc], errors='coerce')
+                    #     num_cols_to_convert = ["total_amount_detected_overall_rs", "total_amount_recovered_overall_rs", "audit_para_number", "revenue_involved_lakhs_rs", "revenue_recovered_lakhs_rs"]
+                    #     for nc in num_cols_to_convert:
+                    #         if nc in df_to_submit.columns: df_to_submit[nc] = pd.to_numeric(df_to_submit[nc], errors='coerce')
                     
-                #     st.session_state.ag_validation_errors = validate_data_for_sheet(df_to_submit)
+                    #     st.session_state.ag_validation_errors = validate_data_for_sheet(df_to_submit)
    
-                    if not st.session_state.ag_validation_errors:
-                        if not st.session_state.ag_pdf_drive_url: 
-                            st.error("PDF Drive URL missing. This indicates the initial PDF upload with extraction failed. Please re-extract data."); st.stop()
-
-                        with st.spinner("Submitting to Google Sheet..."):
-                            rows_for_sheet = []; ts = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                            final_df_for_sheet_upload = df_to_submit.copy() # Start with edited data
-                            for sheet_col_name in SHEET_DATA_COLUMNS_ORDER: # Ensure all sheet columns
-                                if sheet_col_name not in final_df_for_sheet_upload.columns:
-                                    final_df_for_sheet_upload[sheet_col_name] = None
-                            # Re-ensure group and circle numbers are consistently from session state for the final sheet data
-                            final_df_for_sheet_upload["audit_group_number"] = st.session_state.audit_group_no
-                            final_df_for_sheet_upload["audit_circle_number"] = calculate_audit_circle(st.session_state.audit_group_no)
+                        if not st.session_state.ag_validation_errors:
+                            if not st.session_state.ag_pdf_drive_url: 
+                                st.error("PDF Drive URL missing. This indicates the initial PDF upload with extraction failed. Please re-extract data."); st.stop()
+
+                            with st.spinner("Submitting to Google Sheet..."):
+                                rows_for_sheet = []; ts = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                                final_df_for_sheet_upload = df_to_submit.copy() # Start with edited data
+                                for sheet_col_name in SHEET_DATA_COLUMNS_ORDER: # Ensure all sheet columns
+                                    if sheet_col_name not in final_df_for_sheet_upload.columns:
+                                        final_df_for_sheet_upload[sheet_col_name] = None
+                                # Re-ensure group and circle numbers are consistently from session state for the final sheet data
+                                final_df_for_sheet_upload["audit_group_number"] = st.session_state.audit_group_no
+                                final_df_for_sheet_upload["audit_circle_number"] = calculate_audit_circle(st.session_state.audit_group_no)
                             
-                            for _, r_data_submit in final_df_for_sheet_upload.iterrows():
-                                sheet_row = [r_data_submit.get(col) for col in SHEET_DATA_COLUMNS_ORDER] + [st.session_state.ag_pdf_drive_url, ts]
-                                rows_for_sheet.append(sheet_row)
+                                for _, r_data_submit in final_df_for_sheet_upload.iterrows():
+                                    sheet_row = [r_data_submit.get(col) for col in SHEET_DATA_COLUMNS_ORDER] + [st.session_state.ag_pdf_drive_url, ts, new_record_id()]
+                                    rows_for_sheet.append(sheet_row)
                             
-                            if rows_for_sheet:
-                                if append_to_spreadsheet(sheets_service, mcm_info_current['spreadsheet_id'], rows_for_sheet):
-                                    st.success("Data submitted successfully!"); st.balloons(); time.sleep(1)
-                                    st.session_state.ag_current_uploaded_file_obj = None; st.session_state.ag_current_uploaded_file_name = None
-                                    st.session_state.ag_editor_data = pd.DataFrame(columns=DISPLAY_COLUMN_ORDER_EDITOR); st.session_state.ag_pdf_drive_url = None
-                                    st.session_state.ag_validation_errors = []; st.session_state.ag_uploader_key_suffix += 1
-                                    st.rerun()
-                                else: st.error("Failed to append to Google Sheet.")
-                            else: st.error("No data rows to submit.")
-                    else:
-                        st.error("Validation Failed! Correct errors.");
-                        if st.session_state.ag_validation_errors: st.subheader("⚠️ Validation Errors:"); [st.warning(f"- {err}") for err in st.session_state.ag_validation_errors]
+                                if rows_for_sheet:
+                                    if submit_rows_to_period_sheet(sheets_service, mcm_info_current['spreadsheet_id'], rows_for_sheet, [st.session_state.ag_pdf_drive_url]):
+                                        st.success("Data submitted successfully! It is written to the MCM sheet in the background."); st.balloons(); time.sleep(1)
+                                        clear_extraction_job()
+                                        st.session_state.ag_current_uploaded_file_obj = None; st.session_state.ag_current_uploaded_file_name = None
+                                        st.session_state.ag_editor_data = pd.DataFrame(columns=DISPLAY_COLUMN_ORDER_EDITOR); st.session_state.ag_pdf_drive_url = None
+                                        st.session_state.ag_validation_errors = []; st.session_state.ag_uploader_key_suffix += 1
+                                        st.rerun()
+                                    else: st.error("Failed to append to Google Sheet.")
+                                else: st.error("No data rows to submit.")
+                        else:
+                            st.error("Validation Failed! Correct errors.");
+                            if st.session_state.ag_validation_errors: st.subheader("⚠️ Validation Errors:"); [st.warning(f"- {err}") for err in st.session_state.ag_validation_errors]
             elif not period_select_map_rev: st.info("No MCM periods available.")
 
     # ========================== VIEW MY UPLOADED DARS TAB ==========================
     elif selected_tab == "View My Uploaded DARs":
         st.markdown("<h3>My Uploaded DARs</h3>", unsafe_allow_html=True)
+        queued_entries, queued_rows = get_append_journal().pending_for_owner(st.session_state.username)
+        if queued_entries: st.info(f"⏳ {queued_rows} row(s) from {queued_entries} recent submission(s) are still being written to the MCM sheet and will appear here shortly.")
         if not mcm_periods_all: st.info("No MCM periods found.")
         else:
             view_period_opts_map = {k: f"{p.get('month_name')} {p.get('year')}" for k, p in sorted(mcm_periods_all.items(), key=lambda x: x[0], reverse=True) if p.get('month_name') and p.get('year')}
@@ -340,13 +612,13 @@ def audit_group_dashboard(drive_service, sheets_service):
                 sel_view_key = st.selectbox("Select MCM Period", options=list(view_period_opts_map.keys()), format_func=lambda k: view_period_opts_map[k], key="ag_view_sel_final_corrected")
                 if sel_view_key and sheets_service:
                     view_sheet_id = mcm_periods_all[sel_view_key]['spreadsheet_id']
-                    with st.spinner("Loading uploads..."): df_sheet_all = read_from_spreadsheet(sheets_service, view_sheet_id)
+                    # Only this group's rows: from the local mirror, or just this group's ranges of the sheet
+                    with st.spinner("Loading uploads..."):
+                        my_uploads = read_group_period(sheets_service, sel_view_key, view_sheet_id, st.session_state.audit_group_no, drive_service=drive_service)
                     
-                    if df_sheet_all is not None and not df_sheet_all.empty:
+                    if my_uploads is not None:
                         # Use SHEET_COLUMN_NAMES (Title Case) which are expected from read_from_spreadsheet
-                        if "Audit Group Number" in df_sheet_all.columns:
-                            df_sheet_all["Audit Group Number"] = df_sheet_all["Audit Group Number"].astype(str)
-                            my_uploads = df_sheet_all[df_sheet_all["Audit Group Number"] == str(st.session_state.audit_group_no)]
+                        if "Audit Group Number" in my_uploads.columns:
                             if not my_uploads.empty:
                                 st.markdown(f"<h4>Your Uploads for {view_period_opts_map[sel_view_key]}:</h4>", unsafe_allow_html=True)
                                 my_uploads_disp = my_uploads.copy()
@@ -371,8 +643,7 @@ def audit_group_dashboard(drive_service, sheets_service):
                                     st.markdown(my_uploads_disp[existing_cols_to_display].to_html(escape=False, index=False), unsafe_allow_html=True)
                             else: st.info(f"No DARs by you for {view_period_opts_map[sel_view_key]}.")
                         else: st.warning("Sheet missing 'Audit Group Number' column or data malformed.")
-                    elif df_sheet_all is None: st.error("Error reading spreadsheet for viewing.")
-                    else: st.info(f"No data in sheet for {view_period_opts_map[sel_view_key]}.")
+                    else: st.error("Error reading spreadsheet for viewing.")
                 elif not sheets_service and sel_view_key: st.error("Google Sheets service unavailable.")
 
     # ========================== DELETE MY DAR ENTRIES TAB ==========================
@@ -391,50 +662,67 @@ def audit_group_dashboard(drive_service, sheets_service):
                 if sel_del_key and sheets_service:
                     del_sheet_id = mcm_periods_all[sel_del_key]['spreadsheet_id']
                     del_sheet_gid = 0
-                    try: del_sheet_gid = sheets_service.spreadsheets().get(spreadsheetId=del_sheet_id).execute().get('sheets', [{}])[0].get('properties', {}).get('sheetId', 0)
+                    try: del_sheet_gid = get_first_sheet_info(sheets_service, del_sheet_id)['gid']
                     except Exception as e_gid: st.error(f"Could not get sheet GID: {e_gid}"); st.stop()
 
-                    with st.spinner("Loading entries..."): df_all_del_data = read_from_spreadsheet(sheets_service, del_sheet_id)
+                    # The sheet view is kept per period and updated locally after a delete, not re-read
+                    del_view = st.session_state.ag_del_sheet_view
+                    reload_requested = st.button("🔄 Reload entries", key=f"ag_del_reload_{sel_del_key}")
+                    if del_view.get('period_key') != sel_del_key or reload_requested:
+                        with st.spinner("Loading entries..."): del_view = {'period_key': sel_del_key, 'df': read_group_period(sheets_service, sel_del_key, del_sheet_id, st.session_state.audit_group_no, refresh=reload_requested, drive_service=drive_service)}
+                        st.session_state.ag_del_sheet_view = del_view if del_view['df'] is not None else {}
+                    df_all_del_data = del_view['df']
                     if df_all_del_data is not None and not df_all_del_data.empty:
                         if 'Audit Group Number' in df_all_del_data.columns: # Column names here are TitleCase
-                            df_all_del_data['Audit Group Number'] = df_all_del_data['Audit Group Number'].astype(str)
-                            my_entries_del = df_all_del_data[df_all_del_data['Audit Group Number'] == str(st.session_state.audit_group_no)].copy()
-                            my_entries_del['original_data_index'] = my_entries_del.index 
+                            my_entries_del = df_all_del_data[df_all_del_data['Audit Group Number'].astype(str) == str(st.session_state.audit_group_no)]
 
                             if not my_entries_del.empty:
                                 st.markdown(f"<h4>Your Uploads in {del_period_opts_map[sel_del_key]} (Select to delete):</h4>", unsafe_allow_html=True)
-                                del_options_disp = ["--Select an entry to delete--"]; st.session_state.ag_deletable_map.clear()
-                                for _, del_row in my_entries_del.iterrows():
+                                st.session_state.ag_deletable_map.clear()
+                                for data_pos, del_row in my_entries_del.iterrows():
                                     # Use TitleCase for .get() as df_all_del_data columns are TitleCase
-                                    del_ident = f"TN: {str(del_row.get('Trade Name', 'N/A'))[:20]} | Para: {del_row.get('Audit Para Number', 'N/A')} | Date: {del_row.get('Record Created Date', 'N/A')}"
-                                    del_options_disp.append(del_ident)
-                                    st.session_state.ag_deletable_map[del_ident] = {
-                                        "original_df_index": del_row['original_data_index'], # Store the actual DataFrame index
-                                        "Trade Name": str(del_row.get('Trade Name')), # Store identifiers for confirmation
-                                        "Audit Para Number": str(del_row.get('Audit Para Number')),
-                                        "Record Created Date": str(del_row.get('Record Created Date')),
-                                        "DAR PDF URL": str(del_row.get('DAR PDF URL'))
-                                    }
-                                
-                                sel_entry_del_str = st.selectbox("Select Entry:", options=del_options_disp, key=f"del_box_final_corrected_{sel_del_key}")
-                                if sel_entry_del_str != "--Select an entry to delete--":
-                                    entry_info_to_delete = st.session_state.ag_deletable_map.get(sel_entry_del_str)
-                                    if entry_info_to_delete is not None :
-                                        orig_idx_to_del = entry_info_to_delete["original_df_index"]
-                                        st.warning(f"Confirm Deletion: TN: **{entry_info_to_delete.get('Trade Name')}**, Para: **{entry_info_to_delete.get('Audit Para Number')}**")
-                                        with st.form(key=f"del_form_final_corrected_{orig_idx_to_del}"):
-                                            pwd = st.text_input("Password:", type="password", key=f"del_pwd_final_corrected_{orig_idx_to_del}")
-                                            if st.form_submit_button("Yes, Delete This Entry"):
-                                                if pwd == USER_CREDENTIALS.get(st.session_state.username):
-                                                    if delete_spreadsheet_rows(sheets_service, del_sheet_id, del_sheet_gid, [orig_idx_to_del]): 
-                                                        st.success("Entry deleted."); time.sleep(1); st.rerun()
-                                                    else: st.error("Failed to delete from sheet.")
-                                                else: st.error("Incorrect password.")
-                                    else: st.error("Could not identify selected entry. Please refresh and re-select.")
+                                    del_ident = f"Row {data_pos + 2} | TN: {str(del_row.get('Trade Name', 'N/A'))[:20]} | Para: {del_row.get('Audit Para Number', 'N/A')} | Date: {del_row.get('Record Created Date', 'N/A')}"
+                                    st.session_state.ag_deletable_map[del_ident] = data_pos # Data row position in the sheet view
+
+                                del_mode = st.radio("Delete", ["Selected paras", "All paras of a DAR"], horizontal=True, key=f"ag_del_mode_{sel_del_key}")
+                                if del_mode == "Selected paras":
+                                    sel_entries_del = st.multiselect("Select Entries:", options=list(st.session_state.ag_deletable_map), key=f"del_multi_{sel_del_key}")
+                                    positions_to_del = [st.session_state.ag_deletable_map[ident] for ident in sel_entries_del]
+                                else:
+                                    dar_groups = my_entries_del.groupby(my_entries_del['DAR PDF URL'].fillna('').astype(str), sort=False)
+                                    dar_opts_map = {f"TN: {str(dar_rows['Trade Name'].iloc[0])[:30]} | {len(dar_rows)} para(s) | Date: {dar_rows['Record Created Date'].iloc[0]}": list(dar_rows.index)
+                                                    for _, dar_rows in dar_groups}
+                                    sel_dar_del = st.selectbox("Select DAR:", options=["--Select a DAR--"] + list(dar_opts_map), key=f"del_dar_{sel_del_key}")
+                                    positions_to_del = dar_opts_map.get(sel_dar_del, [])
+
+                                if positions_to_del:
+                                    st.warning(f"Confirm Deletion of **{len(positions_to_del)}** entr{'y' if len(positions_to_del) == 1 else 'ies'}: "
+                                               + ", ".join(f"TN: **{my_entries_del.at[pos, 'Trade Name']}**, Para: **{my_entries_del.at[pos, 'Audit Para Number']}**" for pos in positions_to_del[:10])
+                                               + (" ..." if len(positions_to_del) > 10 else ""))
+                                    with st.form(key=f"del_form_{sel_del_key}"):
+                                        pwd = st.text_input("Password:", type="password", key=f"del_pwd_{sel_del_key}")
+                                        if st.form_submit_button("Yes, Delete These Entries"):
+                                            if pwd == USER_CREDENTIALS.get(st.session_state.username):
+                                                ids_to_del = df_all_del_data[RECORD_ID_COLUMN].loc[positions_to_del] if RECORD_ID_COLUMN in df_all_del_data.columns else pd.Series(dtype=object)
+                                                if len(ids_to_del) and ids_to_del.notna().all() and ids_to_del.ne('').all():
+                                                    deleted = delete_records(sheets_service, del_sheet_id, ids_to_del.tolist()) # Found wherever the rows are now
+                                                else: # Rows submitted before record IDs existed are addressed by position
+                                                    deleted = delete_spreadsheet_rows(sheets_service, del_sheet_id, del_sheet_gid, positions_to_del, base_df=df_all_del_data)
+                                                if deleted:
+                                                    # Mirror the deletion locally; the remaining rows move up to their new sheet positions
+                                                    remaining = df_all_del_data.drop(index=positions_to_del)
+                                                    remaining.index = remaining.index - np.searchsorted(sorted(positions_to_del), remaining.index)
+                                                    del_view['df'] = remaining
+                                                    for widget_key in (f"del_multi_{sel_del_key}", f"del_dar_{sel_del_key}"): st.session_state.pop(widget_key, None)
+                                                    st.success(f"{len(positions_to_del)} entr{'y' if len(positions_to_del) == 1 else 'ies'} deleted."); time.sleep(1); st.rerun()
+                                                else:
+                                                    st.session_state.ag_del_sheet_view = {} # Re-read on the next run
+                                                    st.error("Failed to delete from sheet.")
+                                            else: st.error("Incorrect password.")
                             else: st.info(f"You have no entries in {del_period_opts_map[sel_del_key]} to delete.")
                         else: st.warning("Sheet missing 'Audit Group Number' column.")
                     elif df_all_del_data is None: st.error("Error reading sheet for deletion.")
-                    else: st.info(f"No data in sheet for {del_period_opts_map[sel_del_key]}.")
+                    else: st.info(f"You have no entries in {del_period_opts_map[sel_del_key]} to delete.")
                 elif not sheets_service and sel_del_key: st.error("Google Sheets service unavailable.")
 
     st.markdown("</div>", unsafe_allow_html=True)# # ui_audit_group.py
@@ -0,0 +1,103 @@
+# ui_backfill.py
+import streamlit as st
+import pandas as pd
+
+from google_utils import read_from_spreadsheet, write_dataframe_to_sheet_tab
+from backfill import (
+    get_backfill_registry, load_checkpoint, diff_report_dataframe, failed_dars_dataframe,
+    DAR_PENDING, DAR_DONE, DAR_FAILED, RUN_DONE, DIFF_REPORT_TAB_TITLE
+)
+from config import EXTRACTION_JOB_POLL_SECONDS
+
+
+@st.fragment(run_every=EXTRACTION_JOB_POLL_SECONDS)
+def render_backfill_progress(mcm_key):
+    runner = get_backfill_registry().get(mcm_key)
+    if runner is None or not runner.running:
+        st.rerun()
+    progress = runner.progress()
+    processed = progress[DAR_DONE] + progress[DAR_FAILED]
+    st.progress(processed / progress["total"] if progress["total"] else 1.0,
+                text=f"Re-extracted {processed} of {progress['total']} DAR(s) ({progress['in_flight']} in progress, {progress[DAR_FAILED]} failed)")
+
+
+def backfill_tab(drive_service, sheets_service, mcm_periods):
+    st.markdown("### Re-extraction Backfill")
+    st.caption("Re-runs extraction on every DAR PDF already filed for a period (e.g. after a prompt or model change) "
+               "and reports the differences against the sheet. The sheet itself is not modified.")
+    if not mcm_periods:
+        st.warning("No MCM periods found. Please create them first via 'Create MCM Period' tab.")
+        return
+
+    period_options = {k: f"{v.get('month_name')} {v.get('year')}" for k, v in sorted(mcm_periods.items(), key=lambda item: item[0], reverse=True) if v.get('month_name') and v.get('year')}
+    if not period_options:
+        st.warning("No valid MCM periods with complete month and year information available.")
+        return
+    selected_period_key = st.selectbox("Select MCM Period", options=list(period_options.keys()), format_func=lambda k: period_options[k], key="pco_backfill_period_select")
+    if not selected_period_key:
+        return
+    selected_period_info = mcm_periods[selected_period_key]
+
+    registry = get_backfill_registry()
+    runner = registry.get(selected_period_key)
+    is_running = runner is not None and runner.running
+    checkpoint = runner.checkpoint if runner is not None else load_checkpoint(selected_period_key)
+
+    if is_running:
+        render_backfill_progress(selected_period_key)
+        if st.button("Pause Backfill", key="pco_backfill_pause_btn"):
+            runner.stop()
+            st.rerun()
+        return
+
+    failed_count = sum(1 for dar in checkpoint["dars"].values() if dar["status"] == DAR_FAILED) if checkpoint else 0
+    if checkpoint:
+        pending_count = sum(1 for dar in checkpoint["dars"].values() if dar["status"] == DAR_PENDING)
+        state_text = "complete" if checkpoint.get("status") == RUN_DONE else "paused (resumable)"
+        st.info(f"Backfill started {checkpoint.get('started_at')} is {state_text}: {len(checkpoint['dars']) - pending_count - failed_count} done, "
+                f"{pending_count} pending, {failed_count} failed. Last checkpoint {checkpoint.get('updated_at')}.")
+
+    col_start, col_retry, col_discard = st.columns(3)
+    with col_start:
+        start_label = "Resume Backfill" if checkpoint and checkpoint.get("status") != RUN_DONE else "Start Backfill"
+        start_clicked = st.button(start_label, key="pco_backfill_start_btn", use_container_width=True)
+    with col_retry:
+        retry_clicked = st.button(f"Retry {failed_count} Failed DAR(s)", key="pco_backfill_retry_btn", use_container_width=True, disabled=not failed_count)
+    with col_discard:
+        if st.button("Discard Results", key="pco_backfill_discard_btn", use_container_width=True, disabled=not checkpoint):
+            registry.discard(selected_period_key)
+            st.rerun()
+
+    if start_clicked or retry_clicked:
+        if not sheets_service or not drive_service:
+            st.error("Google Services not available. Cannot start the backfill.")
+            return
+        with st.spinner(f"Loading current data for {period_options[selected_period_key]}..."):
+            df_sheet = read_from_spreadsheet(sheets_service, selected_period_info['spreadsheet_id'])
+        if df_sheet is None or df_sheet.empty or "DAR PDF URL" not in df_sheet.columns:
+            st.warning("No DARs found in this period's spreadsheet.")
+            return
+        registry.start(drive_service, selected_period_key, df_sheet, st.secrets.get("GEMINI_API_KEY", "YOUR_API_KEY_HERE_FALLBACK"), retry_failed=retry_clicked)
+        st.rerun()
+
+    if not checkpoint:
+        return
+    df_report = diff_report_dataframe(checkpoint)
+    st.markdown(f"<h4>Differences Found ({len(df_report)})</h4>", unsafe_allow_html=True)
+    if df_report.empty:
+        st.success("No differences between the re-extracted data and the sheet so far.")
+    else:
+        st.dataframe(df_report, use_container_width=True, hide_index=True)
+        col_csv, col_tab = st.columns(2)
+        with col_csv:
+            st.download_button("Download Diff Report (CSV)", data=df_report.to_csv(index=False).encode("utf-8"),
+                               file_name=f"re_extraction_diff_{selected_period_key}.csv", mime="text/csv", use_container_width=True)
+        with col_tab:
+            if st.button(f"Write to '{DIFF_REPORT_TAB_TITLE}' Sheet Tab", key="pco_backfill_write_tab_btn", use_container_width=True):
+                with st.spinner("Writing diff report to the period spreadsheet..."):
+                    if write_dataframe_to_sheet_tab(sheets_service, selected_period_info['spreadsheet_id'], DIFF_REPORT_TAB_TITLE, df_report):
+                        st.success(f"Diff report written to tab '{DIFF_REPORT_TAB_TITLE}'.")
+    df_failed = failed_dars_dataframe(checkpoint)
+    if not df_failed.empty:
+        with st.expander(f"{len(df_failed)} DAR(s) could not be re-extracted"):
+            st.dataframe(df_failed, use_container_width=True, hide_index=True)
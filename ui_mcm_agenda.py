@@ -470,7 +470,6 @@ import datetime
 import math
 from io import BytesIO
 import requests
-from urllib.parse import urlparse, parse_qs
 import html
 from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode, DataReturnMode, JsCode
 
@@ -484,10 +483,11 @@ from reportlab.lib.units import inch
 from PyPDF2 import PdfWriter, PdfReader
 from reportlab.pdfgen import canvas
 
-from google_utils import read_from_spreadsheet
+from period_mirror import read_period
 from googleapiclient.http import MediaIoBaseDownload
 from googleapiclient.errors import HttpError
-from google_utils import update_spreadsheet_from_df
+from google_utils import get_file_id_from_drive_url
+from period_records import load_decisions, attach_decisions, record_keys, save_decisions
 # --- NEW HELPER FUNCTION FOR INDIAN NUMBERING ---
 def format_inr(n):
     """
@@ -522,22 +522,6 @@ def format_inr(n):
     groups.reverse()
     result = ','.join(groups) + ',' + s_last_three
     return result
-# Helper function to extract File ID from Google Drive webViewLink
-def get_file_id_from_drive_url(url: str) -> str | None:
-    if not url or not isinstance(url, str):
-        return None
-    parsed_url = urlparse(url)
-    if 'drive.google.com' in parsed_url.netloc:
-        if '/file/d/' in parsed_url.path:
-            try:
-                return parsed_url.path.split('/file/d/')[1].split('/')[0]
-            except IndexError:
-                pass
-        query_params = parse_qs(parsed_url.query)
-        if 'id' in query_params:
-            return query_params['id'][0]
-    return None
-
 def create_page_number_stamp_pdf(buffer, page_num, total_pages):
     """
     Creates a PDF in memory with 'Page X of Y' at the bottom center.
@@ -664,20 +648,22 @@ def mcm_agenda_tab(drive_service, sheets_service, mcm_periods):
     # --- Data Loading using Session State ---
     if 'df_period_data' not in st.session_state or st.session_state.get('current_period_key') != selected_period_key:
         with st.spinner(f"Loading data for {month_year_str}..."):
-            df = read_from_spreadsheet(sheets_service, selected_period_info['spreadsheet_id'])
+            # Typed read from the local mirror: numeric/categorical/datetime columns converted per SHEET_SCHEMA
+            df = read_period(sheets_service, selected_period_key, selected_period_info['spreadsheet_id'], typed=True, drive_service=drive_service)
             if df is None or df.empty:
                 st.info(f"No data found in the spreadsheet for {month_year_str}.")
                 st.session_state.df_period_data = pd.DataFrame()
                 return
+            # MCM decisions live in their own tab, keyed by record; join them onto the para rows
+            decisions = load_decisions(sheets_service, selected_period_info['spreadsheet_id'])
+            st.session_state.df_period_decisions = decisions if decisions is not None else {}
+            df = attach_decisions(df, st.session_state.df_period_decisions)
             
-            cols_to_convert_numeric = ['Audit Group Number', 'Audit Circle Number', 'Total Amount Detected (Overall Rs)',
-                                       'Total Amount Recovered (Overall Rs)', 'Audit Para Number',
-                                       'Revenue Involved (Lakhs Rs)', 'Revenue Recovered (Lakhs Rs)']
-            for col_name in cols_to_convert_numeric:
-                if col_name in df.columns:
-                    df[col_name] = df[col_name].astype(str).str.replace(r'[^\d.]', '', regex=True)
-                    df[col_name] = pd.to_numeric(df[col_name], errors='coerce')
-                else:
+            cols_expected_numeric = ['Audit Group Number', 'Audit Circle Number', 'Total Amount Detected (Overall Rs)',
+                                     'Total Amount Recovered (Overall Rs)', 'Audit Para Number',
+                                     'Revenue Involved (Lakhs Rs)', 'Revenue Recovered (Lakhs Rs)']
+            for col_name in cols_expected_numeric:
+                if col_name not in df.columns:
                     df[col_name] = 0 if "Amount" in col_name or "Revenue" in col_name else pd.NA
             
             st.session_state.df_period_data = df
@@ -865,25 +851,33 @@ def mcm_agenda_tab(drive_service, sheets_service, mcm_periods):
                             
                             if st.button("Save Decisions", key=f"save_decisions_{trade_name_item}", use_container_width=True, type="primary"):
                                 with st.spinner("Saving decisions..."):
-                                    if 'MCM Decision' not in st.session_state.df_period_data.columns:
-                                        st.session_state.df_period_data['MCM Decision'] = ""
-                                    
+                                    selected_decisions = {}
                                     for index, row in df_trade_paras_item.iterrows():
                                         para_num_str = str(int(row["Audit Para Number"])) if pd.notna(row["Audit Para Number"]) and row["Audit Para Number"] != 0 else "N/A"
                                         decision_key = f"mcm_decision_{trade_name_item}_{para_num_str}_{index}"
-                                        selected_decision = st.session_state.get(decision_key, decision_options[0])
-                                        st.session_state.df_period_data.loc[index, 'MCM Decision'] = selected_decision
+                                        selected_decisions[index] = st.session_state.get(decision_key, decision_options[0])
                                     
-                                    success = update_spreadsheet_from_df(
-                                        sheets_service=sheets_service,
-                                        spreadsheet_id=selected_period_info['spreadsheet_id'],
-                                        df_to_write=st.session_state.df_period_data
+                                    # Only the decision rows of this trader's paras are written; the data sheet is not touched
+                                    keys_by_index = record_keys(df_trade_paras_item)
+                                    saved_count = save_decisions(
+                                        sheets_service,
+                                        selected_period_info['spreadsheet_id'],
+                                        st.session_state.df_period_decisions,
+                                        {keys_by_index[index]: decision for index, decision in selected_decisions.items()},
+                                        st.session_state.get('username', '')
                                     )
                                     
-                                    if success:
-                                        st.success("✅ Decisions saved successfully!")
+                                    if saved_count is not None:
+                                        for index, decision in selected_decisions.items():
+                                            st.session_state.df_period_data.loc[index, 'MCM Decision'] = decision
+                                        if saved_count:
+                                            st.success(f"✅ {saved_count} decision(s) saved successfully!")
+                                        else:
+                                            st.info("No decisions changed since the last save.")
                                     else:
                                         st.error("❌ Failed to save decisions. Check app logs for details.")
+                                        # Reload the period on the next run; the decision selections are kept, so saving again re-applies them
+                                        st.session_state.pop('current_period_key', None)
                             
                             st.markdown("<hr>", unsafe_allow_html=True)
 
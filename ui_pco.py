@@ -8,18 +8,111 @@ import plotly.express as px
 from streamlit_option_menu import option_menu
 import math  # For math.ceil if needed
 from ui_mcm_agenda import mcm_agenda_tab # <--- IMPORT THE NEW TAB FUNCTION
+from ui_backfill import backfill_tab
 
 
 # Assuming google_utils.py and config.py are in the same directory and correctly set up
 from google_utils import (
-    load_mcm_periods, save_mcm_periods, create_drive_folder,
-    create_spreadsheet, read_from_spreadsheet,update_spreadsheet_from_df
+    load_mcm_periods, save_mcm_periods, forget_missing_drive_ids, update_spreadsheet_from_df, fill_missing_label, new_record_id, RECORD_ID_COLUMN,
+    get_api_traffic_stats, get_revision_check_stats, get_google_service_factory, compare_field_mask_sizes
 )
 from config import USER_CREDENTIALS, MCM_PERIODS_FILENAME_ON_DRIVE
+from job_scheduler import get_extraction_scheduler
+from append_journal import get_append_journal
+from period_mirror import read_period, get_period_mirror
+from period_provisioning import provision_period, get_period_provisioner
+
+REPORT_PREVIEW_ROWS = 50  # Rows shown in the reports tab while the rest of the period sheet is still loading
+
+
+def render_system_status(drive_service=None, sheets_service=None, mcm_periods=None):
+    """Sidebar panel with live load metrics for the shared background machinery."""
+    with st.expander("System Status", expanded=False):
+        q = get_extraction_scheduler().metrics()
+        st.markdown("**Extraction Queue**")
+        c1, c2 = st.columns(2)
+        c1.metric("Running", f"{q['running']}/{q['max_concurrent']}")
+        c2.metric("Queued", q['queued'])
+        c1.metric("Avg wait", f"{q['avg_wait_s']:.1f}s")
+        c2.metric("P95 wait", f"{q['p95_wait_s']:.1f}s")
+        st.caption(f"Oldest queued: {q['oldest_queued_wait_s']:.0f}s | Max wait: {q['max_wait_s']:.1f}s | "
+                   f"Done: {q['completed']} | Failed: {q['failed']} | Cancelled: {q['cancelled']}")
+        if q['queued_by_group'] or q['running_by_group']:
+            groups = sorted(set(q['queued_by_group']) | set(q['running_by_group']))
+            st.dataframe(pd.DataFrame({
+                "Group": groups,
+                "Queued": [q['queued_by_group'].get(g, 0) for g in groups],
+                "Running": [q['running_by_group'].get(g, 0) for g in groups],
+            }), hide_index=True, use_container_width=True)
+
+        st.markdown("**Submission Write-Behind**")
+        journal = get_append_journal()
+        j = journal.metrics()
+        c1, c2 = st.columns(2)
+        c1.metric("Queued rows", j['pending_rows'])
+        c2.metric("Failed", j['failed_entries'])
+        st.caption(f"Queued submissions: {j['pending_entries']} | Oldest: {j['oldest_pending_s']:.0f}s | "
+                   f"Written: {j['flushed_entries']} | Worker: {'running' if j['worker_alive'] else 'stopped'}")
+        if j['by_spreadsheet']:
+            period_names = {p.get('spreadsheet_id'): f"{p.get('month_name')} {p.get('year')}" for p in (mcm_periods or {}).values()}
+            st.dataframe(pd.DataFrame([
+                {"Period": period_names.get(entry['spreadsheet_id'], entry['spreadsheet_id']), "Status": entry['status'],
+                 "Submissions": entry['entries'], "Rows": entry['rows'], "Attempts": entry['max_attempts']}
+                for entry in j['by_spreadsheet']
+            ]), hide_index=True, use_container_width=True)
+        if j['last_error']:
+            st.caption(f"Last error: {j['last_error']}")
+        if j['failed_entries'] and st.button("Retry failed submissions", key="pco_retry_journal_btn", use_container_width=True):
+            st.toast(f"{journal.retry_failed()} submission(s) queued again.")
+
+        st.markdown("**Period Mirror**")
+        m = get_period_mirror().metrics()
+        c1, c2 = st.columns(2)
+        c1.metric("Shared frames", m['cached_frames'])
+        c2.metric("Frame hits", f"{m['frame_hits']}/{m['frame_hits'] + m['frame_misses']}")
+        if m['periods']:
+            now = time.time()
+            st.dataframe(pd.DataFrame([
+                {"Period": entry['period_key'], "Rows": entry['mirrored_rows'],
+                 "Synced": f"{now - entry['synced_at']:.0f}s ago", "Full re-read": f"{now - entry['full_synced_at']:.0f}s ago"}
+                for entry in m['periods']
+            ]), hide_index=True, use_container_width=True)
+
+        p = get_period_provisioner().metrics()
+        if p['ready'] or p['in_flight'] or p['provisioned']:
+            st.caption(f"Pre-provisioned periods: ready {', '.join(p['ready']) or '-'} | preparing {', '.join(p['in_flight']) or '-'} | "
+                       f"used {p['claimed']}/{p['provisioned']} | failures {p['failed']}")
+
+        st.markdown("**Google API Traffic**")
+        traffic = get_api_traffic_stats().snapshot()
+        if traffic:
+            st.dataframe(pd.DataFrame([
+                {"Call": label, "Calls": entry["calls"], "KB": round(entry["bytes"] / 1024, 1)}
+                for label, entry in sorted(traffic.items(), key=lambda item: -item[1]["bytes"])
+            ]), hide_index=True, use_container_width=True)
+        else:
+            st.caption("No API calls recorded yet.")
+        try:
+            f = get_google_service_factory().metrics()
+            st.caption(f"API clients: built in {f['build_seconds'] * 1000:.0f} ms | {f['http_clients']} thread connection(s), "
+                       f"{f['requests_per_client']:.1f} requests each | Token refreshes: {f['credential_refreshes']}")
+        except Exception:
+            pass # Services unavailable; reported elsewhere
+        revision_checks = get_revision_check_stats().snapshot()
+        if revision_checks:
+            st.caption("Revision checks (a hit skips the download): " + " | ".join(
+                f"{kind}: {entry['hits']}/{entry['hits'] + entry['misses']} hits" for kind, entry in sorted(revision_checks.items())))
+        latest_period = max(mcm_periods.items())[1] if mcm_periods else None
+        if latest_period and sheets_service and drive_service and latest_period.get('spreadsheet_id'):
+            if st.button("Measure field-mask savings", key="pco_measure_field_masks_btn", use_container_width=True):
+                with st.spinner("Comparing response sizes..."):
+                    mask_sizes = compare_field_mask_sizes(sheets_service, drive_service, latest_period['spreadsheet_id'])
+                if mask_sizes:
+                    st.dataframe(pd.DataFrame(mask_sizes), hide_index=True, use_container_width=True)
 
 def pco_dashboard(drive_service, sheets_service):
     st.markdown("<div class='sub-header'>Planning & Coordination Officer Dashboard</div>", unsafe_allow_html=True)
-    mcm_periods = load_mcm_periods(drive_service)  # Direct load, no caching
+    mcm_periods = load_mcm_periods(drive_service)  # Re-downloaded only when the file's Drive revision changes
 
     with st.sidebar:
         try:
@@ -41,14 +134,15 @@ def pco_dashboard(drive_service, sheets_service):
                     del st.session_state[key]
             st.rerun()
         st.markdown("---")
+        render_system_status(drive_service, sheets_service, mcm_periods)
     selected_tab = option_menu(
         menu_title=None,
         options=["Create MCM Period", "Manage MCM Periods", "View Uploaded Reports", 
                  "MCM Agenda", # <--- ADDED "MCM Agenda"
-                 "Visualizations"],
+                 "Visualizations", "Re-extraction Backfill"],
         icons=["calendar-plus-fill", "sliders", "eye-fill", 
                "journal-richtext", # <--- ADDED ICON for MCM Agenda (Example icon)
-               "bar-chart-fill"],
+               "bar-chart-fill", "arrow-repeat"],
         menu_icon="gear-wide-connected", 
         default_index=0, # You might want to adjust this if MCM Agenda should be default
         orientation="horizontal",
@@ -83,37 +177,53 @@ def pco_dashboard(drive_service, sheets_service):
         # Operate on a copy for potential modifications before saving
         mcm_periods_local_copy_create = mcm_periods.copy()
 
+        master_folder_id = st.session_state.get('master_drive_folder_id')
+        provisioner = get_period_provisioner()
+        if drive_service and sheets_service and master_folder_id:
+            # Upcoming months get their folder and spreadsheet in the background (unless PREPROVISION_MONTHS_AHEAD
+            # is 0), so creating them is a config save
+            provisioner.start(drive_service, sheets_service, master_folder_id, existing_keys=set(mcm_periods_local_copy_create))
+
         if period_key in mcm_periods_local_copy_create:
             st.warning(f"MCM Period for {selected_month_name} {selected_year} already exists.")
+        elif provisioner.is_pending(master_folder_id, period_key):
+            st.info(f"The Drive folder and Spreadsheet for {selected_month_name} {selected_year} are being prepared in the background. They will be ready in a few seconds.")
+            if st.button("Refresh", key="pco_btn_refresh_provisioning", use_container_width=True):
+                st.rerun()
         else:
             if st.button(f"Create MCM for {selected_month_name} {selected_year}", key="pco_btn_create_mcm",
                          use_container_width=True):
-                if not drive_service or not sheets_service or not st.session_state.get('master_drive_folder_id'):
+                if not drive_service or not sheets_service or not master_folder_id:
                     st.error("Google Services or Master Drive Folder not available. Cannot create MCM period.")
                 else:
-                    with st.spinner("Creating Google Drive folder and Spreadsheet..."):
-                        master_folder_id = st.session_state.master_drive_folder_id
-                        folder_name = f"MCM_DARs_{selected_month_name}_{selected_year}"
-                        spreadsheet_title = f"MCM_Audit_Paras_{selected_month_name}_{selected_year}"
-
-                        folder_id, folder_url = create_drive_folder(drive_service, folder_name, parent_id=master_folder_id)
-                        sheet_id, sheet_url = create_spreadsheet(sheets_service, drive_service, spreadsheet_title, parent_folder_id=master_folder_id)
+                    new_period = provisioner.claim(master_folder_id, period_key)
+                    claimed = new_period is not None
+                    if claimed:
+                        new_period["active"] = True
+                    else:
+                        try:
+                            with st.spinner("Creating Google Drive folder and Spreadsheet..."):
+                                new_period, permission_warnings = provision_period(drive_service, sheets_service, master_folder_id,
+                                                                                   selected_year, selected_month_num)
+                            for warning_text in permission_warnings:
+                                st.warning(warning_text)
+                        except Exception as e:
+                            forget_missing_drive_ids(e, master_folder_id)
+                            new_period = None
+                            st.error(f"An error occurred creating the Drive folder or Spreadsheet: {e}")
 
-                        if folder_id and sheet_id:
-                            mcm_periods_local_copy_create[period_key] = {
-                                "year": selected_year, "month_num": selected_month_num, "month_name": selected_month_name,
-                                "drive_folder_id": folder_id, "drive_folder_url": folder_url,
-                                "spreadsheet_id": sheet_id, "spreadsheet_url": sheet_url, "active": True
-                            }
-                            if save_mcm_periods(drive_service, mcm_periods_local_copy_create):  # Save the updated dict
-                                st.success(f"Successfully created MCM period for {selected_month_name} {selected_year}!")
-                                st.markdown(f"**Drive Folder:** <a href='{folder_url}' target='_blank'>Open Folder</a>", unsafe_allow_html=True)
-                                st.markdown(f"**Spreadsheet:** <a href='{sheet_url}' target='_blank'>Open Sheet</a>", unsafe_allow_html=True)
-                                st.balloons(); time.sleep(0.5); st.rerun()  # Rerun to reflect new period
-                            else:
-                                st.error("Failed to save MCM period configuration to Drive.")
+                    if new_period:
+                        mcm_periods_local_copy_create[period_key] = new_period
+                        if save_mcm_periods(drive_service, mcm_periods_local_copy_create):  # Save the updated dict
+                            st.success(f"Successfully created MCM period for {selected_month_name} {selected_year}!")
+                            st.markdown(f"**Drive Folder:** <a href='{new_period['drive_folder_url']}' target='_blank'>Open Folder</a>", unsafe_allow_html=True)
+                            st.markdown(f"**Spreadsheet:** <a href='{new_period['spreadsheet_url']}' target='_blank'>Open Sheet</a>", unsafe_allow_html=True)
+                            st.balloons(); time.sleep(0.5); st.rerun()  # Rerun to reflect new period
                         else:
-                            st.error("Failed to create Drive folder or Spreadsheet.")
+                            if claimed:
+                                new_period["active"] = False
+                                provisioner.release(master_folder_id, period_key, new_period)  # Keep it for the next attempt
+                            st.error("Failed to save MCM period configuration to Drive.")
 
     # ========================== MANAGE MCM PERIODS TAB ==========================
     elif selected_tab == "Manage MCM Periods":
@@ -202,15 +312,26 @@ def pco_dashboard(drive_service, sheets_service):
                     selected_period_k_for_view = next((k for k, p in all_periods_for_view.items() if f"{p.get('month_name')} {p.get('year')}" == selected_period_str_view), None)
                     if selected_period_k_for_view and sheets_service:
                         sheet_id_for_report_view = all_periods_for_view[selected_period_k_for_view]['spreadsheet_id']
-                        with st.spinner("Loading data from Google Sheet..."):
-                            df_report_data = read_from_spreadsheet(sheets_service, sheet_id_for_report_view)
+                        # Served from the local mirror; a full re-read streams in chunks, showing the first rows while the rest loads
+                        rows_loaded, preview_rows = [], []
+                        loading_preview = st.empty()
+                        def show_report_chunk(chunk):
+                            if not preview_rows: preview_rows.append(chunk.head(REPORT_PREVIEW_ROWS))
+                            rows_loaded.append(len(chunk))
+                            with loading_preview.container():
+                                st.caption(f"Loading data from Google Sheet... {sum(rows_loaded):,} rows so far")
+                                st.dataframe(preview_rows[0], use_container_width=True, hide_index=True)
+                        with st.spinner("Loading data..."):
+                            df_report_data = read_period(sheets_service, selected_period_k_for_view, sheet_id_for_report_view, on_chunk=show_report_chunk, drive_service=drive_service)
+                        loading_preview.empty()
                         if df_report_data is not None and not df_report_data.empty:
                             # --- SECTION 1: DISPLAY ALL EXISTING SUMMARY REPORTS ---
                             st.markdown("<h4>Summary of Uploads:</h4>", unsafe_allow_html=True)
                             if 'Audit Group Number' in df_report_data.columns:
                                 try:
-                                    df_report_data['Audit Group Number Numeric'] = pd.to_numeric(df_report_data['Audit Group Number'], errors='coerce')
-                                    df_summary_reports = df_report_data.dropna(subset=['Audit Group Number Numeric'])
+                                    # Summary columns go on a copy: df_report_data is the snapshot the editor's changes are diffed against
+                                    df_summary_reports = df_report_data.assign(**{'Audit Group Number Numeric': pd.to_numeric(df_report_data['Audit Group Number'], errors='coerce')})
+                                    df_summary_reports = df_summary_reports.dropna(subset=['Audit Group Number Numeric'])
                                     
                                     # Report 1: DARs per Group
                                     dars_per_group_rep = df_summary_reports.groupby('Audit Group Number Numeric')['DAR PDF URL'].nunique().reset_index(name='DARs Uploaded')
@@ -247,12 +368,18 @@ def pco_dashboard(drive_service, sheets_service):
                                         use_container_width=True,
                                         hide_index=True,
                                         num_rows="dynamic",
+                                        disabled=[RECORD_ID_COLUMN] if RECORD_ID_COLUMN in df_report_data.columns else False, # Generated on submit; identifies the row
                                         key=f"editor_{selected_period_k_for_view}"
                                     )
     
                                     if st.button("Save Changes to Spreadsheet", type="primary"):
                                         with st.spinner("Saving changes to Google Sheet..."):
-                                            success = update_spreadsheet_from_df(sheets_service, sheet_id_for_report_view, edited_df)
+                                            if RECORD_ID_COLUMN in edited_df.columns:
+                                                # Rows added in the editor get their record ID here
+                                                added_rows = ~edited_df.index.isin(df_report_data.index) & edited_df[RECORD_ID_COLUMN].isna()
+                                                edited_df.loc[added_rows, RECORD_ID_COLUMN] = [new_record_id() for _ in range(added_rows.sum())]
+                                            # Only the edited cells are written; a conflicting change by someone else is reported
+                                            success = update_spreadsheet_from_df(sheets_service, sheet_id_for_report_view, edited_df, base_df=df_report_data)
                                             if success:
                                                 st.success("Changes saved successfully!")
                                                 time.sleep(1)
@@ -329,6 +456,8 @@ def pco_dashboard(drive_service, sheets_service):
     #                     st.error("Google Sheets service not available.")
     elif selected_tab == "MCM Agenda":
         mcm_agenda_tab(drive_service, sheets_service, mcm_periods) # Call the imported function
+    elif selected_tab == "Re-extraction Backfill":
+        backfill_tab(drive_service, sheets_service, mcm_periods)
     # ========================== VISUALIZATIONS TAB ==========================
     # ========================== VISUALIZATIONS TAB ==========================
     elif selected_tab == "Visualizations":
@@ -349,13 +478,13 @@ def pco_dashboard(drive_service, sheets_service):
                     if selected_viz_period_k_tab:
                         sheet_id_for_viz_tab = all_mcm_periods_for_viz_tab[selected_viz_period_k_tab]['spreadsheet_id']
                         with st.spinner("Loading data for visualizations..."):
-                            df_viz_data = read_from_spreadsheet(sheets_service, sheet_id_for_viz_tab)  # Main DataFrame for this tab
+                            df_viz_data = read_period(sheets_service, selected_viz_period_k_tab, sheet_id_for_viz_tab, typed=True, drive_service=drive_service)  # Main DataFrame for this tab
                         if df_viz_data is not None and not df_viz_data.empty:
                             # --- Data Cleaning and Preparation ---
                             viz_amount_cols = ['Total Amount Detected (Overall Rs)', 'Total Amount Recovered (Overall Rs)', 'Revenue Involved (Lakhs Rs)', 'Revenue Recovered (Lakhs Rs)']
                             for v_col in viz_amount_cols:
                                 if v_col in df_viz_data.columns:
-                                    df_viz_data[v_col] = pd.to_numeric(df_viz_data[v_col], errors='coerce').fillna(0)
+                                    df_viz_data[v_col] = df_viz_data[v_col].fillna(0)  # already float64 from the typed read
                             
                             if 'Audit Group Number' in df_viz_data.columns:
                                 df_viz_data['Audit Group Number'] = pd.to_numeric(df_viz_data['Audit Group Number'], errors='coerce').fillna(0).astype(int)
@@ -424,15 +553,15 @@ def pco_dashboard(drive_service, sheets_service):
                                     df['Circle Number For Plot'] = 0
                                 df['Circle Number Str Plot'] = df['Circle Number For Plot'].astype(str)
                                 
-                                df['Category'] = df.get('Category', pd.Series(dtype='str')).fillna('Unknown')
-                                df['Trade Name'] = df.get('Trade Name', pd.Series(dtype='str')).fillna('Unknown Trade Name')
-                                df['Status of para'] = df.get('Status of para', pd.Series(dtype='str')).fillna('Unknown')
+                                df['Category'] = fill_missing_label(df.get('Category', pd.Series(dtype='str')), 'Unknown')
+                                df['Trade Name'] = fill_missing_label(df.get('Trade Name', pd.Series(dtype='str')), 'Unknown Trade Name')
+                                df['Status of para'] = fill_missing_label(df.get('Status of para', pd.Series(dtype='str')), 'Unknown')
     
                             # --- Para Status Distribution (uses original full data) ---
                             st.markdown("---")
                             st.markdown("<h4>Para Status Distribution</h4>", unsafe_allow_html=True)
                             if 'Status of para' in df_viz_data.columns and df_viz_data['Status of para'].nunique() > 1:
-                                viz_status_counts = df_viz_data['Status of para'].value_counts().reset_index()
+                                viz_status_counts = df_viz_data['Status of para'].value_counts().loc[lambda counts: counts > 0].reset_index()
                                 viz_status_counts.columns = ['Status of para', 'Count']
                                 viz_fig_status_dist = px.bar(viz_status_counts, x='Status of para', y='Count', text_auto=True, title="Distribution of Para Statuses", labels={'Status of para': '<b>Status</b>', 'Count': 'Number of Paras'})
                                 viz_fig_status_dist.update_layout(xaxis_title_font_size=14, yaxis_title_font_size=14, xaxis_tickfont_size=12, yaxis_tickfont_size=12, xaxis_type='category')
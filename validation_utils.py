@@ -1,4 +1,5 @@
 # validation_utils.py
+import numpy as np
 import pandas as pd
 
 MANDATORY_FIELDS_FOR_SHEET = {
@@ -22,64 +23,266 @@ VALID_PARA_STATUSES = [
     'Not agreed'
 ]
 
+PARA_FIELD_KEYS = ["audit_para_number", "audit_para_heading", "revenue_involved_lakhs_rs", "revenue_recovered_lakhs_rs", "status_of_para"]
+HEADER_ONLY_HEADING_PREFIX = "N/A - Header Info Only"
+
+
+def _column(df, key):
+    # Mirrors row.get(key): a missing column behaves like a column of None
+    return df[key] if key in df.columns else pd.Series(None, index=df.index, dtype=object)
+
+
+def _str_mask(series, method, *args):
+    """Boolean mask of `series.str.<method>(*args)`; cells that are not strings give False."""
+    if not (series.dtype == object or pd.api.types.is_string_dtype(series.dtype)):
+        return pd.Series(False, index=series.index)
+    try:
+        result = getattr(series.str, method)(*args)
+    except AttributeError: # .str refuses object columns that hold no strings at all
+        return pd.Series(False, index=series.index)
+    return result.fillna(False).astype(bool)
+
+
+def _blank_mask(series):
+    # Same as `not str(value).strip()` for non-null values (only strings can be blank)
+    if not (series.dtype == object or pd.api.types.is_string_dtype(series.dtype)):
+        return pd.Series(False, index=series.index)
+    try:
+        stripped = series.str.strip()
+    except AttributeError:
+        return pd.Series(False, index=series.index)
+    return stripped.eq("").fillna(False).astype(bool)
+
+
+def _invalid_choice_mask(series, valid_values):
+    # pd.notna(v) and str(v).strip() and str(v) not in valid_values
+    present = series.notna() & ~_blank_mask(series)
+    as_text = series[present].astype(str)
+    return present & ~as_text.isin(valid_values).reindex(series.index, fill_value=True)
+
+
+def _header_only_mask(df):
+    # Header-only rows (no paras extracted) are exempt from the para-level checks. A heading that is
+    # not a string never marks a header-only row (the old row loop raised AttributeError on it).
+    if "audit_para_heading" not in df.columns:
+        return pd.Series(False, index=df.index)
+    return _str_mask(df["audit_para_heading"], "startswith", HEADER_ONLY_HEADING_PREFIX) & _column(df, "audit_para_number").isna()
+
+
+def _para_display(value):
+    # The incremental validator checks rows as float64 whatever the batch; the submit path's pd.to_numeric
+    # usually gives int64 para numbers, so integral ones are shown as ints again ("Para: 1", not "1.0")
+    if isinstance(value, (float, np.floating)) and np.isfinite(value) and float(value).is_integer():
+        return int(value)
+    return value
+
+
+def row_validation_errors(data_df_to_validate):
+    """
+    The per-row checks of validate_data_for_sheet (mandatory fields, category, para status),
+    computed column-wise with boolean masks.
+
+    Returns:
+        list: (index_label, para_display, message) triples, in no particular order. The full error
+        text is f"Row {index_label + 1} (Para: {para_display}): {message}".
+    """
+    df = data_df_to_validate
+    header_only = _header_only_mask(df)
+    issues = [] # (row position, template) where template is formatted with the row's display values below
+
+    for field_key, field_name in MANDATORY_FIELDS_FOR_SHEET.items():
+        missing = _column(df, field_key)
+        missing = missing.isna() | _blank_mask(missing)
+        if field_key in PARA_FIELD_KEYS:
+            missing &= ~header_only
+        issues.extend((pos, f"'{field_name}' is missing or empty.") for pos in np.flatnonzero(missing.to_numpy()))
+
+    invalid_category = _invalid_choice_mask(_column(df, "category"), VALID_CATEGORIES)
+    issues.extend((pos, "category") for pos in np.flatnonzero(invalid_category.to_numpy()))
+
+    status = _column(df, "status_of_para")
+    invalid_status = _invalid_choice_mask(status, VALID_PARA_STATUSES) & ~header_only
+    issues.extend((pos, "status") for pos in np.flatnonzero(invalid_status.to_numpy()))
+    if "status_of_para" in MANDATORY_FIELDS_FOR_SHEET:
+        missing_status = (status.isna() | _blank_mask(status)) & ~header_only
+        issues.extend((pos, "'Status of para' is missing for a data para.") for pos in np.flatnonzero(missing_status.to_numpy()))
+
+    if not issues:
+        return []
+    # Messages show values as the old iterrows loop saw them, i.e. from the frame's interleaved array
+    positions = sorted({pos for pos, _ in issues})
+    display_rows = dict(zip(positions, df.take(positions).to_numpy()))
+    col_loc = {key: df.columns.get_loc(key) for key in ("audit_para_number", "category", "status_of_para") if key in df.columns}
+    string_rows = set() # Rows iterrows would infer as 'str' dtype, which turns their None values into NaN
+    if positions and display_rows[positions[0]].dtype == object:
+        string_rows = {pos for pos, values in display_rows.items() if pd.api.types.infer_dtype(values, skipna=True) == "string"}
+
+    def display_value(pos, key):
+        value = display_rows[pos][col_loc[key]] if key in col_loc else None
+        return np.nan if pos in string_rows and pd.isna(value) else value
+
+    index_labels = dict(zip(positions, df.index[positions]))
+    errors = []
+    for pos, template in issues:
+        para_display = display_value(pos, "audit_para_number") if "audit_para_number" in col_loc else "N/A"
+        if template == "category":
+            message = f"'Category' ('{display_value(pos, 'category')}') is invalid. Must be one of {VALID_CATEGORIES}."
+        elif template == "status":
+            message = f"'Status of para' ('{display_value(pos, 'status_of_para')}') is invalid. Must be one of {VALID_PARA_STATUSES}."
+        else:
+            message = template
+        errors.append((index_labels[pos], para_display, message))
+    return errors
+
+
+def _consistency_pair(trade_name, category):
+    # The (trade name, category) a row contributes to the consistency check, or None
+    def blank(value):
+        return value is None or (isinstance(value, str) and not value.strip()) or pd.isna(value)
+    if blank(trade_name) or blank(category) or category not in VALID_CATEGORIES:
+        return None
+    return trade_name, category
+
+
+def _consistency_message(trade_name, categories):
+    return f"Consistency Error: Trade Name '{trade_name}' has multiple categories: {', '.join(sorted(categories))}."
+
+
+def category_consistency_errors(data_df_to_validate):
+    """Cross-row check: every row of a trade name must carry the same (valid) category."""
+    df = data_df_to_validate
+    if 'trade_name' not in df.columns or 'category' not in df.columns:
+        return []
+    trade_name, category = df['trade_name'], df['category']
+    usable = (trade_name.notna() & ~_blank_mask(trade_name) & category.notna() & ~_blank_mask(category)
+              & category.isin(VALID_CATEGORIES))
+    pairs = pd.DataFrame({"trade_name": trade_name[usable], "category": category[usable]}).drop_duplicates()
+    counts = pairs["trade_name"].value_counts()
+    conflicting = pairs[pairs["trade_name"].isin(counts.index[counts > 1])]
+    trade_name_categories = {}
+    for tn, cat in zip(conflicting["trade_name"].tolist(), conflicting["category"].tolist()):
+        trade_name_categories.setdefault(tn, []).append(cat)
+    return [_consistency_message(tn, cats) for tn, cats in trade_name_categories.items()]
+
+
 def validate_data_for_sheet(data_df_to_validate):
-    validation_errors = []
     if data_df_to_validate.empty:
         return ["No data to validate."]
+    validation_errors = [f"Row {label + 1} (Para: {para_display}): {message}"
+                         for label, para_display, message in row_validation_errors(data_df_to_validate)]
+    validation_errors.extend(category_consistency_errors(data_df_to_validate))
+    return sorted(list(set(validation_errors)))
+
+class IncrementalValidator:
+    """
+    Keeps validate_data_for_sheet results for an st.data_editor up to date from the editor's edit
+    deltas (its `edited_rows` / `added_rows` / `deleted_rows` widget state) instead of revalidating
+    the whole table: only rows whose content changed are re-checked, and the per-trade-name category
+    consistency is kept in a count index.
+
+    Rows are numbered as the submit path sees them, i.e. after completely empty rows are dropped.
+    `fixed_values` (e.g. the group and circle numbers the submit path stamps on every row) and
+    `numeric_columns` (coerced with pd.to_numeric) are applied before checking a row.
+    """
+
+    def __init__(self, base_df, fixed_values=None, numeric_columns=()):
+        self.columns = list(base_df.columns)
+        self.fixed_values = dict(fixed_values or {})
+        self.numeric_columns = [c for c in numeric_columns if c in self.columns]
+        self._base_rows = base_df.reset_index(drop=True).to_dict("records")
+        self._edited = {} # base position -> {column: value}, as last applied
+        self._added = [] # added row dicts, as last applied
+        self._deleted = set()
+        self._row_issues = {} # row key -> [(para_display, message)]; keys are ("base", pos) / ("added", pos)
+        self._row_pairs = {} # row key -> (trade_name, category) contributing to the consistency index
+        self._category_counts = {} # trade_name -> {category: number of rows}
+        self.rows_revalidated = 0
+        base = base_df.reset_index(drop=True)
+        non_empty = ~base.isna().all(axis=1)
+        self._check_frame([("base", pos) for pos in np.flatnonzero(non_empty.to_numpy()).tolist()], base[non_empty].reset_index(drop=True))
+
+    def _row_values(self, key):
+        kind, pos = key
+        if kind == "base":
+            return {**self._base_rows[pos], **self._edited.get(pos, {})}
+        return {**{col: None for col in self.columns}, **self._added[pos]}
+
+    def _live_keys(self):
+        base_keys = [("base", pos) for pos in range(len(self._base_rows)) if pos not in self._deleted]
+        return base_keys + [("added", pos) for pos in range(len(self._added))]
+
+    def _set_pair(self, key, pair):
+        old_pair = self._row_pairs.pop(key, None)
+        if old_pair is not None:
+            counts = self._category_counts[old_pair[0]]
+            counts[old_pair[1]] -= 1
+            if not counts[old_pair[1]]: del counts[old_pair[1]]
+            if not counts: del self._category_counts[old_pair[0]]
+        if pair is not None:
+            self._row_pairs[key] = pair
+            counts = self._category_counts.setdefault(pair[0], {})
+            counts[pair[1]] = counts.get(pair[1], 0) + 1
+
+    def _forget(self, key):
+        self._row_issues.pop(key, None)
+        self._set_pair(key, None)
+
+    def _revalidate(self, keys):
+        rows, row_keys = [], []
+        for key in keys:
+            values = self._row_values(key)
+            if all(pd.isna(values.get(col)) for col in self.columns): # Dropped on submit, like dropna(how='all')
+                self._forget(key)
+                continue
+            rows.append(values)
+            row_keys.append(key)
+        if rows:
+            self._check_frame(row_keys, pd.DataFrame(rows, columns=self.columns))
+
+    def _check_frame(self, row_keys, df):
+        df = df.assign(**self.fixed_values)
+        for nc in self.numeric_columns: # float64 regardless of the batch; para numbers are shown as ints again in the messages
+            df[nc] = pd.to_numeric(df[nc], errors='coerce').astype('float64')
+        issues = {key: [] for key in row_keys}
+        for pos, para_display, message in row_validation_errors(df):
+            issues[row_keys[pos]].append((_para_display(para_display), message))
+        self._row_issues.update(issues)
+        trade_names = df["trade_name"].tolist() if "trade_name" in df.columns else [None] * len(df)
+        categories = df["category"].tolist() if "category" in df.columns else [None] * len(df)
+        for key, tn, cat in zip(row_keys, trade_names, categories):
+            self._set_pair(key, _consistency_pair(tn, cat))
+        self.rows_revalidated += len(row_keys)
+
+    def apply_editor_state(self, editor_state):
+        """Applies the data_editor widget state (the dict in st.session_state[editor_key]); returns the number of rows re-checked."""
+        editor_state = editor_state or {}
+        edited = {int(pos): dict(changes) for pos, changes in (editor_state.get("edited_rows") or {}).items()}
+        added = [dict(row) for row in editor_state.get("added_rows") or []]
+        deleted = {int(pos) for pos in editor_state.get("deleted_rows") or []}
+
+        changed = {("base", pos) for pos in set(edited) | set(self._edited) if edited.get(pos) != self._edited.get(pos)}
+        changed |= {("base", pos) for pos in self._deleted - deleted} # Undeleted rows
+        changed |= {("added", pos) for pos in range(len(added)) if pos >= len(self._added) or added[pos] != self._added[pos]}
+        removed = {("base", pos) for pos in deleted} | {("added", pos) for pos in range(len(added), len(self._added))}
+
+        self._edited, self._added, self._deleted = edited, added, deleted
+        for key in removed:
+            self._forget(key)
+        to_check = sorted(changed - removed)
+        self._revalidate(to_check)
+        return len(to_check)
+
+    def errors(self):
+        """Current error list, in the same form validate_data_for_sheet returns for the submitted rows."""
+        live_rows = [key for key in self._live_keys() if key in self._row_issues]
+        if not live_rows:
+            return ["No data to validate."]
+        validation_errors = [f"Row {row_number} (Para: {para_display}): {message}"
+                             for row_number, key in enumerate(live_rows, start=1) for para_display, message in self._row_issues[key]]
+        validation_errors.extend(_consistency_message(tn, counts) for tn, counts in self._category_counts.items() if len(counts) > 1)
+        return sorted(list(set(validation_errors)))
 
-    for index, row in data_df_to_validate.iterrows():
-        row_display_id = f"Row {index + 1} (Para: {row.get('audit_para_number', 'N/A')})"
-
-        # Check mandatory fields
-        for field_key, field_name in MANDATORY_FIELDS_FOR_SHEET.items():
-            value = row.get(field_key) # Use field_key which matches DataFrame columns from Pydantic model
-            is_missing = value is None or (isinstance(value, str) and not value.strip()) or pd.isna(value)
-
-            if is_missing:
-                # Special handling for para-specific fields if it's a header-only row
-                if field_key in ["audit_para_number", "audit_para_heading",
-                                 "revenue_involved_lakhs_rs", "revenue_recovered_lakhs_rs",
-                                 "status_of_para"] and \
-                   row.get('audit_para_heading', "").startswith("N/A - Header Info Only") and \
-                   pd.isna(row.get('audit_para_number')):
-                    continue # Skip validation for these fields in a header-only row
-                validation_errors.append(f"{row_display_id}: '{field_name}' is missing or empty.")
-
-        # Validate 'category'
-        category_val = row.get('category')
-        if pd.notna(category_val) and str(category_val).strip() and str(category_val) not in VALID_CATEGORIES:
-            validation_errors.append(
-                f"{row_display_id}: 'Category' ('{category_val}') is invalid. Must be one of {VALID_CATEGORIES}.")
-        # Mandatory check for category is covered by the loop above if 'category' is in MANDATORY_FIELDS_FOR_SHEET
-
-        # Validate 'status_of_para'
-        status_val = row.get('status_of_para')
-        # Allow status to be missing for header-only rows
-        is_header_only_row_for_status = row.get('audit_para_heading', "").startswith("N/A - Header Info Only") and pd.isna(row.get('audit_para_number'))
-
-        if not is_header_only_row_for_status: # Only validate status for actual para rows
-            if pd.notna(status_val) and str(status_val).strip() and str(status_val) not in VALID_PARA_STATUSES:
-                validation_errors.append(
-                    f"{row_display_id}: 'Status of para' ('{status_val}') is invalid. Must be one of {VALID_PARA_STATUSES}.")
-            elif (pd.isna(status_val) or not str(status_val).strip()) and "status_of_para" in MANDATORY_FIELDS_FOR_SHEET:
-                 validation_errors.append(f"{row_display_id}: 'Status of para' is missing for a data para.")
-
-
-    # Consistency check for 'category' per 'trade_name'
-    if 'trade_name' in data_df_to_validate.columns and 'category' in data_df_to_validate.columns:
-        trade_name_categories = {}
-        for index, row in data_df_to_validate.iterrows():
-            trade_name, category = row.get('trade_name'), row.get('category')
-            if pd.notna(trade_name) and str(trade_name).strip() and \
-               pd.notna(category) and str(category).strip() and category in VALID_CATEGORIES:
-                trade_name_categories.setdefault(trade_name, set()).add(category)
-
-        for tn, cats in trade_name_categories.items():
-            if len(cats) > 1:
-                validation_errors.append(
-                    f"Consistency Error: Trade Name '{tn}' has multiple categories: {', '.join(sorted(list(cats)))}.")
-
-    return sorted(list(set(validation_errors)))# # validation_utils.py
+# # validation_utils.py
 # import pandas as pd
 
 # MANDATORY_FIELDS_FOR_SHEET = {